@@ -0,0 +1,223 @@
+"""
+Audio Post - Trim, normalize and fit TTS lines to their segment slot in memory
+
+TTSService returns raw 16-bit mono PCM at 24 kHz with uneven loudness and silent
+padding around the speech; segments are nominally 8 s. AudioPostProcessor cleans a
+batch of lines with NumPy in one pass per line, without writing files or starting
+ffmpeg:
+
+- energy-based silence trimming: 20 ms frames below the clip's loudest frame minus
+  rel_db (or below floor_db) are dropped from both ends, keeping pad_ms of margin
+- loudness normalization: gain to target_db RMS over the voiced frames, limited so the
+  peak stays under peak_db
+- optional fit to a slot: a phase-vocoder time stretch of at most max_stretch towards
+  slot_sec, then trailing silence up to the slot (speech is never cut)
+- an all-silent line becomes one slot of silence rather than an empty clip
+
+Frame energies and gains for a whole batch are computed on one padded 2-D array.
+"""
+
+import io
+import wave
+from typing import List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Raw TTS output format (see generate_podcast.generate_audio_chunk)
+TTS_SAMPLE_RATE = 24000
+MODES = ("clean", "fit")
+
+
+def pcm_to_float(pcm: bytes) -> np.ndarray:
+    """16-bit little-endian PCM (raw, or a mono 16-bit WAV) to float32 in [-1, 1)"""
+    if pcm[:4] == b"RIFF":
+        with wave.open(io.BytesIO(pcm), "rb") as wf:
+            pcm = wf.readframes(wf.getnframes())
+    return np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def float_to_pcm(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768.0).astype("<i2").tobytes()
+
+
+def to_wav(pcm: bytes, sample_rate: int = TTS_SAMPLE_RATE) -> bytes:
+    """WAV file contents for raw mono PCM, built in memory"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _overlap_add(frames: np.ndarray, hop: int) -> np.ndarray:
+    """Sum frames placed hop apart; frames j, j+k, j+2k... (k = frame/hop) tile without overlap"""
+    count, size = frames.shape
+    k = size // hop
+    out = np.zeros((count + k - 1) * hop, dtype=np.float32)
+    for j in range(k):
+        flat = frames[j::k].reshape(-1)
+        out[j * hop:j * hop + flat.size] += flat
+    return out
+
+
+def time_stretch(samples: np.ndarray, ratio: float, n_fft: int = 1024, hop: int = 256) -> np.ndarray:
+    """
+    Phase-vocoder time stretch keeping the pitch; the output is ratio times as long.
+    Vectorized over frames: magnitudes are interpolated between analysis frames, the
+    phase is accumulated with a cumulative sum of the per-frame phase advance and the
+    bins around each spectral peak are locked to it.
+    """
+    if samples.size == 0 or abs(ratio - 1.0) < 1e-3:
+        return samples
+    window = np.hanning(n_fft + 1)[:n_fft].astype(np.float32)  # periodic Hann: constant overlap-add at 75%
+    padded = np.pad(samples, (n_fft // 2, n_fft))
+    spectrum = np.fft.rfft(sliding_window_view(padded, n_fft)[::hop] * window, axis=1)
+
+    steps = np.arange(0, spectrum.shape[0] - 1, 1.0 / ratio)
+    base = steps.astype(np.int64)
+    alpha = (steps - base)[:, None].astype(np.float32)
+    magnitude = (1 - alpha) * np.abs(spectrum[base]) + alpha * np.abs(spectrum[base + 1])
+
+    expected = 2 * np.pi * hop * np.arange(spectrum.shape[1]) / n_fft
+    advance = np.angle(spectrum[1:]) - np.angle(spectrum[:-1]) - expected
+    advance = expected + (advance + np.pi) % (2 * np.pi) - np.pi
+    phase = np.angle(spectrum[0]) + np.concatenate([np.zeros((1, spectrum.shape[1])),
+                                                     np.cumsum(advance[base[:-1]], axis=0)])
+
+    # Identity phase locking: bins around a magnitude peak keep their analysis phase offset
+    # to the peak, otherwise neighbouring bins drift apart and partially cancel
+    bins = np.arange(spectrum.shape[1])
+    padded_magnitude = np.pad(magnitude, ((0, 0), (1, 1)))
+    peaks = (magnitude >= padded_magnitude[:, :-2]) & (magnitude > padded_magnitude[:, 2:])
+    far = 2 * bins.size
+    left = np.maximum.accumulate(np.where(peaks, bins, -far), axis=1)
+    right = np.minimum.accumulate(np.where(peaks, bins, far)[:, ::-1], axis=1)[:, ::-1]
+    region = np.where(right - bins < bins - left, right, left)
+    region = np.where(np.abs(region - bins) < bins.size, region, bins)
+    analysis = np.angle(spectrum[np.rint(steps).astype(np.int64)])
+    phase = (np.take_along_axis(phase, region, axis=1) + analysis
+             - np.take_along_axis(analysis, region, axis=1))
+
+    frames = np.fft.irfft(magnitude * np.exp(1j * phase), n=n_fft, axis=1).astype(np.float32) * window
+    out = _overlap_add(frames, hop)
+    norm = _overlap_add(np.tile(window ** 2, (frames.shape[0], 1)), hop)
+    out = np.where(norm > 1e-3, out / np.maximum(norm, 1e-3), 0.0)
+    length = int(round(samples.size * ratio))
+    return out[n_fft // 2:n_fft // 2 + length].astype(np.float32)
+
+
+class AudioPostProcessor:
+    """Silence trimming, loudness normalization and slot fitting for batches of TTS PCM"""
+
+    def __init__(self, sample_rate: int = TTS_SAMPLE_RATE, trim: bool = True, normalize: bool = True,
+                 slot_sec: Optional[float] = None, floor_db: float = -50.0, rel_db: float = 35.0,
+                 pad_ms: int = 80, target_db: float = -20.0, peak_db: float = -1.0,
+                 max_gain_db: float = 20.0, max_stretch: float = 0.25, frame_ms: int = 20,
+                 batch_size: int = 32, silence_sec: Optional[float] = None):
+        """
+        Args:
+            sample_rate: Sample rate of the PCM (24 kHz for Gemini TTS)
+            trim: Drop leading and trailing silence
+            normalize: Apply a gain towards target_db RMS over the voiced frames
+            slot_sec: Fit each line to this length (None keeps the trimmed length)
+            floor_db: Frames below this RMS (dBFS) are always silence
+            rel_db: Frames this far below the loudest frame of the line are silence
+            pad_ms: Margin kept before the first and after the last voiced frame
+            target_db: Target RMS of the voiced frames in dBFS
+            peak_db: Ceiling for the sample peak after the gain
+            max_gain_db: Largest gain applied, so near-silent lines are not blown up
+            max_stretch: Largest relative tempo change when fitting (0.25 = 0.8x to 1.25x length)
+            frame_ms: Analysis frame length
+            batch_size: Lines analysed together (bounds the padded array)
+            silence_sec: Length of the silence an all-silent line becomes (default slot_sec,
+                else 8 s, one segment), so it never turns into an empty clip
+        """
+        self.sample_rate = sample_rate
+        self.trim = trim
+        self.normalize = normalize
+        self.slot_sec = slot_sec
+        self.floor_db = floor_db
+        self.rel_db = rel_db
+        self.pad_ms = pad_ms
+        self.target_db = target_db
+        self.peak_db = peak_db
+        self.max_gain_db = max_gain_db
+        self.max_stretch = max_stretch
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self.batch_size = batch_size
+        self.silence_sec = silence_sec or slot_sec or 8.0
+
+    @classmethod
+    def for_mode(cls, mode: str, slot_sec: float, **kwargs) -> "AudioPostProcessor":
+        """Processor for a solve() mode: clean trims and normalizes, fit also fits lines to slot_sec"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown audio post-processing mode '{mode}', expected one of {MODES}")
+        return cls(slot_sec=slot_sec if mode == "fit" else None, **kwargs)
+
+    def process(self, pcm: bytes) -> bytes:
+        return self.process_batch([pcm])[0]
+
+    def process_batch(self, clips: Sequence[bytes]) -> List[bytes]:
+        """Processed PCM for every clip, in order"""
+        results: List[bytes] = []
+        for start in range(0, len(clips), self.batch_size):
+            results.extend(self._process_chunk([pcm_to_float(pcm) for pcm in clips[start:start + self.batch_size]]))
+        return results
+
+    def _process_chunk(self, signals: List[np.ndarray]) -> List[bytes]:
+        frame = self.frame
+        counts = np.array([-(-s.size // frame) for s in signals])
+        batch = np.zeros((len(signals), max(1, counts.max(initial=0)) * frame), dtype=np.float32)
+        for row, signal in zip(batch, signals):
+            row[:signal.size] = signal
+
+        # Per-frame energy for the whole batch; padding frames never count as voiced
+        frames = batch.reshape(len(signals), -1, frame)
+        power = np.mean(frames * frames, axis=2)
+        energy_db = 10 * np.log10(np.maximum(power, 1e-12))
+        valid = np.arange(frames.shape[1])[None, :] < counts[:, None]
+        loudest = np.where(valid, energy_db, -np.inf).max(axis=1, initial=-np.inf)
+        voiced = valid & (energy_db > np.maximum(self.floor_db, loudest - self.rel_db)[:, None])
+        has_voice = voiced.any(axis=1)
+
+        first = np.where(has_voice, voiced.argmax(axis=1), 0)
+        last = np.where(has_voice, frames.shape[1] - 1 - voiced[:, ::-1].argmax(axis=1), -1)
+        pad = self.sample_rate * self.pad_ms // 1000
+        sizes = np.array([s.size for s in signals])
+        if self.trim:
+            begin = np.maximum(first * frame - pad, 0)
+            end = np.minimum((last + 1) * frame + pad, sizes)
+            end = np.where(has_voice, end, begin)  # all-silent lines are replaced below
+        else:
+            begin, end = np.zeros_like(sizes), sizes
+
+        gains = np.ones(len(signals), dtype=np.float32)
+        if self.normalize:
+            voiced_power = np.where(voiced, power, 0).sum(axis=1) / np.maximum(voiced.sum(axis=1), 1)
+            rms_db = 10 * np.log10(np.maximum(voiced_power, 1e-12))
+            peak_db = 20 * np.log10(np.maximum(np.abs(batch).max(axis=1), 1e-6))
+            gain_db = np.minimum(np.minimum(self.target_db - rms_db, self.peak_db - peak_db), self.max_gain_db)
+            gains = np.where(has_voice, 10 ** (gain_db / 20), 1.0).astype(np.float32)
+
+        silence = np.zeros(int(round(self.silence_sec * self.sample_rate)), dtype=np.float32)
+        results = []
+        for signal, b, e, gain, voice in zip(signals, begin, end, gains, has_voice):
+            if voice or (not self.trim and e > b):
+                results.append(float_to_pcm(self._fit(signal[b:e] * gain)))
+            else:
+                results.append(float_to_pcm(silence))
+        return results
+
+    def _fit(self, samples: np.ndarray) -> np.ndarray:
+        if not self.slot_sec or samples.size == 0:
+            return samples
+        slot = int(round(self.slot_sec * self.sample_rate))
+        ratio = min(max(slot / samples.size, 1 - self.max_stretch), 1 + self.max_stretch)
+        if abs(ratio - 1.0) > 0.01:
+            samples = time_stretch(samples, ratio)
+        if samples.size < slot:
+            samples = np.pad(samples, (0, slot - samples.size))
+        return samples
@@ -0,0 +1,324 @@
+"""
+Batch Runner - Runs many video/podcast jobs from a JSONL file on a worker pool
+
+Each input line is one job spec:
+    {"job_id": "ep01", "kind": "video", "script": "scripts/ep01.txt", "solution_number": 1, "total_duration": 240}
+    {"job_id": "pod01", "kind": "podcast", "script": "scripts/pod01.txt", "output": "podcasts/pod01.wav"}
+
+Jobs run concurrently; network-bound and CPU-bound stages are throttled by separate
+limits shared across all jobs. A failing job is recorded and never stops the batch.
+One status line per finished job is appended to the status file, and --resume skips
+jobs that already finished successfully.
+
+Each job runs in its own child process by default, so a job that crashes the
+interpreter (a native crash in an encoder binding, running out of memory) is reported
+as failed instead of taking the batch down, and a job still running KILL_GRACE_SEC
+after its deadline is killed. Each job process leads its own process group, so the
+kill also takes down the ffmpeg processes it started, and the network/cpu slots a
+killed or crashed job still held are returned to the batch. --in-process runs jobs as
+threads of this process.
+
+Usage:
+    python batch_runner.py jobs.jsonl --status jobs.status.jsonl --network 8 --cpu 2
+"""
+
+import os
+import json
+import time
+import signal
+import argparse
+import traceback
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, MutableMapping, Optional
+
+from contextlib import nullcontext
+
+from deadline import Deadline
+from stage_limits import StageLimits
+
+JOB_KINDS = ("video", "podcast")
+# Seconds a job process may run past its deadline (to unwind and clean up) before it is killed
+KILL_GRACE_SEC = 30.0
+
+
+def load_jobs(jobs_path: str) -> List[Dict[str, Any]]:
+    """Read job specs from a JSONL file, assigning job ids to lines that have none"""
+    jobs = []
+    with open(jobs_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            spec = json.loads(line)
+            spec.setdefault("job_id", f"job_{line_number:05d}")
+            spec.setdefault("kind", "video")
+            if spec["kind"] not in JOB_KINDS:
+                raise ValueError(f"Unknown job kind '{spec['kind']}' for job {spec['job_id']}")
+            jobs.append(spec)
+    return jobs
+
+
+def load_finished(status_path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest status per job id from a previous run"""
+    finished: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(status_path):
+        return finished
+    with open(status_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                status = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(status, dict) or "job_id" not in status:
+                continue  # not a status line of ours
+            finished[status["job_id"]] = status
+    return finished
+
+
+def run_job(spec: Dict[str, Any], limits: Optional[StageLimits] = None, output_dir: str = "outputs",
+            checkpoint: Optional[MutableMapping[str, Any]] = None, deadline_sec: Optional[float] = None,
+            deadline: Optional[Deadline] = None) -> str:
+    """
+    Run one job spec and return the path of its final output.
+
+    The spec's "deadline_sec" (or deadline_sec) bounds the whole job: service calls time
+    out and encoder subprocesses are killed once it passes, raising DeadlineExceeded.
+    A caller that needs to cancel the job itself (QueueWorker, when its lease is lost)
+    passes its own deadline instead, which then carries the time limit too.
+    """
+    owned = deadline is None
+    if owned:
+        seconds = spec.get("deadline_sec", deadline_sec)
+        deadline = Deadline(seconds) if seconds else None
+    try:
+        with deadline.activate() if deadline is not None else nullcontext():
+            return _run_job(spec, limits, output_dir, checkpoint, deadline)
+    finally:
+        if owned and deadline is not None:
+            deadline.close()
+
+
+def _run_job(spec: Dict[str, Any], limits: Optional[StageLimits], output_dir: str,
+             checkpoint: Optional[MutableMapping[str, Any]], deadline: Optional[Deadline]) -> str:
+    if spec["kind"] == "podcast":
+        from generate_podcast import generate_podcast
+
+        job_id = spec["job_id"]
+        output = spec.get("output") or os.path.join(output_dir, "podcasts", f"{job_id}.wav")
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        result = generate_podcast(
+            script_file=spec.get("script", "script.txt"),
+            output_file=output,
+            temp_dir=spec.get("temp_dir") or os.path.join(output_dir, "tmp", job_id),
+            limits=limits,
+            checkpoint=checkpoint,
+            deadline=deadline,
+            profile_memory=spec.get("profile_memory", False),
+        )
+        if not result:
+            raise ValueError(f"No dialogue generated for job {job_id}")
+        return result
+
+    import solution
+    from output_manager import OutputManager
+
+    output_mgr = OutputManager(spec.get("output_dir", output_dir))
+    return solution.solve(
+        output_mgr,
+        script_path=spec.get("script", "script.txt"),
+        total_duration=spec.get("total_duration", 240),
+        solution_number=spec.get("solution_number", 1),
+        solution_name=spec.get("solution_name", spec["job_id"]),
+        limits=limits,
+        checkpoint=checkpoint,
+        assembly=spec.get("assembly", "compose"),
+        overlap=spec.get("overlap", False),
+        render_cache=spec.get("render_cache", False),
+        frame_fit=spec.get("frame_fit"),
+        draft=spec.get("draft", False),
+        overlay=spec.get("overlay"),
+        reuse_audio=spec.get("reuse_audio"),
+        splice=spec.get("splice", False),
+        deadline=deadline,
+        profile_memory=spec.get("profile_memory", False),
+        farm_dir=spec.get("farm_dir"),
+        audio_post=spec.get("audio_post"),
+    )
+
+
+def _job_process(target, *args):
+    """Job process entry point: lead a new process group, then run target"""
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    target(*args)
+
+
+def _kill_group(process):
+    """SIGKILL the job process and everything in its process group"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        # No group yet (killed before setpgrp) or no process groups on this platform
+        if process.is_alive():
+            process.kill()
+
+
+def _run_isolated(spec: Dict[str, Any], limits: StageLimits, output_dir: str, deadline_sec: Optional[float], conn):
+    """Job process: run_job, then send the outcome and the job's service metrics to the parent"""
+    from services.metrics import METRICS
+
+    result: Dict[str, Any] = {}
+    try:
+        result["output"] = run_job(spec, limits, output_dir, deadline_sec=deadline_sec)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["metrics"] = METRICS.snapshot()
+    conn.send(result)
+    conn.close()
+
+
+class BatchRunner:
+    """Schedules job specs onto a thread pool and records per-job status"""
+
+    def __init__(self, status_path: str, network: int = 8, cpu: Optional[int] = None,
+                 workers: Optional[int] = None, output_dir: str = "outputs", deadline_sec: Optional[float] = None,
+                 isolate: bool = True):
+        """
+        Args:
+            isolate: Run every job in its own child process (see the module docstring);
+                False runs them as threads of this process
+        """
+        cpu = cpu or max(1, (os.cpu_count() or 2) // 2)
+        # spawn, not fork: the parent has running threads, and children start from a clean interpreter
+        self._context = multiprocessing.get_context("spawn") if isolate else None
+        self.isolate = isolate
+        self.limits = StageLimits(network=network, cpu=cpu, context=self._context)
+        # Enough jobs in flight to keep both the network and the encoders busy
+        self.workers = workers or network + cpu
+        self.status_path = status_path
+        self.output_dir = output_dir
+        self.deadline_sec = deadline_sec
+        self._status_lock = threading.Lock()
+
+    def _write_status(self, status: Dict[str, Any]):
+        with self._status_lock:
+            with open(self.status_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(status, ensure_ascii=False) + "\n")
+
+    def _run_in_process(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """run_job in a child process; returns {"output": ...} or {"error": ..., "traceback": ...}"""
+        from services.metrics import METRICS
+
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_job_process, daemon=True,
+                                        args=(_run_isolated, spec, self.limits, self.output_dir, self.deadline_sec, sender))
+        process.start()
+        sender.close()
+        seconds = spec.get("deadline_sec", self.deadline_sec)
+        timeout = seconds + KILL_GRACE_SEC if seconds else None
+        result = None
+        timed_out = False
+        try:
+            # Readable once the child reports, or at EOF when it died without reporting
+            if receiver.poll(timeout):
+                result = receiver.recv()
+            else:
+                timed_out = True
+        except EOFError:
+            pass
+        finally:
+            receiver.close()
+        if timed_out:
+            freed = self.limits.kill(process, kill=lambda: _kill_group(process))
+            if freed:
+                print(f"Reclaimed {freed} slots held by killed job {spec['job_id']}")
+            return {"error": f"DeadlineExceeded: job process killed {timeout:.0f}s after it started", "traceback": ""}
+        process.join()
+        if process.exitcode != 0:
+            # Crashed: take back its slots and stop any encoders it left running
+            self.limits.reclaim(process.pid)
+            _kill_group(process)
+        if result is None:
+            return {"error": f"RuntimeError: job process exited with code {process.exitcode} without a result",
+                    "traceback": ""}
+        METRICS.merge(result.pop("metrics"))
+        return result
+
+    def _run_one(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.time()
+        status: Dict[str, Any] = {"job_id": spec["job_id"], "kind": spec["kind"], "started": started}
+        if self.isolate:
+            status.update(self._run_in_process(spec))
+            status["status"] = "failed" if "error" in status else "done"
+        else:
+            try:
+                status["output"] = run_job(spec, self.limits, self.output_dir, deadline_sec=self.deadline_sec)
+                status["status"] = "done"
+            except Exception as e:
+                status["status"] = "failed"
+                status["error"] = f"{type(e).__name__}: {e}"
+                status["traceback"] = traceback.format_exc()
+        status["finished"] = time.time()
+        status["duration_sec"] = status["finished"] - started
+        self._write_status(status)
+        return status
+
+    def run(self, jobs: List[Dict[str, Any]], resume: bool = False) -> Dict[str, int]:
+        """Run all jobs and return counts by status"""
+        if resume:
+            finished = load_finished(self.status_path)
+            skipped = [j for j in jobs if finished.get(j["job_id"], {}).get("status") == "done"]
+            jobs = [j for j in jobs if finished.get(j["job_id"], {}).get("status") != "done"]
+            if skipped:
+                print(f"Skipping {len(skipped)} jobs already done")
+
+        counts = {"done": 0, "failed": 0}
+        print(f"Running {len(jobs)} jobs on {self.workers} workers "
+              f"(network={self.limits.network_limit}, cpu={self.limits.cpu_limit})")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._run_one, spec) for spec in jobs]
+            for future in as_completed(futures):
+                status = future.result()
+                counts[status["status"]] += 1
+                detail = status.get("output") or status.get("error")
+                print(f"[{counts['done'] + counts['failed']}/{len(jobs)}] {status['job_id']}: {status['status']} "
+                      f"({status['duration_sec']:.1f}s) {detail}")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run video/podcast jobs from a JSONL file")
+    parser.add_argument("jobs", help="JSONL file with one job spec per line")
+    parser.add_argument("--status", help="Status JSONL output (default: <jobs>.status.jsonl)")
+    parser.add_argument("--network", type=int, default=8, help="Concurrent network-bound calls")
+    parser.add_argument("--cpu", type=int, help="Concurrent encodes (default: half the cores)")
+    parser.add_argument("--workers", type=int, help="Concurrent jobs (default: network + cpu)")
+    parser.add_argument("--output-dir", default="outputs")
+    parser.add_argument("--deadline-sec", type=float, help="Per-job time limit (a job's own deadline_sec wins)")
+    parser.add_argument("--resume", action="store_true", help="Skip jobs already marked done in the status file")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run jobs as threads of this process instead of one child process per job")
+    parser.add_argument("--metrics-port", type=int, help="Serve service request metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", help="Write service request metrics to this Prometheus textfile")
+    args = parser.parse_args()
+
+    from services.metrics import export_metrics
+
+    status_path = args.status or f"{os.path.splitext(args.jobs)[0]}.status.jsonl"
+    runner = BatchRunner(status_path, network=args.network, cpu=args.cpu, workers=args.workers,
+                         output_dir=args.output_dir, deadline_sec=args.deadline_sec, isolate=not args.in_process)
+    stop_metrics = export_metrics(args.metrics_port, args.metrics_file)
+    try:
+        counts = runner.run(load_jobs(args.jobs), resume=args.resume)
+    finally:
+        stop_metrics()
+    print(f"Finished: {counts['done']} done, {counts['failed']} failed. Status written to {status_path}")
+    if counts["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Repeatable performance benchmarks; run each module with python -m benchmarks.<name>"""
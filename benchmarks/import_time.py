@@ -0,0 +1,120 @@
+"""
+Import-time regression benchmark
+
+Imports each entry-point module in a fresh interpreter with -X importtime, takes the
+median self-reported cumulative import time over several runs and compares it with
+a JSON baseline. Exits non-zero when a module regresses beyond the tolerance or
+exceeds the absolute budget.
+
+Usage:
+    python -m benchmarks.import_time                 # compare against the baseline
+    python -m benchmarks.import_time --update        # record a new baseline
+
+The committed baseline (benchmarks/import_time_baseline.json) is only rewritten with
+--update; a missing baseline is an error rather than a silent pass.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, Any, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "import_time_baseline.json")
+
+# Modules imported by short-lived workers and CLIs
+MODULES = [
+    "services",
+    "services.tts_service",
+    "output_manager",
+    "solution",
+    "generate_podcast",
+    "batch_runner",
+    "job_queue",
+]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str, runs: int = 7) -> Dict[str, Any]:
+    """Median cumulative import time of module in milliseconds over fresh interpreters"""
+    samples: List[float] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return {"error": error[-1] if error else f"exit code {proc.returncode}"}
+        for line in proc.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            # The top-level module is the unindented entry with its own name
+            if match and match.group(4) == module and match.group(3) == " ":
+                samples.append(int(match.group(2)) / 1000)
+    if not samples:
+        return {"error": "module not found in -X importtime output"}
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "runs": len(samples)}
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float, slack_ms: float, budget_ms: Optional[float]) -> List[str]:
+    """Regression messages for modules slower than baseline * (1 + tolerance) + slack_ms"""
+    problems = []
+    for module, result in results.items():
+        if "error" in result:
+            problems.append(f"{module}: import failed ({result['error']})")
+            continue
+        if budget_ms is not None and result["median_ms"] > budget_ms:
+            problems.append(f"{module}: {result['median_ms']:.1f} ms exceeds budget {budget_ms:.1f} ms")
+        previous = baseline.get(module, {}).get("median_ms")
+        if previous is not None and result["median_ms"] > previous * (1 + tolerance) + slack_ms:
+            problems.append(f"{module}: {result['median_ms']:.1f} ms vs baseline {previous:.1f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time regression benchmark")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Allowed absolute slowdown")
+    parser.add_argument("--budget-ms", type=float, help="Absolute ceiling for every module")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.runs) for module in args.modules}
+    for module, result in results.items():
+        if "error" in result:
+            print(f"{module:<24} ERROR {result['error']}")
+        else:
+            print(f"{module:<24} {result['median_ms']:8.1f} ms (min {result['min_ms']:.1f} ms)")
+
+    if args.update:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({m: r for m, r in results.items() if "error" not in r}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --update")
+        raise SystemExit(2)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline: Dict[str, Dict[str, Any]] = json.load(f)
+
+    problems = compare(results, baseline, args.tolerance, args.slack_ms, args.budget_ms)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("No import-time regressions")
+
+
+if __name__ == "__main__":
+    main()
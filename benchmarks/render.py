@@ -0,0 +1,311 @@
+"""
+Rendering regression benchmark
+
+Runs the local rendering side of solve() on fixed synthetic inputs (reference PNGs,
+PCM speech-length WAVs and a GIF overlay generated with a fixed seed), so encoder or
+compositor regressions show up without network noise. Each case runs in a fresh
+interpreter and reports wall time, CPU time (including ffmpeg children), peak RSS
+(process plus children) and output size; results are compared with a JSON baseline.
+
+Cases:
+    segment_still_cache      Step 3 through StillRenderCache (render_cache=True)
+    segment_moviepy          Step 3 with solution.render_still_segment (moviepy, the default path)
+    assembly_stream          Step 4 with the StreamingCompositor and the GIF overlay
+    assembly_moviepy         Step 4 with solution.compose_final (moviepy concatenate + overlay)
+
+Usage:
+    python -m benchmarks.render                              # 30 s, 240 s and 30 min, compare with the baseline
+    python -m benchmarks.render --durations 30 240 --update  # record a new baseline
+    python -m benchmarks.render --cases assembly_stream --durations 240
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import argparse
+import statistics
+import subprocess
+import threading
+from typing import Dict, Any, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "render_baseline.json")
+DEFAULT_WORK_DIR = os.path.join(REPO_ROOT, "outputs", "bench_render")
+
+CASES = ["segment_still_cache", "segment_moviepy", "assembly_stream", "assembly_moviepy"]
+DURATIONS = [30, 240, 1800]
+SEGMENT_SECONDS = 8
+SEED = 1234
+TTS_RATE = 24000
+METRICS = ("wall_sec", "cpu_sec", "peak_rss_mb")
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+# --- Synthetic inputs ---
+
+def make_inputs(work_dir: str, duration: int, size: str) -> Dict[str, Any]:
+    """Reference images, one WAV per segment and a GIF; generated once per work_dir"""
+    import numpy as np
+    from PIL import Image
+
+    width, height = (int(v) for v in size.split("x"))
+    inputs_dir = os.path.join(work_dir, f"inputs_{size}")
+    os.makedirs(inputs_dir, exist_ok=True)
+    rng = np.random.RandomState(SEED)
+
+    images = []
+    for k, color in enumerate([(218, 37, 29), (255, 205, 0), (40, 120, 90)]):
+        path = os.path.join(inputs_dir, f"reference_{k}.png")
+        images.append(path)
+        if os.path.exists(path):
+            continue
+        # Gradient plus noise, so the encoder has real detail to code
+        y = np.linspace(0.4, 1.0, height)[:, None, None]
+        x = np.linspace(0.7, 1.0, width)[None, :, None]
+        pixels = np.array(color, dtype=np.float32) * y * x + rng.normal(0, 12, (height, width, 3))
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path)
+
+    gif_path = os.path.join(inputs_dir, "overlay.gif")
+    if not os.path.exists(gif_path):
+        frames = []
+        yy, xx = np.mgrid[:120, :120]
+        for k in range(12):
+            disc = np.zeros((120, 120, 4), dtype=np.uint8)
+            disc[(yy - 60) ** 2 + (xx - 60 - 3 * k) ** 2 < 40 ** 2] = (218, 37, 29, 255)
+            frames.append(Image.fromarray(disc, "RGBA"))
+        frames[0].save(gif_path, save_all=True, append_images=frames[1:], duration=80, loop=0, disposal=2)
+
+    audio = []
+    for i in range(math.ceil(duration / SEGMENT_SECONDS)):
+        path = os.path.join(inputs_dir, f"audio_{i + 1}.wav")
+        audio.append(path)
+        if os.path.exists(path):
+            continue
+        # Speech-like length spread around the nominal 8 s slot
+        seconds = 6.5 + 2.5 * ((i * 7919) % 100) / 100
+        t = np.arange(int(seconds * TTS_RATE)) / TTS_RATE
+        signal = np.sin(2 * np.pi * (140 + 40 * np.sin(2 * np.pi * 0.5 * t)) * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+        signal += np.random.RandomState(SEED + i).normal(0, 0.05, t.size)
+        with wave.open(path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(TTS_RATE)
+            wf.writeframes((np.clip(signal, -1, 1) * 12000).astype(np.int16).tobytes())
+    return {"images": images, "audio": audio, "gif": gif_path, "width": width, "height": height}
+
+
+def _profiles(inputs: Dict[str, Any]):
+    from render_profile import RenderProfile
+
+    # Fixed settings (not render_profile.json), so the baseline only moves when the code does
+    size = {"width": inputs["width"], "height": inputs["height"]}
+    return RenderProfile(fps=24, **size), RenderProfile(fps=30, **size)
+
+
+def _segments(work_dir: str, duration: int, size: str, inputs: Dict[str, Any]) -> List[str]:
+    """Segment videos used as input by the assembly cases (built once, untimed)"""
+    from render_cache import StillRenderCache
+
+    segment_profile, _ = _profiles(inputs)
+    segment_dir = os.path.join(work_dir, f"segments_{size}_{duration}")
+    os.makedirs(segment_dir, exist_ok=True)
+    cache = StillRenderCache(os.path.join(work_dir, f"still_cache_{size}"), segment_profile)
+    paths = []
+    for i, audio_path in enumerate(inputs["audio"]):
+        path = os.path.join(segment_dir, f"video_{i + 1}.mp4")
+        if not os.path.exists(path):
+            cache.render_segment(inputs["images"][i % len(inputs["images"])], audio_path, f"{path}.tmp.mp4")
+            os.replace(f"{path}.tmp.mp4", path)
+        paths.append(path)
+    return paths
+
+
+# --- Cases (run inside the child process) ---
+
+def case_segment_still_cache(out_dir: str, inputs: Dict[str, Any], segments: List[str]) -> List[str]:
+    from render_cache import StillRenderCache
+
+    segment_profile, _ = _profiles(inputs)
+    cache = StillRenderCache(os.path.join(out_dir, "still_cache"), segment_profile)  # cold cache, as in a fresh run
+    outputs = []
+    for i, audio_path in enumerate(inputs["audio"]):
+        path = os.path.join(out_dir, f"video_{i + 1}.mp4")
+        cache.render_segment(inputs["images"][i % len(inputs["images"])], audio_path, path)
+        outputs.append(path)
+    return outputs
+
+
+def case_segment_moviepy(out_dir: str, inputs: Dict[str, Any], segments: List[str]) -> List[str]:
+    from solution import render_still_segment
+
+    segment_profile, _ = _profiles(inputs)
+    outputs = []
+    for i, audio_path in enumerate(inputs["audio"]):
+        path = os.path.join(out_dir, f"video_{i + 1}.mp4")
+        outputs.append(render_still_segment(i + 1, inputs["images"][i % len(inputs["images"])], audio_path, path,
+                                            segment_profile))
+    return outputs
+
+
+def case_assembly_stream(out_dir: str, inputs: Dict[str, Any], segments: List[str]) -> List[str]:
+    from compositor import GifOverlay, StreamingCompositor
+
+    _, final_profile = _profiles(inputs)
+    overlay = GifOverlay(inputs["gif"], height=int(final_profile.height * 0.15))
+    path = os.path.join(out_dir, "output_final.mp4")
+    StreamingCompositor(final_profile, overlay).compose(segments, path)
+    return [path]
+
+
+def case_assembly_moviepy(out_dir: str, inputs: Dict[str, Any], segments: List[str]) -> List[str]:
+    from solution import compose_final
+
+    _, final_profile = _profiles(inputs)
+    path = os.path.join(out_dir, "output_final.mp4")
+    return [compose_final(segments, path, final_profile, overlay="gif", gif_path=inputs["gif"])]
+
+
+def run_case(case: str, duration: int, work_dir: str, size: str) -> Dict[str, Any]:
+    """Run one case in this process and measure it"""
+    import shutil
+    from memory_profile import sample_rss
+
+    inputs = make_inputs(work_dir, duration, size)
+    segments = _segments(work_dir, duration, size, inputs) if case.startswith("assembly") else []
+    out_dir = os.path.join(work_dir, f"run_{case}_{duration}")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    peak = {"rss": 0}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.1):
+            rss, children = sample_rss()
+            if rss is not None:
+                peak["rss"] = max(peak["rss"], rss + (children or 0))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    cpu_start = os.times()
+    started = time.perf_counter()
+    try:
+        outputs = globals()[f"case_{case}"](out_dir, inputs, segments)
+    finally:
+        wall = time.perf_counter() - started
+        cpu_end = os.times()
+        stop.set()
+        sampler.join()
+    cpu = sum(cpu_end[k] - cpu_start[k] for k in range(4))  # user + system, own and waited children
+    output_bytes = sum(os.path.getsize(p) for p in outputs)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        "wall_sec": round(wall, 3),
+        "cpu_sec": round(cpu, 3),
+        "peak_rss_mb": round(peak["rss"] / (1024 * 1024), 1) if peak["rss"] else None,
+        "output_bytes": output_bytes,
+        "segments": len(inputs["audio"]),
+    }
+
+
+# --- Driver ---
+
+def measure(case: str, duration: int, work_dir: str, size: str, runs: int = 1) -> Dict[str, Any]:
+    """Median of runs fresh-interpreter measurements of one case"""
+    samples: List[Dict[str, Any]] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.render", "--run-case", case, "--durations", str(duration),
+             "--work-dir", work_dir, "--size", size],
+            cwd=REPO_ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return {"error": error[-1] if error else f"exit code {proc.returncode}"}
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    result = dict(samples[0])
+    for metric in METRICS:
+        values = [s[metric] for s in samples if s.get(metric) is not None]
+        result[metric] = statistics.median(values) if values else None
+    result["runs"] = len(samples)
+    return result
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float, size_tolerance: float) -> List[str]:
+    """Regression messages for cases slower, bigger or hungrier than the baseline allows"""
+    problems = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue  # new case, or one that cannot run here (e.g. moviepy not installed)
+        if "error" in result:
+            problems.append(f"{key}: failed ({result['error']})")
+            continue
+        for metric in METRICS:
+            now, before = result.get(metric), previous.get(metric)
+            if now is not None and before and now > before * (1 + tolerance):
+                problems.append(f"{key}: {metric} {now:g} vs baseline {before:g}")
+        now, before = result["output_bytes"], previous.get("output_bytes")
+        if before and abs(now - before) > before * size_tolerance:
+            problems.append(f"{key}: output size {now} bytes vs baseline {before} bytes")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendering regression benchmark on synthetic inputs")
+    parser.add_argument("--cases", nargs="*", default=CASES, choices=CASES)
+    parser.add_argument("--durations", nargs="*", type=int, default=DURATIONS, help="Video lengths in seconds")
+    parser.add_argument("--size", default="1920x1080", help="Output size (segments and final)")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Synthetic inputs are generated here once")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative increase of time and memory")
+    parser.add_argument("--size-tolerance", type=float, default=0.05, help="Allowed relative output size change")
+    parser.add_argument("--run-case", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.durations[0], args.work_dir, args.size)))
+        return
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for duration in args.durations:
+        for case in args.cases:
+            key = f"{case}@{duration}s"
+            results[key] = result = measure(case, duration, args.work_dir, args.size, args.runs)
+            if "error" in result:
+                print(f"{key:<32} ERROR {result['error']}")
+            else:
+                print(f"{key:<32} {result['wall_sec']:8.1f} s wall {result['cpu_sec']:8.1f} s cpu "
+                      f"{result['peak_rss_mb'] or 0:8.1f} MB peak {result['output_bytes'] / 1e6:8.1f} MB out")
+
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.update or not baseline:
+        # Keep entries for cases and durations that were not run this time
+        baseline.update({k: r for k, r in results.items() if "error" not in r})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline: {args.baseline}")
+        return
+
+    problems = compare(results, baseline, args.tolerance, args.size_tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("No rendering regressions")
+
+
+if __name__ == "__main__":
+    main()
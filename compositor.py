@@ -0,0 +1,279 @@
+"""
+Streaming Compositor - Bounded-memory final assembly
+
+Reads the segment videos strictly one at a time through an ffmpeg pipe, overlays the
+GIF on each frame and streams the frames into a single ffmpeg encoder. A bounded
+frame queue lets decoding of the next frames overlap with compositing and encoding of
+the current one. Memory and open handles stay constant regardless of the number or
+length of segments: one reader, one writer and at most lookahead_frames raw frames.
+
+Each segment's audio is decoded after its frames into one PCM WAV, padded or trimmed
+to the segment's exact frame count so audio and video never drift, then muxed with a
+stream copy of the encoded video.
+
+A segment may also be given as (path, first_frame, frame_count) to read only part of
+it, and start_time shifts the overlay clock, so a range of the final video can be
+re-rendered with the overlay in phase with the full render (see splice.py).
+"""
+
+import os
+import wave
+import queue
+import bisect
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from deadline import check_deadline, spawn_thread
+from ffmpeg_utils import open_ffmpeg, run_ffmpeg
+from render_profile import RenderProfile
+
+AUDIO_RATE = 44100
+AUDIO_CHANNELS = 2
+_END = object()
+
+# A whole segment, or (path, first_frame, frame_count) with frame_count None for "to the end"
+SegmentInput = Union[str, Tuple[str, int, Optional[int]]]
+
+
+def _read_exact(stream, buf: bytearray) -> bool:
+    """Fill buf from stream; False on a clean end of stream"""
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(buf):
+        n = stream.readinto(view[filled:])
+        if not n:
+            if filled:
+                raise RuntimeError("Truncated raw frame from ffmpeg reader")
+            return False
+        filled += n
+    return True
+
+
+class GifOverlay:
+    """GIF frames decoded once at overlay size and looped by absolute timestamp"""
+
+    def __init__(self, gif_path: str, height: int, position: Tuple[int, int] = (0, 0)):
+        from PIL import Image, ImageSequence
+
+        self.x, self.y = position
+        self._premultiplied: List[np.ndarray] = []
+        self._inverse_alpha: List[np.ndarray] = []
+        self._ends: List[float] = []
+        elapsed = 0.0
+        with Image.open(gif_path) as gif:
+            for frame in ImageSequence.Iterator(gif):
+                rgba = frame.convert("RGBA")
+                width = max(1, round(rgba.width * height / rgba.height))
+                rgba = np.asarray(rgba.resize((width, height), Image.LANCZOS), dtype=np.float32)
+                alpha = rgba[:, :, 3:] / 255.0
+                self._premultiplied.append(rgba[:, :, :3] * alpha)
+                self._inverse_alpha.append(1.0 - alpha)
+                elapsed += (frame.info.get("duration") or 100) / 1000
+                self._ends.append(elapsed)
+        if not self._ends:
+            raise ValueError(f"No frames in GIF overlay: {gif_path}")
+        self.period = elapsed
+
+    def frame_index(self, t: float) -> int:
+        return min(bisect.bisect_right(self._ends, t % self.period), len(self._ends) - 1)
+
+    def apply(self, frame: np.ndarray, t: float):
+        """Alpha-blend the overlay frame for time t into frame in place"""
+        i = self.frame_index(t)
+        premultiplied, inverse_alpha = self._premultiplied[i], self._inverse_alpha[i]
+        h = min(premultiplied.shape[0], frame.shape[0] - self.y)
+        w = min(premultiplied.shape[1], frame.shape[1] - self.x)
+        region = frame[self.y:self.y + h, self.x:self.x + w]
+        blended = region * inverse_alpha[:h, :w] + premultiplied[:h, :w]
+        region[:] = np.clip(blended + 0.5, 0, 255).astype(np.uint8)
+
+
+class BoxOverlay:
+    """Flat translucent box standing in for the GIF overlay in draft renders"""
+
+    def __init__(self, width: int, height: int, color: Tuple[int, int, int] = (218, 37, 29),
+                 opacity: float = 0.6, position: Tuple[int, int] = (0, 0)):
+        self.x, self.y = position
+        self.width = width
+        self.height = height
+        self.opacity = opacity
+        self._tint = np.array(color, dtype=np.float32) * opacity
+
+    def apply(self, frame: np.ndarray, t: float):
+        region = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        region[:] = np.clip(region * (1.0 - self.opacity) + self._tint + 0.5, 0, 255).astype(np.uint8)
+
+
+class StreamingCompositor:
+    """Concatenates segment videos with an optional overlay in constant memory"""
+
+    def __init__(self, profile: Optional[RenderProfile] = None, overlay: Optional[GifOverlay] = None,
+                 lookahead_frames: int = 8):
+        self.profile = profile or RenderProfile()
+        self.overlay = overlay
+        self.lookahead_frames = lookahead_frames
+        self.frame_bytes = self.profile.width * self.profile.height * 3
+        # (path, frame count) of each segment in the last compose() call
+        self.segment_frames: List[Tuple[str, int]] = []
+
+    def _video_filter(self) -> str:
+        w, h = self.profile.width, self.profile.height
+        return (f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+                f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={self.profile.fps},format=rgb24")
+
+    def _put(self, frames: queue.Queue, item, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _read_segment(self, path: str, frames: queue.Queue, stop: threading.Event,
+                      first_frame: int = 0, frame_count: Optional[int] = None) -> int:
+        video_filter = self._video_filter()
+        if first_frame or frame_count is not None:
+            trim = f"trim=start_frame={first_frame}"
+            if frame_count is not None:
+                trim += f":end_frame={first_frame + frame_count}"
+            video_filter += f",{trim},setpts=PTS-STARTPTS"
+        reader = open_ffmpeg(["-i", path, "-an", "-vf", video_filter, "-r", str(self.profile.fps),
+                              "-f", "rawvideo", "-"],
+                             stdout=subprocess.PIPE)
+        count = 0
+        try:
+            while not stop.is_set():
+                buf = bytearray(self.frame_bytes)
+                if not _read_exact(reader.stdout, buf):
+                    break
+                self._put(frames, buf, stop)
+                count += 1
+        finally:
+            reader.stdout.close()
+            if stop.is_set():
+                reader.kill()
+            reader.wait()
+        if reader.returncode != 0 and not stop.is_set():
+            raise RuntimeError(f"Could not decode segment {path}: {reader.stderr.read().decode(errors='replace')}")
+        reader.stderr.close()
+        return count
+
+    def _append_audio(self, path: str, duration: float, wav: wave.Wave_write, offset: float = 0.0):
+        """Append exactly duration seconds of the segment's audio, padding silent or short segments"""
+        needed = int(round(duration * AUDIO_RATE)) * AUDIO_CHANNELS * 2
+        seek = ["-ss", f"{offset:.6f}"] if offset else []
+        reader = open_ffmpeg([*seek, "-i", path, "-vn", "-map", "0:a:0?", "-f", "s16le",
+                              "-ac", str(AUDIO_CHANNELS), "-ar", str(AUDIO_RATE), "-"],
+                             stdout=subprocess.PIPE)
+        written = 0
+        try:
+            while written < needed:
+                chunk = reader.stdout.read(min(1 << 16, needed - written))
+                if not chunk:
+                    break
+                wav.writeframesraw(chunk)
+                written += len(chunk)
+        finally:
+            reader.stdout.close()
+            reader.kill()
+            reader.wait()
+            reader.stderr.close()
+        if written < needed:
+            wav.writeframesraw(b"\x00" * (needed - written))
+
+    def _open_wav(self, audio_path: str) -> wave.Wave_write:
+        wav = wave.open(audio_path, "wb")
+        wav.setnchannels(AUDIO_CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(AUDIO_RATE)
+        return wav
+
+    def _read_segments(self, segments: Iterable[SegmentInput], frames: queue.Queue, audio_path: Optional[str],
+                       stop: threading.Event):
+        try:
+            wav = self._open_wav(audio_path) if audio_path else None
+            try:
+                for segment in segments:
+                    if stop.is_set():
+                        return
+                    path, first_frame, frame_count = (segment, 0, None) if isinstance(segment, str) else segment
+                    count = self._read_segment(path, frames, stop, first_frame, frame_count)
+                    if wav is not None:
+                        self._append_audio(path, count / self.profile.fps, wav, first_frame / self.profile.fps)
+                    self.segment_frames.append((path, count))
+            finally:
+                if wav is not None:
+                    wav.close()
+            self._put(frames, _END, stop)
+        except BaseException as e:
+            self._put(frames, e, stop)
+
+    def write_audio(self, segment_frames: Iterable[Tuple[str, int]], audio_path: str) -> str:
+        """PCM WAV of each (path, frame count) segment's audio, cut to its frames, without decoding video"""
+        with self._open_wav(audio_path) as wav:
+            for path, count in segment_frames:
+                self._append_audio(path, count / self.profile.fps, wav)
+        return audio_path
+
+    def compose(self, segment_paths: Iterable[SegmentInput], output_path: str, start_time: float = 0.0,
+                audio: bool = True) -> str:
+        """
+        Concatenate segments in order into output_path.
+
+        segment_paths may be a lazy iterable; each path is only opened after the
+        previous segment has been fully read. start_time is the timestamp of the first
+        frame in the overlay's clock; with audio=False only the video stream is written.
+        """
+        p = self.profile
+        self.segment_frames = []
+        work_dir = tempfile.mkdtemp(prefix="compose_", dir=os.path.dirname(os.path.abspath(output_path)))
+        video_path = os.path.join(work_dir, "video.mp4")
+        audio_path = os.path.join(work_dir, "audio.wav") if audio else None
+        frames: queue.Queue = queue.Queue(maxsize=self.lookahead_frames)
+        stop = threading.Event()
+        writer = open_ffmpeg(["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", p.size, "-r", str(p.fps),
+                              "-i", "-", "-an", *p.video_args(), video_path], stdin=subprocess.PIPE)
+        reader = spawn_thread(self._read_segments, (segment_paths, frames, audio_path, stop))
+        reader.start()
+        # Overlay clock in whole frames, so a range rendered separately matches the full render exactly
+        first_frame = round(start_time * p.fps)
+        index = 0
+        try:
+            while True:
+                item = frames.get()
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                if self.overlay is not None:
+                    frame = np.frombuffer(item, dtype=np.uint8).reshape(p.height, p.width, 3)
+                    self.overlay.apply(frame, (first_frame + index) / p.fps)
+                writer.stdin.write(item)
+                index += 1
+            writer.stdin.close()
+            if writer.wait() != 0:
+                raise RuntimeError(f"Encoder failed: {writer.stderr.read().decode(errors='replace')}")
+            if index == 0:
+                raise ValueError("No frames were read from the segments")
+            reader.join()
+            if audio_path:
+                run_ffmpeg(["-i", video_path, "-i", audio_path, "-map", "0:v", "-map", "1:a",
+                            "-c:v", "copy", *p.audio_args(), "-movflags", "+faststart", output_path])
+            else:
+                os.replace(video_path, output_path)
+        except BaseException:
+            stop.set()
+            writer.kill()
+            check_deadline()  # a killed encoder means the job ran out of time
+            raise
+        finally:
+            writer.wait()
+            writer.stderr.close()
+            reader.join(timeout=5)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_path
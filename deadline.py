@@ -0,0 +1,166 @@
+"""
+Deadline - Per-job time limit with cooperative cancellation
+
+A Deadline is created per job (batch_runner/job_queue pass deadline_sec from the job
+spec) and handed to solve() / generate_podcast(). It reaches the work in two ways:
+
+- Service calls: ServiceConfig(deadline=...) caps every request's connect/read timeout
+  at the time remaining, each call checks the deadline before it starts, and call()
+  abandons a request that is still in flight when the job is cancelled.
+- Encoder subprocesses: activate() makes the deadline current for this thread (and for
+  threads started through spawn_thread); ffmpeg_utils registers every ffmpeg process
+  it starts (including moviepy's, see ffmpeg_utils.register_moviepy) with the current
+  deadline, and expiry or cancel() kills them at once.
+
+When the deadline passes, blocked calls fail with DeadlineExceeded, so the job
+unwinds and its worker slot is released instead of waiting on a stalled connection.
+"""
+
+import time
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The job ran past its deadline or was cancelled"""
+
+
+class Deadline:
+    """Absolute time limit for a job, plus the subprocesses to kill when it passes"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self._cancelled = threading.Event()
+        self._reason = ""
+        self._processes: "weakref.WeakSet" = weakref.WeakSet()
+        self._waiters: set = set()  # events of call()s blocked on a helper thread
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        if seconds is not None:
+            self._timer = threading.Timer(max(0.0, seconds), self.cancel, args=(f"deadline of {seconds:.0f}s exceeded",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a time limit"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def check(self):
+        """Raise DeadlineExceeded once the deadline has passed or the job was cancelled"""
+        if self.cancelled:
+            raise DeadlineExceeded(self._reason or "deadline exceeded")
+
+    def timeout(self, connect: float, read: float) -> Tuple[float, float]:
+        """(connect, read) timeouts for a request, capped at the time remaining"""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return connect, read
+        return min(connect, remaining), min(read, remaining)
+
+    def sleep(self, seconds: float):
+        """Sleep that wakes up early and raises when the job is cancelled"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        if self._cancelled.wait(seconds) or self.cancelled:
+            self.check()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancel the job: pending checks raise and registered subprocesses are killed"""
+        with self._lock:
+            if not self._reason:
+                self._reason = reason
+            self._cancelled.set()
+            processes = list(self._processes)
+            waiters = list(self._waiters)
+        for waiter in waiters:
+            waiter.set()
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    def register(self, process):
+        """Kill process when the deadline passes; killed immediately if it already has"""
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._cancelled.is_set()
+        if cancelled and process.poll() is None:
+            process.kill()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        fn(*args, **kwargs) on a helper thread; raises DeadlineExceeded as soon as the job
+        is cancelled, even while fn is blocked in a socket read. An abandoned call finishes
+        in the background, bounded by its own (deadline-capped) timeout.
+        """
+        self.check()
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        with self._lock:
+            self._waiters.add(done)
+            if self._cancelled.is_set():
+                done.set()
+        try:
+            spawn_thread(run).start()
+            done.wait()
+        finally:
+            with self._lock:
+                self._waiters.discard(done)
+        if "error" in outcome:
+            raise outcome["error"]
+        if "result" not in outcome:
+            self.check()
+        return outcome["result"]
+
+    def close(self):
+        """Stop the expiry timer once the job has finished"""
+        if self._timer is not None:
+            self._timer.cancel()
+
+    @contextmanager
+    def activate(self):
+        """Make this the current deadline for subprocesses started in this context"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed (no-op without one)"""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def spawn_thread(target: Callable, args: tuple = (), daemon: bool = True) -> threading.Thread:
+    """Thread that runs target with the caller's current deadline (not started)"""
+    context = contextvars.copy_context()
+    return threading.Thread(target=context.run, args=(target, *args), daemon=daemon)
@@ -0,0 +1,163 @@
+"""
+FFmpeg helpers shared by the rendering modules
+"""
+
+import os
+import json
+import subprocess
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from deadline import DeadlineExceeded, current_deadline
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_binary() -> str:
+    """ffmpeg executable: $FFMPEG_BINARY, the imageio-ffmpeg build moviepy uses, or ffmpeg on PATH"""
+    if os.getenv("FFMPEG_BINARY"):
+        return os.environ["FFMPEG_BINARY"]
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def ffprobe_binary() -> str:
+    return os.getenv("FFPROBE_BINARY") or "ffprobe"
+
+
+def ffmpeg_command(args: List[str]) -> List[str]:
+    return [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-nostdin", "-y", *args]
+
+
+def _start(command: List[str], **kwargs) -> subprocess.Popen:
+    """Popen registered with the current deadline, which kills it on expiry"""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+    process = subprocess.Popen(command, **kwargs)
+    if deadline is not None:
+        deadline.register(process)
+    return process
+
+
+class _DeadlineSubprocess:
+    """subprocess module as seen by moviepy: Popen goes through _start, the rest is unchanged"""
+
+    Popen = staticmethod(_start)
+
+    def __getattr__(self, name):
+        return getattr(subprocess, name)
+
+
+# moviepy modules that start ffmpeg with "import subprocess as sp; sp.Popen(...)"
+_MOVIEPY_MODULES = (
+    "moviepy.tools",
+    "moviepy.video.io.ffmpeg_reader",
+    "moviepy.video.io.ffmpeg_writer",
+    "moviepy.audio.io.readers",
+    "moviepy.audio.io.ffmpeg_audiowriter",
+)
+
+
+def register_moviepy():
+    """
+    Register the ffmpeg processes moviepy starts (write_videofile, clip readers) with the
+    current deadline like our own, so expiry or cancel() kills a running moviepy encode.
+    Without a current deadline moviepy behaves as before. Safe to call repeatedly.
+    """
+    import importlib
+
+    for name in _MOVIEPY_MODULES:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if getattr(module, "sp", None) is subprocess:
+            module.sp = _DeadlineSubprocess()
+
+
+def _run(command: List[str]) -> subprocess.CompletedProcess:
+    """subprocess.run equivalent (text output) that dies with the current deadline"""
+    process = _start(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        stdout, stderr = process.communicate()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    deadline = current_deadline()
+    if deadline is not None and deadline.cancelled:
+        raise DeadlineExceeded(f"{os.path.basename(command[0])} killed: deadline exceeded")
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def run_ffmpeg(args: List[str]) -> None:
+    """Run ffmpeg to completion, raising RuntimeError with its stderr on failure"""
+    result = _run(ffmpeg_command(args))
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.strip()}")
+
+
+def open_ffmpeg(args: List[str], stdin=None, stdout=None) -> subprocess.Popen:
+    """Start a streaming ffmpeg process (raw frames in or out through pipes)"""
+    return _start(ffmpeg_command(args), stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+
+
+def probe(path: str) -> Dict[str, Any]:
+    """ffprobe format and stream information"""
+    command = [ffprobe_binary(), "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path]
+    result = _run(command)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}")
+    return json.loads(result.stdout)
+
+
+def video_stream_info(path: str) -> Dict[str, Any]:
+    """ffprobe fields of the first video stream, with a hash of its extradata (the H.264 SPS/PPS)"""
+    command = [ffprobe_binary(), "-v", "quiet", "-print_format", "json", "-select_streams", "v:0",
+               "-show_streams", "-show_data_hash", "sha256", path]
+    result = _run(command)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}")
+    streams = json.loads(result.stdout).get("streams") or [{}]
+    return streams[0]
+
+
+def probe_duration(path: str) -> float:
+    return float(probe(path)["format"]["duration"])
+
+
+def has_audio(path: str, info: Optional[Dict[str, Any]] = None) -> bool:
+    info = info or probe(path)
+    return any(s.get("codec_type") == "audio" for s in info.get("streams", []))
+
+
+def write_concat_list(paths: List[str], list_path: str) -> str:
+    """Write an ffmpeg concat demuxer list file"""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def keyframe_times(path: str) -> List[float]:
+    """Presentation times of the video keyframes, read from packet flags without decoding"""
+    result = _run(ffmpeg_command(["-i", path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]))
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not read keyframes of {path}: {result.stderr.strip()}")
+    time_base = 1.0
+    times = []
+    for line in result.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            num, den = line.split(":", 1)[1].strip().split("/")
+            time_base = int(num) / int(den)
+        elif line and not line.startswith("#"):
+            fields = [f.strip() for f in line.split(",")]
+            # framecrc prints F=<flags> only when the flags are not exactly AV_PKT_FLAG_KEY
+            flags = next((int(f[2:], 16) for f in fields[6:] if f.startswith("F=")), 1)
+            if flags & 1:
+                times.append(int(fields[2]) * time_base)
+    return sorted(times)
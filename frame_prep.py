@@ -0,0 +1,105 @@
+"""
+Frame Preparation - Normalize reference images once before rendering
+
+Reference images come back from the image models in arbitrary sizes and modes. Every
+render path would otherwise rescale and convert them frame by frame. This module
+converts each image once to the exact output size (letterboxed or center-cropped) in
+RGB, plus a raw yuv420p BT.709 frame that ffmpeg can loop straight into the encoder
+with no per-frame scaling or colorspace conversion. Results are cached by content hash.
+"""
+
+import os
+import hashlib
+from typing import Optional, Tuple
+
+import numpy as np
+
+from render_profile import RenderProfile
+
+FIT_MODES = ("letterbox", "crop")
+
+# ffmpeg output flags describing the prepared frames
+BT709_ARGS = ["-colorspace", "bt709", "-color_primaries", "bt709", "-color_trc", "bt709", "-color_range", "tv"]
+
+
+class PreparedFrame:
+    """A reference image converted to the output size and pixel format"""
+
+    def __init__(self, source_path: str, png_path: str, yuv_path: Optional[str], width: int, height: int):
+        self.source_path = source_path
+        self.png_path = png_path
+        self.yuv_path = yuv_path
+        self.width = width
+        self.height = height
+
+    def ffmpeg_input_args(self, fps: int) -> list:
+        """Input arguments that loop the prepared frame forever"""
+        if self.yuv_path:
+            return ["-f", "rawvideo", "-pix_fmt", "yuv420p", "-video_size", f"{self.width}x{self.height}",
+                    "-framerate", str(fps), "-stream_loop", "-1", "-i", self.yuv_path]
+        return ["-loop", "1", "-framerate", str(fps), "-i", self.png_path]
+
+
+def _fit(image, size: Tuple[int, int], fit: str, background: Tuple[int, int, int]):
+    from PIL import Image
+
+    width, height = size
+    if fit == "crop":
+        scale = max(width / image.width, height / image.height)
+    else:
+        scale = min(width / image.width, height / image.height)
+    resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    canvas = Image.new("RGB", size, background)
+    canvas.paste(resized, ((width - resized.width) // 2, (height - resized.height) // 2))
+    return canvas
+
+
+def rgb_to_yuv420p(rgb: np.ndarray) -> bytes:
+    """BT.709 limited-range planar YUV 4:2:0 from an RGB uint8 array with even dimensions"""
+    rgb = rgb.astype(np.float32) / 255.0
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    cb = (b - y) / 1.8556
+    cr = (r - y) / 1.5748
+    h, w = y.shape
+    # 2x2 chroma average
+    cb = cb.reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    cr = cr.reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    planes = [16 + 219 * y, 128 + 224 * cb, 128 + 224 * cr]
+    return b"".join(np.clip(np.rint(p), 0, 255).astype(np.uint8).tobytes() for p in planes)
+
+
+def prepare_frame(image_path: str, profile: Optional[RenderProfile] = None, fit: str = "letterbox",
+                  cache_dir: str = "outputs/frame_cache",
+                  background: Tuple[int, int, int] = (0, 0, 0)) -> PreparedFrame:
+    """Convert image_path to the profile's exact size and pixel format, reusing cached results"""
+    from PIL import Image
+
+    if fit not in FIT_MODES:
+        raise ValueError(f"Unknown fit mode '{fit}', expected one of {FIT_MODES}")
+    profile = profile or RenderProfile()
+    size = (profile.width, profile.height)
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    key = hashlib.sha256(f"{digest}:{size}:{fit}:{background}".encode()).hexdigest()[:32]
+    os.makedirs(cache_dir, exist_ok=True)
+    png_path = os.path.join(cache_dir, f"frame_{key}.png")
+    # Raw YUV only when it is exactly what the encoder consumes
+    raw_ok = profile.pix_fmt == "yuv420p" and profile.width % 2 == 0 and profile.height % 2 == 0
+    yuv_path = os.path.join(cache_dir, f"frame_{key}.yuv") if raw_ok else None
+
+    if not os.path.exists(png_path) or (yuv_path and not os.path.exists(yuv_path)):
+        with Image.open(image_path) as img:
+            frame = _fit(img.convert("RGB"), size, fit, background)
+        tmp_png = f"{png_path}.{os.getpid()}.tmp"
+        frame.save(tmp_png, format="PNG")
+        if yuv_path:
+            tmp_yuv = f"{yuv_path}.{os.getpid()}.tmp"
+            with open(tmp_yuv, "wb") as f:
+                f.write(rgb_to_yuv420p(np.asarray(frame)))
+            os.replace(tmp_yuv, yuv_path)
+        os.replace(tmp_png, png_path)
+    else:
+        os.utime(png_path)
+
+    return PreparedFrame(image_path, png_path, yuv_path, profile.width, profile.height)
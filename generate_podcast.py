@@ -1,9 +1,12 @@
 import re
-import requests
 import base64
 import wave
 import os
+import json
 import shutil
+from contextlib import nullcontext
+
+from stage_limits import UNLIMITED
 
 # --- CONFIGURATION ---
 # PLEASE FILL IN YOUR API KEY AND THE VOICE NAMES FOR THE CHARacters
@@ -13,6 +16,7 @@ VOICES = {
     "bà Nhung": "gacrux"     # An emotional, elderly male voice
 }
 SCRIPT_FILE = "script.txt"
+REQUEST_TIMEOUT = (10, 300)  # (connect, read) seconds per TTS request
 OUTPUT_FILE = "podcast_output.wav" # Outputting as WAV first
 TEMP_DIR = "temp_audio_chunks"
 API_URL = "https://api.thucchien.ai/gemini/v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
@@ -44,8 +48,10 @@ def parse_script(file_path):
         
     return dialogues
 
-def generate_audio_chunk(text, voice_name, output_path):
+def generate_audio_chunk(text, voice_name, output_path, timeout=REQUEST_TIMEOUT):
     """Calls the TTS API and saves the audio chunk as a WAV file."""
+    import requests  # deferred: ~90 ms that parse-only and --help runs never need
+
     # Ensure the output directory exists right before writing.
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
@@ -66,7 +72,7 @@ def generate_audio_chunk(text, voice_name, output_path):
     }
     
     try:
-        response = requests.post(API_URL, headers=headers, json=json_data)
+        response = requests.post(API_URL, headers=headers, json=json_data, timeout=timeout)
         response.raise_for_status()
         
         response_json = response.json()
@@ -117,55 +123,108 @@ def combine_wav_files(input_files, output_path):
 
 # --- Main Script ---
 
-def main():
-    """Main function to generate the podcast audio."""
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-    os.makedirs(TEMP_DIR)
+def generate_podcast(script_file=SCRIPT_FILE, output_file=OUTPUT_FILE, temp_dir=TEMP_DIR, limits=None, checkpoint=None,
+                     deadline=None, profile_memory=False):
+    """Generates the podcast audio for one script. Returns the output path, or None if nothing was generated.
 
-    print(f"Parsing script from '{SCRIPT_FILE}'...")
-    dialogues = parse_script(SCRIPT_FILE)
+    With a checkpoint (e.g. JobQueue.checkpoint), chunks synthesized by an earlier attempt
+    are kept in temp_dir and reused instead of calling the TTS API again. With a deadline
+    (deadline.Deadline), request timeouts are capped at the time left and DeadlineExceeded
+    is raised once it has passed. With profile_memory, peak RSS and Python heap per stage
+    are written to <output>.memory.json.
+    """
+    if not profile_memory:
+        return _generate_podcast(script_file, output_file, temp_dir, limits, checkpoint, deadline,
+                                 stage=lambda name: nullcontext())
+
+    from memory_profile import MemoryProfiler, print_summary
+
+    profiler = MemoryProfiler().start()
+    try:
+        return _generate_podcast(script_file, output_file, temp_dir, limits, checkpoint, deadline,
+                                 stage=profiler.measure)
+    finally:
+        profiler.stop()
+        summary = profiler.summary()
+        memory_path = os.path.splitext(output_file)[0] + ".memory.json"
+        with open(memory_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print_summary(summary)
+        print(f"Memory profile saved to {memory_path}")
+
+
+def _generate_podcast(script_file, output_file, temp_dir, limits, checkpoint, deadline, stage):
+    limits = limits or UNLIMITED
+    if os.path.exists(temp_dir) and checkpoint is None:
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir, exist_ok=True)
+
+    print(f"Parsing script from '{script_file}'...")
+    dialogues = parse_script(script_file)
     
     if not dialogues:
         print("No dialogues were found. Please check the script file format and path.")
-        return
+        return None
 
     print(f"Found {len(dialogues)} lines of dialogue.")
     
     audio_files = []
     # Add initial silence
-    silence_path = os.path.join(TEMP_DIR, "silence_start.wav")
+    silence_path = os.path.join(temp_dir, "silence_start.wav")
     with wave.open(silence_path, 'wb') as wf:
         wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(24000)
         wf.writeframes(b'\x00' * 24000) # 0.5s silence
     audio_files.append(silence_path)
 
-    for i, dialogue in enumerate(dialogues):
-        speaker = dialogue['speaker']
-        text = dialogue['text']
-        voice_name = VOICES.get(speaker)
+    with stage("tts"):
+        for i, dialogue in enumerate(dialogues):
+            speaker = dialogue['speaker']
+            text = dialogue['text']
+            voice_name = VOICES.get(speaker)
         
-        if not voice_name:
-            print(f"Warning: No voice configured for speaker '{speaker}'. Skipping this line.")
-            continue
+            if not voice_name:
+                print(f"Warning: No voice configured for speaker '{speaker}'. Skipping this line.")
+                continue
             
-        print(f"[{i+1}/{len(dialogues)}] Generating audio for '{speaker}': '{text[:60]}...'")
+            print(f"[{i+1}/{len(dialogues)}] Generating audio for '{speaker}': '{text[:60]}...'")
         
-        chunk_path = os.path.join(TEMP_DIR, f"chunk_{i}.wav")
-        if generate_audio_chunk(text, voice_name, chunk_path):
-            audio_files.append(chunk_path)
-            # Add a short pause after each line
-            silence_path = os.path.join(TEMP_DIR, f"silence_{i}.wav")
-            with wave.open(silence_path, 'wb') as wf:
-                wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(24000)
-                wf.writeframes(b'\x00' * 36000) # 0.75s silence
-            audio_files.append(silence_path)
-
-    print(f"\nCombining {len(audio_files)} audio chunks into '{OUTPUT_FILE}'...")
-    combine_wav_files(audio_files, OUTPUT_FILE)
+            chunk_path = os.path.join(temp_dir, f"chunk_{i}.wav")
+            if checkpoint is not None and checkpoint.get(f"tts_chunk:{i}") == chunk_path and os.path.exists(chunk_path):
+                generated = True
+            else:
+                timeout = deadline.timeout(*REQUEST_TIMEOUT) if deadline is not None else REQUEST_TIMEOUT
+                with limits.network():
+                    if deadline is not None:
+                        # Returns at the deadline even while the request is still in flight
+                        generated = deadline.call(generate_audio_chunk, text, voice_name, chunk_path, timeout=timeout)
+                    else:
+                        generated = generate_audio_chunk(text, voice_name, chunk_path, timeout=timeout)
+                if generated and checkpoint is not None:
+                    checkpoint[f"tts_chunk:{i}"] = chunk_path
+            if generated:
+                audio_files.append(chunk_path)
+                # Add a short pause after each line
+                silence_path = os.path.join(temp_dir, f"silence_{i}.wav")
+                with wave.open(silence_path, 'wb') as wf:
+                    wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(24000)
+                    wf.writeframes(b'\x00' * 36000) # 0.75s silence
+                audio_files.append(silence_path)
+
+    if deadline is not None:
+        deadline.check()  # a chunk that timed out at the deadline must not yield a partial podcast
+    print(f"\nCombining {len(audio_files)} audio chunks into '{output_file}'...")
+    with stage("combine"), limits.cpu():
+        combine_wav_files(audio_files, output_file)
     
     print("Cleaning up temporary files...")
-    shutil.rmtree(TEMP_DIR)
+    shutil.rmtree(temp_dir)
+    return output_file
+
+
+def main():
+    """Main function to generate the podcast audio."""
+    if not generate_podcast():
+        return
 
     print("Done!")
     print(f"Your podcast audio has been saved as {os.path.abspath(OUTPUT_FILE)}")
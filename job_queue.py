@@ -0,0 +1,360 @@
+"""
+Job Queue - Durable SQLite job queue with leases, heartbeats and per-job checkpoints
+
+Workers lease a job for a visibility timeout and keep extending the lease with
+heartbeats while it runs. If a worker is killed, its lease expires and another worker
+picks the job up again, up to max_attempts. Paid results (reference images, TTS chunks,
+Veo operation names) are written to the job's checkpoint as soon as they exist, so the
+retry resumes where the previous attempt stopped instead of paying for them again.
+
+A worker whose lease was taken over (its heartbeats stalled long enough for the lease
+to expire) cancels the job's deadline: running encodes are killed, the next service
+call or checkpoint write fails, and the job is neither completed nor failed by it.
+
+Usage:
+    python job_queue.py enqueue jobs.jsonl
+    python job_queue.py work --threads 4 --network 8 --cpu 2
+    python job_queue.py status
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+import traceback
+from typing import Dict, Any, Iterator, List, MutableMapping, Optional
+
+from deadline import Deadline, DeadlineExceeded
+from stage_limits import StageLimits
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class LeaseLost(DeadlineExceeded):
+    """Another worker took over the job's lease; this worker must stop working on it"""
+
+
+class JobQueue:
+    """SQLite-backed queue; safe to share between threads and processes on one host"""
+
+    def __init__(self, db_path: str = "outputs/queue.sqlite", visibility_timeout: float = 300.0):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                spec TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, lease_expires);
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (job_id, key)
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the single writer"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, spec: Dict[str, Any], max_attempts: int = 3) -> bool:
+        """Add a job; enqueuing an existing job_id is a no-op so input files can be re-submitted"""
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO jobs (job_id, spec, state, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (spec["job_id"], json.dumps(spec, ensure_ascii=False), QUEUED, max_attempts, now, now),
+        )
+        return cur.rowcount == 1
+
+    def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Claim the oldest runnable job (queued, or leased with an expired lease)"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute("""
+                    SELECT job_id, spec, attempts, max_attempts FROM jobs
+                    WHERE state = ? OR (state = ? AND lease_expires < ?)
+                    ORDER BY created LIMIT 1
+                """, (QUEUED, LEASED, now)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                job_id, spec, attempts, max_attempts = row
+                if attempts >= max_attempts:
+                    # Last attempt's worker died without reporting back
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, lease_owner = NULL, error = COALESCE(error, 'lease expired'), updated = ? WHERE job_id = ?",
+                        (DEAD, now, job_id),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated = ? WHERE job_id = ?",
+                    (LEASED, worker_id, now + self.visibility_timeout, now, job_id),
+                )
+                conn.execute("COMMIT")
+                job = json.loads(spec)
+                job["_attempt"] = attempts + 1
+                return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend a lease; returns False if the lease was lost to another worker"""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE job_id = ? AND state = ? AND lease_owner = ?",
+            (now + self.visibility_timeout, now, job_id, LEASED, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET state = ?, result = ?, error = NULL, lease_owner = NULL, updated = ? WHERE job_id = ? AND lease_owner = ?",
+            (DONE, json.dumps(result, ensure_ascii=False), now, job_id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> str:
+        """Release a failed job for retry, or mark it dead once attempts are used up"""
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND lease_owner = ?",
+                           (job_id, worker_id)).fetchone()
+        if row is None:
+            return LEASED  # lease already taken over by another worker
+        state = DEAD if row[0] >= row[1] else QUEUED
+        conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? WHERE job_id = ? AND lease_owner = ?",
+            (state, error, now, job_id, worker_id),
+        )
+        return state
+
+    def requeue_dead(self) -> int:
+        """Give dead jobs a fresh set of attempts"""
+        cur = self._conn().execute("UPDATE jobs SET state = ?, attempts = 0, updated = ? WHERE state = ?",
+                                   (QUEUED, time.time(), DEAD))
+        return cur.rowcount
+
+    def checkpoint(self, job_id: str, worker_id: Optional[str] = None,
+                   deadline: Optional[Deadline] = None) -> "JobCheckpoint":
+        return JobCheckpoint(self, job_id, worker_id, deadline)
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT job_id, state, attempts, max_attempts, lease_owner, result, error, updated FROM jobs"
+        params: List[Any] = []
+        if state:
+            query += " WHERE state = ?"
+            params.append(state)
+        keys = ["job_id", "state", "attempts", "max_attempts", "lease_owner", "result", "error", "updated"]
+        return [dict(zip(keys, row)) for row in self._conn().execute(query + " ORDER BY created", params)]
+
+
+class JobCheckpoint(MutableMapping[str, Any]):
+    """
+    Durable key/value store for one job; every write is committed immediately.
+
+    With a worker_id, writes only succeed while that worker holds the job's lease: a
+    worker whose lease was taken over gets LeaseLost (and its deadline is cancelled)
+    instead of overwriting the new owner's checkpoints.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: str, worker_id: Optional[str] = None,
+                 deadline: Optional[Deadline] = None):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.deadline = deadline
+
+    def __getitem__(self, key: str) -> Any:
+        row = self.queue._conn().execute("SELECT value FROM checkpoints WHERE job_id = ? AND key = ?",
+                                         (self.job_id, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key: str, value: Any):
+        if self.deadline is not None:
+            self.deadline.check()
+        row = (self.job_id, key, json.dumps(value, ensure_ascii=False), time.time())
+        if self.worker_id is None:
+            self.queue._conn().execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, key, value, updated) VALUES (?, ?, ?, ?)", row)
+            return
+        cur = self.queue._conn().execute("""
+            INSERT OR REPLACE INTO checkpoints (job_id, key, value, updated)
+            SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE job_id = ? AND state = ? AND lease_owner = ?)
+        """, (*row, self.job_id, LEASED, self.worker_id))
+        if cur.rowcount == 0:
+            reason = f"lease on {self.job_id} lost to another worker"
+            if self.deadline is not None:
+                self.deadline.cancel(reason)
+            raise LeaseLost(reason)
+
+    def __delitem__(self, key: str):
+        cur = self.queue._conn().execute("DELETE FROM checkpoints WHERE job_id = ? AND key = ?", (self.job_id, key))
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.queue._conn().execute("SELECT key FROM checkpoints WHERE job_id = ?", (self.job_id,)).fetchall()
+        return iter([r[0] for r in rows])
+
+    def __len__(self) -> int:
+        return self.queue._conn().execute("SELECT COUNT(*) FROM checkpoints WHERE job_id = ?",
+                                          (self.job_id,)).fetchone()[0]
+
+
+class QueueWorker:
+    """Leases jobs and runs them through batch_runner.run_job until the queue is empty"""
+
+    def __init__(self, queue: JobQueue, limits: Optional[StageLimits] = None, output_dir: str = "outputs",
+                 worker_id: Optional[str] = None, poll_interval: float = 5.0, deadline_sec: Optional[float] = None):
+        self.queue = queue
+        self.limits = limits
+        self.output_dir = output_dir
+        self.deadline_sec = deadline_sec
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+
+    def _heartbeat(self, job_id: str, stop: threading.Event, lost: threading.Event, deadline: Deadline):
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while not stop.wait(interval):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                print(f"[{self.worker_id}] Lost lease on {job_id}; cancelling it")
+                lost.set()
+                # Kills running encodes and fails the next service call or checkpoint write
+                deadline.cancel(f"lease on {job_id} lost to another worker")
+                return
+
+    def run_once(self) -> bool:
+        """Run one job; returns False when nothing was runnable"""
+        from batch_runner import run_job
+
+        job = self.queue.lease(self.worker_id)
+        if job is None:
+            return False
+        job_id = job["job_id"]
+        print(f"[{self.worker_id}] Running {job_id} (attempt {job['_attempt']})")
+        # Carries the job's time limit and is cancelled when the lease is lost
+        deadline = Deadline(job.get("deadline_sec", self.deadline_sec) or None)
+        stop, lost = threading.Event(), threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job_id, stop, lost, deadline), daemon=True)
+        beat.start()
+        try:
+            output = run_job(job, self.limits, self.output_dir, deadline=deadline,
+                             checkpoint=self.queue.checkpoint(job_id, self.worker_id, deadline))
+            if lost.is_set():
+                print(f"[{self.worker_id}] {job_id} finished after its lease was lost; leaving it to the new owner")
+            else:
+                self.queue.complete(job_id, self.worker_id, {"output": output})
+                print(f"[{self.worker_id}] {job_id} done: {output}")
+        except Exception as e:
+            if lost.is_set() or isinstance(e, LeaseLost):
+                print(f"[{self.worker_id}] {job_id} abandoned: lease lost to another worker")
+            else:
+                state = self.queue.fail(job_id, self.worker_id, f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+                print(f"[{self.worker_id}] {job_id} failed ({state}): {e}")
+        finally:
+            stop.set()
+            beat.join()
+            deadline.close()
+        return True
+
+    def run(self, drain: bool = True):
+        """Process jobs; with drain=False keep polling for new jobs forever"""
+        while True:
+            if not self.run_once():
+                if drain:
+                    return
+                time.sleep(self.poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable job queue for video/podcast jobs")
+    parser.add_argument("--db", default="outputs/queue.sqlite")
+    parser.add_argument("--visibility-timeout", type=float, default=300.0)
+    sub = parser.add_subparsers(dest="command", required=True)
+    enqueue = sub.add_parser("enqueue", help="Add jobs from a JSONL file")
+    enqueue.add_argument("jobs")
+    enqueue.add_argument("--max-attempts", type=int, default=3)
+    work = sub.add_parser("work", help="Run a worker process")
+    work.add_argument("--threads", type=int, default=4, help="Jobs run concurrently by this process")
+    work.add_argument("--network", type=int, default=8)
+    work.add_argument("--cpu", type=int)
+    work.add_argument("--output-dir", default="outputs")
+    work.add_argument("--deadline-sec", type=float, help="Per-job time limit (a job's own deadline_sec wins)")
+    work.add_argument("--forever", action="store_true", help="Keep polling after the queue is empty")
+    work.add_argument("--metrics-port", type=int, help="Serve service request metrics on http://127.0.0.1:PORT/metrics")
+    work.add_argument("--metrics-file", help="Write service request metrics to this Prometheus textfile")
+    sub.add_parser("status", help="Show job counts and failures")
+    sub.add_parser("requeue-dead", help="Retry jobs that used up their attempts")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db, visibility_timeout=args.visibility_timeout)
+    if args.command == "enqueue":
+        from batch_runner import load_jobs
+
+        added = sum(queue.enqueue(spec, max_attempts=args.max_attempts) for spec in load_jobs(args.jobs))
+        print(f"Enqueued {added} new jobs")
+    elif args.command == "work":
+        from services.metrics import export_metrics
+
+        limits = StageLimits(network=args.network, cpu=args.cpu or max(1, (os.cpu_count() or 2) // 2))
+        threads = [
+            threading.Thread(target=QueueWorker(queue, limits, args.output_dir, deadline_sec=args.deadline_sec).run,
+                             args=(not args.forever,))
+            for _ in range(args.threads)
+        ]
+        stop_metrics = export_metrics(args.metrics_port, args.metrics_file)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            stop_metrics()
+    elif args.command == "status":
+        print(json.dumps(queue.stats(), indent=2))
+        for job in queue.jobs(DEAD):
+            error = (job["error"] or "").splitlines()
+            print(f"{job['job_id']}: {error[0] if error else 'no error recorded'}")
+    elif args.command == "requeue-dead":
+        print(f"Requeued {queue.requeue_dead()} jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Memory Profile - Per-stage memory watermarks for solve() and generate_podcast()
+
+Opt-in (profile_memory=True). A background thread samples the resident set size of
+this process and of all its descendants (ffmpeg encoders started by moviepy or
+ffmpeg_utils) every interval_sec, and tracemalloc tracks the Python heap. Each stage
+measured with MemoryProfiler.measure() reports:
+
+- peak RSS of the process, of its children and of both together
+- the Python heap peak (tracemalloc) during the stage
+- the top Python allocators still alive when the stage ends
+
+so it is visible whether the moviepy concat, the GIF composite or base64 decoding is
+what grows on long videos. Stages may nest and may run on several threads.
+
+RSS comes from psutil when it is installed, otherwise from /proc (Linux); without
+either only the Python heap figures are reported.
+"""
+
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:  # optional; /proc is enough on Linux workers
+    psutil = None
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/statm", "r") as f:
+        return int(f.read().split()[1]) * _PAGE_SIZE
+
+
+def _proc_descendants(pid: int) -> List[int]:
+    parents: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # "pid (comm) state ppid ..."; comm may contain spaces and parentheses
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(name))
+    found, pending = [], [pid]
+    while pending:
+        children = parents.get(pending.pop(), [])
+        found.extend(children)
+        pending.extend(children)
+    return found
+
+
+def sample_rss(pid: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+    """(own RSS, summed RSS of all descendants) in bytes; (None, None) if unavailable"""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        process = psutil.Process(pid)
+        children = 0
+        for child in process.children(recursive=True):
+            try:
+                children += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return process.memory_info().rss, children
+    if not os.path.exists(f"/proc/{pid}/statm"):
+        return None, None
+    children = 0
+    for child in _proc_descendants(pid):
+        try:
+            children += _proc_rss(child)
+        except (OSError, IndexError, ValueError):
+            continue  # exited between listing and reading
+    return _proc_rss(pid), children
+
+
+class _Watermark:
+    """Running peaks of one stage"""
+
+    def __init__(self, rss: Optional[int]):
+        self.rss_start = rss
+        self.rss = rss or 0
+        self.children = 0
+        self.total = 0
+        self.traced = 0
+
+    def update(self, rss: Optional[int], children: Optional[int]):
+        if rss is None:
+            return
+        self.rss = max(self.rss, rss)
+        self.children = max(self.children, children or 0)
+        self.total = max(self.total, rss + (children or 0))
+
+
+class MemoryProfiler:
+    """Samples RSS (with children) in the background and records per-stage peaks"""
+
+    def __init__(self, interval_sec: float = 0.1, top: int = 5, trace_frames: int = 1):
+        """
+        Args:
+            interval_sec: RSS sampling period; shorter catches briefer spikes
+            top: Number of top Python allocators recorded per stage
+            trace_frames: Stack depth tracemalloc keeps per allocation (1 = line only)
+        """
+        self.interval_sec = interval_sec
+        self.top = top
+        self.trace_frames = trace_frames
+        self.stages: List[Dict[str, Any]] = []
+        self._active: List[_Watermark] = []
+        self._overall = _Watermark(None)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_tracing = False
+
+    def start(self) -> "MemoryProfiler":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self) -> "MemoryProfiler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            self._sample()
+
+    def _sample(self) -> Optional[int]:
+        rss, children = sample_rss()
+        with self._lock:
+            for watermark in self._active + [self._overall]:
+                watermark.update(rss, children)
+        return rss
+
+    def _fold_traced_peak(self):
+        """Credit the heap peak since the last boundary to every open stage, then reset it"""
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            for watermark in self._active + [self._overall]:
+                watermark.traced = max(watermark.traced, peak)
+        tracemalloc.reset_peak()
+
+    def top_allocators(self) -> List[Dict[str, Any]]:
+        """Largest live Python allocations by source line"""
+        if not tracemalloc.is_tracing() or not self.top:
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        return [
+            {"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "size_mb": round(stat.size / MB, 2), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:self.top]
+        ]
+
+    @contextmanager
+    def measure(self, name: str):
+        """Measure one stage; yields the report dict, which is filled in when the stage ends"""
+        report: Dict[str, Any] = {"name": name}
+        self._fold_traced_peak()
+        watermark = _Watermark(self._sample())
+        with self._lock:
+            self._active.append(watermark)
+        try:
+            yield report
+        finally:
+            rss_end = self._sample()
+            self._fold_traced_peak()
+            with self._lock:
+                self._active.remove(watermark)
+            report.update(_to_mb(watermark))
+            report["rss_start_mb"] = _mb(watermark.rss_start)
+            report["rss_end_mb"] = _mb(rss_end)
+            report["top_allocators"] = self.top_allocators()
+            with self._lock:
+                self.stages.append(report)
+
+    def summary(self) -> Dict[str, Any]:
+        """Whole-run peaks plus every finished stage's report"""
+        self._sample()
+        self._fold_traced_peak()
+        with self._lock:
+            return {**_to_mb(self._overall), "interval_sec": self.interval_sec, "stages": list(self.stages)}
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return None if value is None else round(value / MB, 1)
+
+
+def _to_mb(watermark: _Watermark) -> Dict[str, Any]:
+    sampled = watermark.rss_start is not None or watermark.rss > 0
+    return {
+        "peak_rss_mb": _mb(watermark.rss) if sampled else None,
+        "peak_children_rss_mb": _mb(watermark.children) if sampled else None,
+        "peak_total_rss_mb": _mb(watermark.total) if sampled else None,
+        "peak_python_heap_mb": _mb(watermark.traced),
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"Memory: peak {summary['peak_total_rss_mb']} MB total RSS "
+          f"({summary['peak_children_rss_mb']} MB in child processes)")
+    for stage in summary["stages"]:
+        top = stage["top_allocators"][0]["where"] if stage["top_allocators"] else "-"
+        print(f"  {stage['name']}: peak {stage['peak_total_rss_mb']} MB total, "
+              f"{stage['peak_children_rss_mb']} MB children, "
+              f"{stage['peak_python_heap_mb']} MB Python heap (top: {top})")
@@ -4,17 +4,241 @@ Handles output management and verification only
 """
 
 import os
+import re
 import json
+import time
 import shutil
+import fnmatch
 import subprocess
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from run_journal import RunJournal
+
+# Files that are never evicted by a retention sweep (matched against paths relative to the sweep root)
+DEFAULT_KEEP_PATTERNS = [
+    "*/final/solution_*_final.*",
+    "*/final/metadata.json",
+    "*/output_final.mp4",
+    "*/segments.json",
+    "journal/*",
+    "*.sqlite*",
+]
+# Timestamped backups written by save_final_file
+BACKUP_PATTERN = re.compile(r"^solution_\d+_final_\d{8}_\d{6}\.\w+$")
+# Directories containing this file are pinned with everything below them
+PIN_MARKER = ".keep"
+# Splice manifest (splice.MANIFEST_NAME); the segment files it lists are never evicted
+MANIFEST_NAME = "segments.json"
+# job_queue databases; files named in the checkpoints of unfinished jobs are never evicted
+QUEUE_DB_SUFFIX = ".sqlite"
+
+
+class RetentionPolicy:
+    """Disk budget and age rules for output artifacts"""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_age_days: Optional[float] = None,
+                 keep_patterns: Optional[List[str]] = None, keep_backups: int = 3,
+                 stale_dirs: Optional[List[str]] = None, stale_after_hours: float = 6.0,
+                 dry_run: bool = False):
+        """
+        Args:
+            max_bytes: Byte budget for the sweep root; least recently used files are evicted above it
+            max_age_days: Unpinned files older than this are removed regardless of the budget
+            keep_patterns: Glob patterns (relative to the sweep root) that are never removed
+            keep_backups: Number of timestamped final backups kept per final/ folder
+            stale_dirs: Scratch folders (e.g. temp_audio_chunks) removed once untouched for stale_after_hours
+            stale_after_hours: Idle time after which a scratch folder counts as left over by a crashed run
+            dry_run: Report what would be removed without deleting anything
+        """
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.keep_patterns = list(DEFAULT_KEEP_PATTERNS if keep_patterns is None else keep_patterns)
+        self.keep_backups = keep_backups
+        self.stale_dirs = list(stale_dirs or [])
+        self.stale_after_hours = stale_after_hours
+        self.dry_run = dry_run
+        # One compiled regex instead of an fnmatch call per pattern per file
+        self._keep_re = re.compile("|".join(fnmatch.translate(p) for p in self.keep_patterns)) if self.keep_patterns else None
+
+    def is_kept(self, rel_path: str) -> bool:
+        return bool(self._keep_re and self._keep_re.match(rel_path))
+
+
+def _scan_files(root: str, pinned: bool = False):
+    """Yield (path, rel_path, size, last_used, pinned) for every file below root using a single stat per entry"""
+    stack = [(root, "", pinned)]
+    while stack:
+        dir_path, rel_dir, dir_pinned = stack.pop()
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            continue
+        if not dir_pinned and any(e.name == PIN_MARKER for e in entries):
+            dir_pinned = True
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel, dir_pinned))
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            yield entry.path, rel, st.st_size, max(st.st_atime, st.st_mtime), dir_pinned
+
+
+def _manifest_references(path: str) -> List[str]:
+    """Segment files a splice manifest still points to"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            segments = json.load(f).get("segments", [])
+    except (OSError, ValueError, AttributeError):
+        return []
+    return [s["video"] for s in segments if isinstance(s, dict) and isinstance(s.get("video"), str)]
+
+
+def _checkpoint_references(db_path: str) -> List[str]:
+    """String values checkpointed by jobs of a job_queue database that have not finished"""
+    import sqlite3
+    from job_queue import DONE
+
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            rows = conn.execute("SELECT c.value FROM checkpoints c JOIN jobs j ON j.job_id = c.job_id "
+                                "WHERE j.state != ?", (DONE,)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return []  # not a queue database
+    paths = []
+    for (value,) in rows:
+        try:
+            value = json.loads(value)
+        except ValueError:
+            continue
+        if isinstance(value, str):
+            paths.append(value)
+    return paths
+
+
+def sweep(base_dir: str, policy: RetentionPolicy, protected_paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Apply a retention policy to base_dir and its scratch folders, returning a report.
+
+    Besides the policy's keep patterns and pinned folders, files still referenced are
+    never removed: protected_paths (e.g. the running job's checkpoint values), segment
+    files listed in splice manifests below base_dir, and files checkpointed by
+    unfinished jobs in job_queue databases below base_dir. A scratch folder holding
+    any such file is left alone.
+    """
+    started = time.time()
+    report = {"scanned_files": 0, "total_bytes": 0, "pinned_bytes": 0, "removed_files": 0,
+              "freed_bytes": 0, "remaining_bytes": 0, "errors": 0, "dry_run": policy.dry_run}
+
+    def remove(path: str, size: int):
+        if not policy.dry_run:
+            try:
+                os.unlink(path)
+            except OSError:
+                report["errors"] += 1
+                return
+        report["removed_files"] += 1
+        report["freed_bytes"] += size
+
+    candidates = []  # (last_used, size, path)
+    backups: Dict[str, List[tuple]] = {}
+    references = list(protected_paths or [])
+    for path, rel, size, last_used, pinned in _scan_files(base_dir):
+        report["scanned_files"] += 1
+        report["total_bytes"] += size
+        name = os.path.basename(rel)
+        if name == MANIFEST_NAME:
+            references += _manifest_references(path)
+        elif name.endswith(QUEUE_DB_SUFFIX):
+            references += _checkpoint_references(path)
+        if pinned or policy.is_kept(rel):
+            report["pinned_bytes"] += size
+            continue
+        if BACKUP_PATTERN.match(name):
+            backups.setdefault(os.path.dirname(path), []).append((last_used, size, path))
+            continue
+        candidates.append((last_used, size, path))
+
+    protected: Set[str] = {os.path.realpath(p) for p in references if isinstance(p, str)}
+    report["protected_files"] = 0
+
+    def unprotected(entries: List[tuple]) -> List[tuple]:
+        kept = [e for e in entries if os.path.realpath(e[2]) not in protected]
+        for last_used, size, path in entries:
+            if os.path.realpath(path) in protected:
+                report["pinned_bytes"] += size
+                report["protected_files"] += 1
+        return kept
+
+    candidates = unprotected(candidates)
+
+    # Keep the newest backups per final/ folder; older copies are redundant
+    for entries in backups.values():
+        entries = unprotected(entries)
+        entries.sort(reverse=True)
+        for last_used, size, path in entries[:policy.keep_backups]:
+            report["pinned_bytes"] += size
+        for last_used, size, path in entries[policy.keep_backups:]:
+            remove(path, size)
+
+    # Scratch folders left behind by interrupted runs
+    stale_cutoff = started - policy.stale_after_hours * 3600
+    for stale_dir in policy.stale_dirs:
+        try:
+            if os.path.getmtime(stale_dir) > stale_cutoff:
+                continue
+        except OSError:
+            continue
+        files = list(_scan_files(stale_dir))
+        if any(os.path.realpath(path) in protected for path, *_ in files):
+            continue  # a live checkpoint still points into it
+        for path, rel, size, last_used, pinned in files:
+            report["scanned_files"] += 1
+            report["total_bytes"] += size
+            remove(path, size)
+        if not policy.dry_run:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+
+    # Age limit, then least recently used eviction down to the byte budget
+    candidates.sort()
+    if policy.max_age_days is not None:
+        age_cutoff = started - policy.max_age_days * 86400
+        expired = 0
+        while expired < len(candidates) and candidates[expired][0] < age_cutoff:
+            remove(candidates[expired][2], candidates[expired][1])
+            expired += 1
+        candidates = candidates[expired:]
+
+    if policy.max_bytes is not None:
+        used = report["total_bytes"] - report["freed_bytes"]
+        for last_used, size, path in candidates:
+            if used <= policy.max_bytes:
+                break
+            remove(path, size)
+            used -= size
+
+    report["remaining_bytes"] = report["total_bytes"] - report["freed_bytes"]
+    report["duration_sec"] = time.time() - started
+    return report
+
 
 class OutputManager:
     
-    def __init__(self, base_dir: str = "outputs"):
+    def __init__(self, base_dir: str = "outputs", retention_policy: Optional[RetentionPolicy] = None,
+                 journal: Optional[RunJournal] = None):
         self.base_dir = base_dir
+        self.retention_policy = retention_policy
+        # memory_profile.MemoryProfiler; when set, every stage() also records its memory peaks
+        self.memory_profiler = None
         self.metadata = {
             "timestamp_start": datetime.now().isoformat(),
             "solutions": {},
@@ -22,6 +246,9 @@ class OutputManager:
             "total_size_mb": 0
         }
         self._setup_directories()
+        self.journal = journal or RunJournal(f"{self.base_dir}/journal")
+        self.metadata["run_id"] = self.journal.run_id
+        self.journal.record("run_start", base_dir=self.base_dir)
     
     def _setup_directories(self):
         """Create basic directory structure"""
@@ -44,6 +271,7 @@ class OutputManager:
             "timestamp_start": datetime.now().isoformat(),
             "steps": []
         }
+        self.journal.record("solution_start", solution_number=solution_number, name=solution_name, folder=solution_folder)
         
         print(f"Created folder for solution {solution_number}: {solution_folder}")
         return solution_folder
@@ -82,6 +310,7 @@ class OutputManager:
             "file": main_path,
             "backup": backup_path,
             "size_mb": file_size / (1024*1024),
+            "size_bytes": file_size,
             "file_type": file_type,
             "timestamp": datetime.now().isoformat()
         })
@@ -110,12 +339,16 @@ class OutputManager:
                 "file_info": file_info,
                 "requirements_check": self._check_requirements(file_path, file_type)
             }
+            memory = self.metadata["solutions"].get(f"solution_{solution_number:02d}", {}).get("memory")
+            if memory:
+                metadata["memory"] = memory
             
             # Save metadata
             metadata_path = f"{solution_folder}/final/metadata.json"
             with open(metadata_path, "w", encoding="utf-8") as f:
                 json.dump(metadata, f, indent=2, ensure_ascii=False)
             
+            self.journal.record("metadata", solution_number=solution_number, name=solution_name, file=metadata_path)
             print(f"Saved metadata: {metadata_path}")
             
         except Exception as e:
@@ -203,12 +436,68 @@ class OutputManager:
             return self.metadata["solutions"][solution_key]["folder"]
         return f"{self.base_dir}/solution_{solution_number:02d}_unknown"
     
-    def _add_step(self, solution_number: int, step_info: Dict[str, Any]):
-        """Add step to solution metadata"""
+    def _add_step(self, solution_number: int, step_info: Dict[str, Any], event: str = "step"):
+        """Add step to solution metadata and the run journal"""
         solution_key = f"solution_{solution_number:02d}"
         if solution_key in self.metadata["solutions"]:
             self.metadata["solutions"][solution_key]["steps"].append(step_info)
+        self.journal.record(event, **{"solution_number": solution_number, "bytes": step_info.get("size_bytes"), **step_info})
+
+    @contextmanager
+    def stage(self, solution_number: int, name: str, **fields):
+        """Time a pipeline stage and record it as a step, including failed stages"""
+        started = time.time()
+        status = "ok"
+        profiler = self.memory_profiler
+        memory: Dict[str, Any] = {}
+        try:
+            with profiler.measure(name) if profiler is not None else nullcontext({}) as report:
+                memory = report
+                yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if memory:
+                fields["memory"] = {k: v for k, v in memory.items() if k != "name"}
+            self._add_step(solution_number, {
+                "name": name,
+                "duration_sec": time.time() - started,
+                "status": status,
+                "timestamp": datetime.now().isoformat(),
+                **fields
+            }, event="stage")
+
+    def record_file(self, solution_number: int, file_path: str, file_type: str):
+        """Record an intermediate file in the run journal"""
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        self.journal.record("file", solution_number=solution_number, name=os.path.basename(file_path),
+                            file=file_path, file_type=file_type, bytes=size)
     
+    def pin_solution(self, solution_number: int):
+        """Exclude a solution folder from retention sweeps"""
+        solution_folder = self._get_solution_folder(solution_number)
+        Path(solution_folder).mkdir(parents=True, exist_ok=True)
+        Path(f"{solution_folder}/{PIN_MARKER}").touch()
+
+    def apply_retention(self, policy: Optional[RetentionPolicy] = None,
+                        protected_paths: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Run a retention sweep over the output directory, typically at job end.
+        protected_paths (such as the job's own checkpoint values) are never removed.
+        """
+        policy = policy or self.retention_policy
+        if policy is None:
+            return None
+        report = sweep(self.base_dir, policy, protected_paths)
+        action = "Would free" if policy.dry_run else "Freed"
+        print(f"Retention sweep: {action} {report['freed_bytes'] / (1024*1024):.2f} MB "
+              f"({report['removed_files']} files), {report['remaining_bytes'] / (1024*1024):.2f} MB remaining")
+        return report
+
     def print_summary(self, solution_number: int = None):
         """Print summary of files"""
         print("\n" + "=" * 50)
@@ -230,9 +519,33 @@ class OutputManager:
         print("=" * 50)
 
 if __name__ == "__main__":
-    # Test the OutputManager
-    om = OutputManager()
-    solution_folder = om.create_solution_folder(1, "Test Solution")
-    print(f"Created folder: {solution_folder}")
-    om.print_summary(1)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Output manager utilities")
+    parser.add_argument("--sweep", action="store_true", help="Run a standalone retention sweep")
+    parser.add_argument("--base-dir", default="outputs")
+    parser.add_argument("--max-gb", type=float, help="Byte budget in GiB")
+    parser.add_argument("--max-age-days", type=float)
+    parser.add_argument("--keep-backups", type=int, default=3)
+    parser.add_argument("--stale-dir", action="append", default=[], help="Scratch folder to clean up (repeatable)")
+    parser.add_argument("--stale-after-hours", type=float, default=6.0)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.sweep:
+        policy = RetentionPolicy(
+            max_bytes=int(args.max_gb * 1024**3) if args.max_gb is not None else None,
+            max_age_days=args.max_age_days,
+            keep_backups=args.keep_backups,
+            stale_dirs=args.stale_dir,
+            stale_after_hours=args.stale_after_hours,
+            dry_run=args.dry_run,
+        )
+        print(json.dumps(sweep(args.base_dir, policy), indent=2))
+    else:
+        # Test the OutputManager
+        om = OutputManager()
+        solution_folder = om.create_solution_folder(1, "Test Solution")
+        print(f"Created folder: {solution_folder}")
+        om.print_summary(1)
 
@@ -0,0 +1,111 @@
+"""
+Segment Pipeline - Overlaps network-bound and CPU-bound per-segment work
+
+    produce(i)  --bounded queue-->  render(i, produced)  -->  results_in_order()
+
+A producer thread runs the network stage (e.g. TTS) segment by segment and hands each
+result to a bounded queue; render workers consume it as soon as it arrives. When the
+queue is full the producer waits, so neither side runs far ahead of the other.
+results_in_order() yields finished segments as soon as the next one in order is done,
+so assembly can start on a finished prefix while later segments are still in flight.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from deadline import spawn_thread
+
+_DONE = object()
+
+
+class SegmentPipeline:
+    """Producer/consumer pipeline over segment indices with in-order results"""
+
+    def __init__(self, indices: List[int], produce: Callable[[int], Any], render: Callable[[int, Any], Optional[str]],
+                 queue_size: int = 4, render_workers: int = 1):
+        self.indices = list(indices)
+        self.produce = produce
+        self.render = render
+        self.queue_size = queue_size
+        self.render_workers = render_workers
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._results: Dict[int, Optional[str]] = {}
+        self._cond = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _fail(self, error: BaseException):
+        with self._cond:
+            if self._error is None:
+                self._error = error
+            self._stop.set()
+            self._cond.notify_all()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _producer(self):
+        try:
+            for i in self.indices:
+                if self._stop.is_set():
+                    return
+                self._put((i, self.produce(i)))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.render_workers):
+                self._put(_DONE)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            i, produced = item
+            try:
+                result = self.render(i, produced)
+            except BaseException as e:
+                self._fail(e)
+                return
+            with self._cond:
+                self._results[i] = result
+                self._cond.notify_all()
+
+    def start(self) -> "SegmentPipeline":
+        # Stages inherit the caller's deadline, so their encoders are killed with the job
+        self._threads = [spawn_thread(self._producer)]
+        self._threads += [spawn_thread(self._worker) for _ in range(self.render_workers)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def results_in_order(self) -> Iterator[str]:
+        """Yield each segment's result in index order as soon as it is ready; None results are skipped"""
+        try:
+            for i in self.indices:
+                with self._cond:
+                    while i not in self._results and self._error is None:
+                        self._cond.wait()
+                    if self._error is not None:
+                        raise self._error
+                    result = self._results[i]
+                if result is not None:
+                    yield result
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop all stages; safe to call more than once"""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
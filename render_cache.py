@@ -0,0 +1,99 @@
+"""
+Render Cache - Encode each distinct still image once
+
+Static segments only differ by their audio and duration. The cache encodes a short
+video-only clip per unique (image content, output size, fps, encoder settings) and
+derives every segment from it by looping/trimming that encoded stream with a stream
+copy and muxing in the segment's audio. Video encoding work is proportional to the
+number of distinct images instead of the total duration.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from ffmpeg_utils import run_ffmpeg, probe_duration
+from frame_prep import PreparedFrame, BT709_ARGS
+from render_profile import RenderProfile
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StillRenderCache:
+    """Content-addressed cache of encoded still-image clips, shared across runs and threads"""
+
+    def __init__(self, cache_dir: str = "outputs/render_cache", profile: Optional[RenderProfile] = None,
+                 base_seconds: float = 10.0):
+        self.cache_dir = cache_dir
+        self.profile = profile or RenderProfile(fps=24)
+        self.base_seconds = base_seconds
+        self.hits = 0
+        self.misses = 0
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, image_path: str) -> str:
+        settings = json.dumps({"profile": self.profile.to_dict(), "base_seconds": self.base_seconds}, sort_keys=True)
+        return hashlib.sha256(f"{file_digest(image_path)}:{settings}".encode()).hexdigest()[:32]
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def base_clip(self, image_path: str, frame: Optional[PreparedFrame] = None) -> str:
+        """
+        Encoded clip for image_path, encoding it on first use.
+
+        With a PreparedFrame matching the profile size, its raw yuv420p frame is fed to the
+        encoder directly instead of scaling and converting the image on every frame.
+        """
+        if frame is not None and (frame.width, frame.height) != (self.profile.width, self.profile.height):
+            frame = None
+        key = self.key(frame.png_path if frame is not None else image_path)
+        path = os.path.join(self.cache_dir, f"still_{key}.mp4")
+        with self._lock_for(key):
+            if os.path.exists(path):
+                self.hits += 1
+                os.utime(path)  # keep hot entries at the back of the retention LRU
+                return path
+            self.misses += 1
+            p = self.profile
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+            if frame is not None:
+                source = [*frame.ffmpeg_input_args(p.fps), "-t", str(self.base_seconds), *BT709_ARGS]
+            else:
+                source = ["-loop", "1", "-framerate", str(p.fps), "-i", image_path, "-t", str(self.base_seconds),
+                          "-vf", f"scale={p.width}:{p.height}:force_original_aspect_ratio=decrease,"
+                                 f"pad={p.width}:{p.height}:(ow-iw)/2:(oh-ih)/2,setsar=1"]
+            # One keyframe per second so trimmed copies start and end cleanly
+            run_ffmpeg([*source, "-an", *p.video_args(), *([] if p.keyint else ["-g", str(p.fps)]), tmp_path])
+            os.replace(tmp_path, path)  # atomic, so concurrent processes never see a partial clip
+        return path
+
+    def render_segment(self, image_path: str, audio_path: Optional[str], output_path: str,
+                       duration: Optional[float] = None, frame: Optional[PreparedFrame] = None) -> str:
+        """
+        Segment video from a cached still clip plus audio, without re-encoding video.
+
+        duration defaults to the audio duration, or 8 seconds for silent segments.
+        """
+        base = self.base_clip(image_path, frame)
+        if duration is None:
+            duration = probe_duration(audio_path) if audio_path else 8.0
+        args = ["-stream_loop", "-1", "-i", base]
+        if audio_path:
+            args += ["-i", audio_path, "-map", "0:v", "-map", "1:a", *self.profile.audio_args()]
+        else:
+            args += ["-an"]
+        args += ["-t", f"{duration:.3f}", "-c:v", "copy", "-movflags", "+faststart", output_path]
+        run_ffmpeg(args)
+        return output_path
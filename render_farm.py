@@ -0,0 +1,515 @@
+"""
+Render Farm - Segment renders and the overlay pass on worker processes of other hosts
+
+The coordinator (solve(farm_dir=...)) turns the Step 3 segment renders and the final
+overlay pass into self-contained tasks (staged inputs plus the encoder profile) and
+drops them into a work directory that every render node mounts, e.g. over NFS.
+Workers claim tasks by renaming them, render them and write the result next to them;
+the coordinator collects the outputs and assembles the final video.
+
+Work directory layout (paths inside tasks are relative to it, so nodes may mount it
+at different places):
+
+    tasks/<id>.json      pending task
+    claimed/<id>.json    taken by a worker (atomic rename); its mtime is the heartbeat
+    done/<id>.json       result
+    failed/<id>.json     error of a task that could not be rendered
+    withdrawn/<id>       task given up by its coordinator; the worker discards its result
+    inputs/<session>/    images, audio and segments staged by one coordinator (by content
+                         hash), removed once the renders that use them have finished
+    outputs/             rendered files
+    cache/               StillRenderCache shared by all workers
+
+A claim whose heartbeat is older than stale_sec (worker killed, node lost) is put back
+into tasks/ and rendered by another worker. A worker rewrites the claim file right
+after claiming it and remembers its inode, so a worker that was only slow never
+touches or removes the claim of the worker that took the task over.
+
+The overlay pass is split into runs of consecutive segments. Each run is encoded
+independently with the overlay clock set to the run's start time, and the runs are
+joined by stream copy. If a run starts on another frame than estimated, it is
+rendered again with the actual start time, so the overlay never jumps.
+
+When a task fails, times out or the job's deadline passes, the coordinator withdraws
+the other tasks it was waiting for before raising: pending ones are deleted, finished
+ones have their outputs removed, and running ones are marked withdrawn so their
+worker throws the result away instead of leaving it in outputs/.
+
+Usage:
+    python render_farm.py worker --work-dir /mnt/farm                      # on every render node
+    python render_farm.py worker --work-dir /mnt/farm --exit-when-idle 60
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import traceback
+from typing import Dict, Any, List, Optional, Tuple
+
+from deadline import check_deadline, current_deadline
+from ffmpeg_utils import probe_duration, run_ffmpeg, write_concat_list
+from render_profile import RenderProfile
+
+TASKS = "tasks"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+WITHDRAWN = "withdrawn"
+INPUTS = "inputs"
+OUTPUTS = "outputs"
+CACHE = "cache"
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"  # workers only pick up *.json
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def build_overlay(spec: Optional[Dict[str, Any]], root: str):
+    """Frame overlay described by a task: {"mode": "gif"|"stub"|"none", "gif": path, "height": h}"""
+    from compositor import BoxOverlay, GifOverlay
+
+    mode = (spec or {}).get("mode", "none")
+    if mode == "gif":
+        return GifOverlay(os.path.join(root, spec["gif"]), height=spec["height"])
+    if mode == "stub":
+        return BoxOverlay(spec["height"], spec["height"])
+    if mode == "none":
+        return None
+    raise ValueError(f"Unknown overlay mode '{mode}'")
+
+
+class RenderFarm:
+    """Coordinator side: stages inputs, submits tasks and collects their results"""
+
+    def __init__(self, work_dir: str, stale_sec: float = 120.0, poll_sec: float = 0.5):
+        self.work_dir = work_dir
+        self.stale_sec = stale_sec
+        self.poll_sec = poll_sec
+        # Inputs of this coordinator only, so releasing them never breaks another one's tasks
+        self.inputs_dir = f"{INPUTS}/{uuid.uuid4().hex[:12]}"
+        for sub in (TASKS, CLAIMED, DONE, FAILED, WITHDRAWN, self.inputs_dir, OUTPUTS, CACHE):
+            os.makedirs(os.path.join(work_dir, sub), exist_ok=True)
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.work_dir, rel_path)
+
+    def stage_input(self, path: str) -> str:
+        """Copy a local file into inputs/ (once per content) and return its shared relative path"""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        rel_path = f"{self.inputs_dir}/{h.hexdigest()[:32]}{os.path.splitext(path)[1]}"
+        target = self.path(rel_path)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)  # removed by release_inputs
+            tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        return rel_path
+
+    def release_inputs(self, rel_paths):
+        """Remove staged inputs once no submitted task needs them any more"""
+        for rel_path in set(rel_paths):
+            try:
+                os.remove(self.path(rel_path))
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(self.path(self.inputs_dir))
+        except OSError:
+            pass  # other inputs still staged
+
+    def submit(self, kind: str, **fields) -> str:
+        # Time-ordered ids, so workers take tasks in submission order
+        task_id = f"{time.time_ns() // 1000:016d}_{kind}_{uuid.uuid4().hex[:8]}"
+        _write_json(self.path(f"{TASKS}/{task_id}.json"), {"task_id": task_id, "kind": kind, **fields})
+        return task_id
+
+    def _requeue_stale(self):
+        claimed_dir = self.path(CLAIMED)
+        now = time.time()
+        for name in os.listdir(claimed_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                if now - os.path.getmtime(os.path.join(claimed_dir, name)) > self.stale_sec:
+                    os.rename(os.path.join(claimed_dir, name), self.path(f"{TASKS}/{name}"))
+                    print(f"Requeued stale render task {name[:-5]}")
+            except FileNotFoundError:
+                continue  # finished or requeued in the meantime
+
+    def wait(self, task_ids: List[str], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Block until every task is done; raises RuntimeError for failed tasks. On any
+        failure, timeout or deadline the remaining tasks are withdrawn first.
+        """
+        try:
+            return self._wait(task_ids, timeout)
+        except BaseException:
+            self.withdraw(task_ids)
+            raise
+
+    def _wait(self, task_ids: List[str], timeout: Optional[float]) -> Dict[str, Dict[str, Any]]:
+        started = time.monotonic()
+        results: Dict[str, Dict[str, Any]] = {}
+        while True:
+            for task_id in task_ids:
+                if task_id in results:
+                    continue
+                result = _read_json(self.path(f"{DONE}/{task_id}.json"))
+                if result is not None:
+                    results[task_id] = result
+                    continue
+                failure = _read_json(self.path(f"{FAILED}/{task_id}.json"))
+                if failure is not None:
+                    raise RuntimeError(f"Render task {task_id} failed on {failure.get('worker')}: {failure.get('error')}")
+            if len(results) == len(task_ids):
+                return results
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"{len(task_ids) - len(results)} render tasks not finished after {timeout:.0f}s")
+            self._requeue_stale()
+            check_deadline()
+            deadline = current_deadline()
+            if deadline is not None:
+                deadline.sleep(self.poll_sec)
+            else:
+                time.sleep(self.poll_sec)
+
+    def withdraw(self, task_ids: List[str]):
+        """
+        Give up on tasks: delete pending ones, remove the records and outputs of finished
+        ones, and mark running ones so their worker discards the result.
+        """
+        withdrawn = 0
+        for task_id in task_ids:
+            try:
+                os.remove(self.path(f"{TASKS}/{task_id}.json"))
+                withdrawn += 1
+                continue
+            except FileNotFoundError:
+                pass  # claimed or finished
+            # Marker first, then look for a result: a worker writes its result, then looks
+            # for the marker, so one of the two sides always sees the other
+            marker = self.path(f"{WITHDRAWN}/{task_id}")
+            open(marker, "w").close()
+            finished = [r for r in (_read_json(self.path(f"{sub}/{task_id}.json")) for sub in (DONE, FAILED)) if r]
+            if finished:
+                self.cleanup([task_id], {task_id: finished[0]})
+                _remove(marker)
+            withdrawn += 1
+        if withdrawn:
+            print(f"Withdrew {withdrawn} render tasks")
+
+    def cleanup(self, task_ids: List[str], results: Dict[str, Dict[str, Any]]):
+        """Remove finished task records and their outputs once the coordinator has them"""
+        for task_id in task_ids:
+            for rel_path in results.get(task_id, {}).get("outputs", []):
+                _remove(self.path(rel_path))
+            for sub in (DONE, FAILED):
+                _remove(self.path(f"{sub}/{task_id}.json"))
+
+    def render_segments(self, jobs: List[Tuple[str, Optional[str], str]], profile: RenderProfile) -> List[str]:
+        """
+        Render (image, audio or None, output path) segments on the workers.
+
+        Each worker builds the segment from the shared still cache plus the audio, the
+        same way StillRenderCache does locally. Outputs are copied to their local paths.
+        """
+        staged: Dict[str, str] = {}
+
+        def stage(path: str) -> str:
+            if path not in staged:
+                staged[path] = self.stage_input(path)
+            return staged[path]
+
+        try:
+            task_ids = [
+                self.submit("segment", image=stage(image), audio=stage(audio) if audio else None,
+                            output=f"{OUTPUTS}/{uuid.uuid4().hex}.mp4", profile=profile.to_dict())
+                for image, audio, _ in jobs
+            ]
+            print(f"Submitted {len(task_ids)} segment renders to {self.work_dir}")
+            results = self.wait(task_ids)
+        finally:
+            self.release_inputs(staged.values())
+        for task_id, (_, _, output_path) in zip(task_ids, jobs):
+            shutil.copyfile(self.path(results[task_id]["outputs"][0]), output_path)
+        self.cleanup(task_ids, results)
+        return [output_path for _, _, output_path in jobs]
+
+
+class FarmCompositor:
+    """StreamingCompositor counterpart whose overlay pass runs on the farm workers"""
+
+    def __init__(self, farm: RenderFarm, profile: RenderProfile, overlay: Optional[Dict[str, Any]] = None,
+                 segments_per_task: int = 4):
+        """
+        Args:
+            overlay: {"mode": "gif"|"stub"|"none", "gif": local path, "height": h}
+            segments_per_task: Consecutive segments encoded by one worker task
+        """
+        self.farm = farm
+        self.profile = profile
+        self.overlay = dict(overlay or {"mode": "none"})
+        self.segments_per_task = segments_per_task
+        # (path, frame count) of each segment in the last compose() call, as StreamingCompositor
+        self.segment_frames: List[Tuple[str, int]] = []
+
+    def _submit_run(self, staged: List[str], start_frame: int, overlay: Dict[str, Any]) -> str:
+        return self.farm.submit("overlay", segments=staged, start_time=start_frame / self.profile.fps,
+                                output=f"{OUTPUTS}/{uuid.uuid4().hex}.mp4", profile=self.profile.to_dict(),
+                                overlay=overlay)
+
+    def _render_runs(self, segment_paths: List[str], staged: List[str],
+                     overlay: Dict[str, Any]) -> Tuple[List[str], Dict[str, Dict[str, Any]], List[int]]:
+        """Overlay tasks of all runs; returns (task id per run, results, frame count per segment)"""
+        fps = self.profile.fps
+        size = self.segments_per_task
+        runs = [list(range(k, min(k + size, len(staged)))) for k in range(0, len(staged), size)]
+
+        # Overlay clock per run from the estimated frame counts; corrected below if a run is off
+        estimated = [round(probe_duration(path) * fps) for path in segment_paths]
+        starts = [sum(estimated[:run[0]]) for run in runs]
+        task_ids = [self._submit_run([staged[i] for i in run], start, overlay) for run, start in zip(runs, starts)]
+        print(f"Submitted {len(task_ids)} overlay tasks to {self.farm.work_dir}")
+        results = self.farm.wait(task_ids)
+
+        frames = [count for task_id in task_ids for count in results[task_id]["frames"]]
+        actual = [sum(frames[:run[0]]) for run in runs]
+        redo = [k for k in range(len(runs)) if actual[k] != starts[k] and overlay.get("mode") != "none"]
+        if redo:
+            print(f"Re-rendering {len(redo)} overlay tasks with corrected start frames")
+            retry = {k: self._submit_run([staged[i] for i in runs[k]], actual[k], overlay) for k in redo}
+            try:
+                retried = self.farm.wait(list(retry.values()))
+            except BaseException:
+                self.farm.cleanup(task_ids, results)
+                raise
+            self.farm.cleanup([task_ids[k] for k in redo], results)
+            for k, task_id in retry.items():
+                task_ids[k] = task_id
+                results[task_id] = retried[task_id]
+
+        return task_ids, results, frames
+
+    def compose(self, segment_paths: List[str], output_path: str) -> str:
+        from compositor import StreamingCompositor
+
+        segment_paths = list(segment_paths)
+        if not segment_paths:
+            raise ValueError("No segments to compose")
+        overlay = dict(self.overlay)
+        staged: List[str] = []
+        try:
+            if overlay.get("mode") == "gif":
+                overlay["gif"] = self.farm.stage_input(overlay["gif"])
+                staged.append(overlay["gif"])
+            segments = [self.farm.stage_input(path) for path in segment_paths]
+            staged += segments
+            task_ids, results, frames = self._render_runs(segment_paths, segments, overlay)
+        finally:
+            self.farm.release_inputs(staged)
+
+        self.segment_frames = list(zip(segment_paths, frames))
+        work_dir = tempfile.mkdtemp(prefix="farm_", dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            audio_path = StreamingCompositor(self.profile).write_audio(self.segment_frames,
+                                                                       os.path.join(work_dir, "audio.wav"))
+            parts = [self.farm.path(results[task_id]["outputs"][0]) for task_id in task_ids]
+            list_path = write_concat_list(parts, os.path.join(work_dir, "parts.txt"))
+            tmp_output = os.path.join(work_dir, "output.mp4")
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-i", audio_path, "-map", "0:v", "-map", "1:a",
+                        "-c:v", "copy", *self.profile.audio_args(), "-movflags", "+faststart", tmp_output])
+            os.replace(tmp_output, output_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        self.farm.cleanup(task_ids, results)
+        return output_path
+
+
+class RenderWorker:
+    """Worker side: claims tasks from the work directory and renders them"""
+
+    def __init__(self, work_dir: str, worker_id: Optional[str] = None, poll_sec: float = 1.0,
+                 heartbeat_sec: float = 10.0):
+        self.work_dir = work_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_sec = poll_sec
+        self.heartbeat_sec = heartbeat_sec
+        self.caches: Dict[str, Any] = {}
+        self._claims: Dict[str, int] = {}  # claimed path -> inode of our claim file
+        for sub in (TASKS, CLAIMED, DONE, FAILED, WITHDRAWN, OUTPUTS, CACHE):
+            os.makedirs(os.path.join(work_dir, sub), exist_ok=True)
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.work_dir, rel_path)
+
+    def claim(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Take the oldest pending task; the rename makes the claim atomic across hosts"""
+        tasks_dir = self.path(TASKS)
+        for name in sorted(n for n in os.listdir(tasks_dir) if n.endswith(".json")):
+            claimed_path = self.path(f"{CLAIMED}/{name}")
+            try:
+                os.rename(os.path.join(tasks_dir, name), claimed_path)
+            except FileNotFoundError:
+                continue  # another worker was faster
+            task = _read_json(claimed_path)
+            if task is None:
+                continue
+            if os.path.exists(self.path(f"{WITHDRAWN}/{task['task_id']}")):
+                # Given up by its coordinator (requeued after the marker was written)
+                _remove(claimed_path)
+                _remove(self.path(f"{WITHDRAWN}/{task['task_id']}"))
+                continue
+            # A fresh file (new inode) marks this claim as ours; a stale requeue renames the
+            # file, so the inode follows the claim to the worker that takes the task over
+            _write_json(claimed_path, {**task, "claimed_by": self.worker_id})
+            self._claims[claimed_path] = os.stat(claimed_path).st_ino
+            return claimed_path, task
+        return None
+
+    def owns(self, claimed_path: str) -> bool:
+        """True while claimed_path is still this worker's claim (not requeued or re-claimed)"""
+        try:
+            return os.stat(claimed_path).st_ino == self._claims.get(claimed_path)
+        except FileNotFoundError:
+            return False
+
+    def release(self, claimed_path: str):
+        """Remove our claim; a claim another worker has taken over in the meantime is left alone"""
+        if self.owns(claimed_path):
+            try:
+                os.remove(claimed_path)
+            except FileNotFoundError:
+                pass
+        self._claims.pop(claimed_path, None)
+
+    def _heartbeat(self, claimed_path: str, stop: threading.Event):
+        while not stop.wait(self.heartbeat_sec):
+            if not self.owns(claimed_path):
+                return  # requeued as stale; the result is still accepted if we finish first
+            try:
+                os.utime(claimed_path)
+            except FileNotFoundError:
+                return
+
+    def _still_cache(self, profile: RenderProfile):
+        from render_cache import StillRenderCache
+
+        key = json.dumps(profile.to_dict(), sort_keys=True)
+        if key not in self.caches:
+            self.caches[key] = StillRenderCache(self.path(CACHE), profile)
+        return self.caches[key]
+
+    def run_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        profile = RenderProfile.from_dict(task["profile"])
+        output = self.path(task["output"])
+        tmp_output = f"{output}.{uuid.uuid4().hex}.tmp.mp4"
+        if task["kind"] == "segment":
+            audio = self.path(task["audio"]) if task.get("audio") else None
+            self._still_cache(profile).render_segment(self.path(task["image"]), audio, tmp_output)
+            os.replace(tmp_output, output)
+            return {"outputs": [task["output"]]}
+        if task["kind"] == "overlay":
+            from compositor import StreamingCompositor
+
+            compositor = StreamingCompositor(profile, build_overlay(task.get("overlay"), self.work_dir))
+            compositor.compose([self.path(p) for p in task["segments"]], tmp_output,
+                               start_time=task.get("start_time", 0.0), audio=False)
+            os.replace(tmp_output, output)
+            return {"outputs": [task["output"]], "frames": [count for _, count in compositor.segment_frames]}
+        raise ValueError(f"Unknown render task kind '{task['kind']}'")
+
+    def run_once(self) -> bool:
+        """Render one task if any is pending; False when the queue was empty"""
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        claimed_path, task = claimed
+        task_id = task["task_id"]
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(claimed_path, stop), daemon=True)
+        heartbeat.start()
+        started = time.time()
+        result: Dict[str, Any] = {}
+        try:
+            result = self.run_task(task)
+            result.update(task_id=task_id, worker=self.worker_id, duration_sec=time.time() - started)
+            _write_json(self.path(f"{DONE}/{task_id}.json"), result)
+            print(f"[{self.worker_id}] {task_id} done in {result['duration_sec']:.1f}s")
+        except Exception as e:
+            _write_json(self.path(f"{FAILED}/{task_id}.json"), {
+                "task_id": task_id, "worker": self.worker_id,
+                "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc(),
+            })
+            print(f"[{self.worker_id}] {task_id} failed: {e}")
+        finally:
+            marker = self.path(f"{WITHDRAWN}/{task_id}")
+            if os.path.exists(marker):
+                # The coordinator gave up on this task while it was rendering
+                for rel_path in result.get("outputs", []):
+                    _remove(self.path(rel_path))
+                for sub in (DONE, FAILED):
+                    _remove(self.path(f"{sub}/{task_id}.json"))
+                _remove(marker)
+                print(f"[{self.worker_id}] {task_id} was withdrawn; result discarded")
+            stop.set()
+            heartbeat.join()
+            self.release(claimed_path)
+        return True
+
+    def run(self, exit_when_idle: Optional[float] = None):
+        """Render tasks until stopped, or until the queue has been empty for exit_when_idle seconds"""
+        idle_since = time.monotonic()
+        while True:
+            if self.run_once():
+                idle_since = time.monotonic()
+                continue
+            if exit_when_idle is not None and time.monotonic() - idle_since > exit_when_idle:
+                return
+            time.sleep(self.poll_sec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render farm worker for segment and overlay tasks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="Render tasks from a shared work directory")
+    worker.add_argument("--work-dir", required=True, help="Work directory shared with the coordinator")
+    worker.add_argument("--worker-id", help="Name in task results (default: host:pid)")
+    worker.add_argument("--poll-sec", type=float, default=1.0)
+    worker.add_argument("--exit-when-idle", type=float, help="Exit after this many seconds without tasks")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        print(f"Render worker polling {args.work_dir}")
+        RenderWorker(args.work_dir, args.worker_id, poll_sec=args.poll_sec).run(args.exit_when_idle)
+
+
+if __name__ == "__main__":
+    main()
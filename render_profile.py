@@ -0,0 +1,120 @@
+"""
+Render Profile - Encoder settings shared by every render path
+
+Profiles chosen by tune_encoder.py are saved per role ("segment" for the per-segment
+renders, "final" for the overlay pass) and picked up by solve() through load_profile().
+"""
+
+import os
+import json
+from typing import Dict, Any, List, Optional
+
+DEFAULT_PROFILE_PATH = "render_profile.json"
+
+
+class RenderProfile:
+    """Output size, frame rate and encoder settings for one render"""
+
+    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 30, codec: str = "libx264",
+                 preset: str = "medium", crf: Optional[int] = None, threads: Optional[int] = None,
+                 pix_fmt: str = "yuv420p", keyint: Optional[int] = None,
+                 audio_codec: str = "aac", audio_bitrate: str = "192k"):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.pix_fmt = pix_fmt
+        self.keyint = keyint
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+
+    @property
+    def size(self) -> str:
+        return f"{self.width}x{self.height}"
+
+    def video_args(self) -> List[str]:
+        """ffmpeg output arguments for the video stream"""
+        args = ["-c:v", self.codec, "-pix_fmt", self.pix_fmt]
+        if self.preset:
+            args += ["-preset", self.preset]
+        if self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        if self.keyint:
+            args += ["-g", str(self.keyint)]
+        return args
+
+    def audio_args(self) -> List[str]:
+        return ["-c:a", self.audio_codec, "-b:a", self.audio_bitrate]
+
+    def moviepy_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for moviepy's write_videofile"""
+        kwargs: Dict[str, Any] = {"codec": self.codec, "fps": self.fps, "preset": self.preset}
+        if self.threads:
+            kwargs["threads"] = self.threads
+        params = []
+        if self.crf is not None:
+            params += ["-crf", str(self.crf)]
+        if self.keyint:
+            params += ["-g", str(self.keyint)]
+        if params:
+            kwargs["ffmpeg_params"] = params
+        return kwargs
+
+    def as_draft(self, height: int = 360, max_fps: int = 12) -> "RenderProfile":
+        """Low-resolution, low-frame-rate copy with the fastest preset, for preview renders"""
+        scale = min(1.0, height / self.height)
+        draft = RenderProfile.from_dict(self.to_dict())
+        # yuv420p needs even dimensions
+        draft.width = max(2, int(self.width * scale) // 2 * 2)
+        draft.height = max(2, int(self.height * scale) // 2 * 2)
+        draft.fps = min(self.fps, max_fps)
+        draft.preset = "ultrafast"
+        draft.crf = 35
+        draft.keyint = None
+        draft.audio_bitrate = "96k"
+        return draft
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RenderProfile":
+        return cls(**data)
+
+    def __repr__(self) -> str:
+        return f"RenderProfile({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+
+
+def _profile_path(path: Optional[str]) -> str:
+    return path or os.getenv("RENDER_PROFILE") or DEFAULT_PROFILE_PATH
+
+
+def load_profile(role: str, path: Optional[str] = None, **defaults) -> RenderProfile:
+    """Saved profile for role, falling back to RenderProfile(**defaults) when none was tuned"""
+    path = _profile_path(path)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f).get(role)
+        if saved:
+            return RenderProfile.from_dict({**defaults, **saved})
+    return RenderProfile(**defaults)
+
+
+def save_profile(role: str, profile: RenderProfile, path: Optional[str] = None, **info) -> str:
+    """Store profile for role, keeping the other roles in the file"""
+    path = _profile_path(path)
+    data: Dict[str, Any] = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data[role] = profile.to_dict()
+    if info:
+        data.setdefault("tuning", {})[role] = info
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return path
@@ -0,0 +1,167 @@
+"""
+Run Journal - Append-only history of OutputManager runs
+Every event is one JSON line appended with a single write, so records survive crashes
+and concurrent workers can share a journal file. JournalIndex ingests the lines into
+SQLite incrementally for cross-run queries.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+JOURNAL_FILE = "runs.jsonl"
+INDEX_FILE = "index.sqlite"
+
+
+class RunJournal:
+    """Append-only JSONL event log for one run"""
+
+    def __init__(self, journal_dir: str = "outputs/journal", run_id: Optional[str] = None, fsync: bool = False):
+        self.journal_dir = journal_dir
+        self.path = f"{journal_dir}/{JOURNAL_FILE}"
+        self.run_id = run_id or uuid.uuid4().hex
+        self.fsync = fsync
+        Path(journal_dir).mkdir(parents=True, exist_ok=True)
+        # O_APPEND makes each single-write line atomic with respect to other writers
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def record(self, event: str, **fields) -> Dict[str, Any]:
+        """Append one event; cheap enough to call on every step"""
+        entry = {"run_id": self.run_id, "ts": time.time(), "event": event}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        os.write(self._fd, line.encode("utf-8"))
+        if self.fsync:
+            os.fsync(self._fd)
+        return entry
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class JournalIndex:
+    """SQLite index over a journal, refreshed from the last ingested byte offset"""
+
+    def __init__(self, journal_dir: str = "outputs/journal"):
+        self.journal_path = f"{journal_dir}/{JOURNAL_FILE}"
+        Path(journal_dir).mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(f"{journal_dir}/{INDEX_FILE}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                run_id TEXT, ts REAL, event TEXT, solution_number INTEGER,
+                name TEXT, duration_sec REAL, bytes INTEGER, data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_solution ON events (solution_number, run_id);
+            CREATE INDEX IF NOT EXISTS idx_events_ts ON events (event, ts);
+            CREATE TABLE IF NOT EXISTS ingest_state (id INTEGER PRIMARY KEY CHECK (id = 1), offset INTEGER);
+        """)
+
+    def refresh(self) -> int:
+        """Ingest complete lines appended since the last refresh; returns the number of new events"""
+        row = self.conn.execute("SELECT offset FROM ingest_state WHERE id = 1").fetchone()
+        offset = row[0] if row else 0
+        if not os.path.exists(self.journal_path):
+            return 0
+        if os.path.getsize(self.journal_path) < offset:
+            # Journal was rotated or truncated; rebuild from scratch
+            self.conn.execute("DELETE FROM events")
+            offset = 0
+
+        rows = []
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial line from a writer that is still running or crashed mid-write
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                rows.append((
+                    entry.get("run_id"), entry.get("ts"), entry.get("event"), entry.get("solution_number"),
+                    entry.get("name"), entry.get("duration_sec"), entry.get("bytes"),
+                    line.decode("utf-8").rstrip("\n"),
+                ))
+
+        with self.conn:
+            self.conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO ingest_state (id, offset) VALUES (1, ?)", (offset,))
+        return len(rows)
+
+    def runs_for_solution(self, solution_number: int) -> List[Dict[str, Any]]:
+        """All runs that touched a solution, newest first"""
+        self.refresh()
+        cur = self.conn.execute("""
+            SELECT run_id, MIN(ts), MAX(ts), COUNT(*), COALESCE(SUM(bytes), 0),
+                   SUM(CASE WHEN event = 'stage' AND json_extract(data, '$.status') = 'error' THEN 1 ELSE 0 END)
+            FROM events WHERE solution_number = ? GROUP BY run_id ORDER BY MIN(ts) DESC
+        """, (solution_number,))
+        return [
+            {"run_id": r[0], "started": r[1], "last_event": r[2], "events": r[3], "bytes": r[4], "failed_stages": r[5]}
+            for r in cur.fetchall()
+        ]
+
+    def slowest_stages(self, since: Optional[float] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Slowest recorded stages, optionally since an epoch timestamp"""
+        self.refresh()
+        cur = self.conn.execute("""
+            SELECT run_id, solution_number, name, duration_sec, ts FROM events
+            WHERE event = 'stage' AND ts >= ? ORDER BY duration_sec DESC LIMIT ?
+        """, (since or 0, limit))
+        return [
+            {"run_id": r[0], "solution_number": r[1], "name": r[2], "duration_sec": r[3], "ts": r[4]}
+            for r in cur.fetchall()
+        ]
+
+    def total_bytes(self, since: Optional[float] = None, solution_number: Optional[int] = None) -> int:
+        """Total bytes of files produced, optionally filtered by time and solution"""
+        self.refresh()
+        query = "SELECT COALESCE(SUM(bytes), 0) FROM events WHERE event IN ('file', 'step') AND ts >= ?"
+        params: List[Any] = [since or 0]
+        if solution_number is not None:
+            query += " AND solution_number = ?"
+            params.append(solution_number)
+        return self.conn.execute(query, params).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the run journal")
+    parser.add_argument("--journal-dir", default="outputs/journal")
+    sub = parser.add_subparsers(dest="command", required=True)
+    runs = sub.add_parser("runs", help="All runs of a solution")
+    runs.add_argument("solution_number", type=int)
+    slowest = sub.add_parser("slowest", help="Slowest stages")
+    slowest.add_argument("--days", type=float, default=7)
+    slowest.add_argument("--limit", type=int, default=10)
+    total = sub.add_parser("bytes", help="Total bytes produced")
+    total.add_argument("--days", type=float)
+    total.add_argument("--solution", type=int)
+    args = parser.parse_args()
+
+    index = JournalIndex(args.journal_dir)
+    if args.command == "runs":
+        result: Any = index.runs_for_solution(args.solution_number)
+    elif args.command == "slowest":
+        result = index.slowest_stages(since=time.time() - args.days * 86400, limit=args.limit)
+    else:
+        since = time.time() - args.days * 86400 if args.days else None
+        result = {"bytes": index.total_bytes(since=since, solution_number=args.solution)}
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,231 @@
+"""
+Script Stream - Start TTS while the LLM is still writing the script
+
+TextService.chat_stream yields tokens as they arrive. SegmentChunker turns that stream
+into complete dialogue lines: a "[Segment N]" block is handed on as soon as its
+"Lời thoại" line ends, without waiting for the rest of the script. stream_script_audio
+submits each line to TTSService on a small thread pool and yields the audio in segment
+order, so the first segment's audio is ready roughly one TTS call after the first
+dialogue line is written rather than after the whole completion.
+
+For free-form text, iter_sentences splits the token stream on sentence boundaries.
+
+Usage:
+    python script_stream.py --prompt raw_script.txt --script-out script.txt --audio-dir outputs/tts_stream
+"""
+
+import os
+import re
+import time
+import wave
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from deadline import spawn_thread
+from stage_limits import StageLimits, UNLIMITED
+
+SEGMENT_HEADER = re.compile(r"\[Segment\s*(\d+)[^\]\n]*\]")
+DIALOGUE_LINE = re.compile(r"Lời thoại\s*(?:\(([^)]*)\))?\s*:\**\s*(.*?)\s*\n")
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)|\n")
+
+# Raw TTS output format (see generate_podcast.generate_audio_chunk)
+TTS_SAMPLE_RATE = 24000
+_DONE = object()
+
+
+def clean_dialogue(text: str) -> str:
+    """Same cleanup as parse_segments: drop markdown emphasis and leading stage directions"""
+    text = text.replace("**", "").strip()
+    text = re.sub(r"^\(.*?\)\s*", "", text)
+    return text.replace("\n", " ").strip()
+
+
+def iter_sentences(tokens: Iterable[str], min_chars: int = 20) -> Iterator[str]:
+    """Regroup a token stream into sentences of at least min_chars (the remainder is yielded last)"""
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        cut = 0
+        for match in SENTENCE_END.finditer(buffer):
+            if match.end() - cut >= min_chars:
+                sentence = buffer[cut:match.end()].strip()
+                if sentence:
+                    yield sentence
+                cut = match.end()
+        buffer = buffer[cut:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class SegmentChunker:
+    """Incremental parser for "[Segment N]" scripts; emits each dialogue line once it is complete"""
+
+    def __init__(self):
+        self.text = ""
+        self._emitted = set()
+        self._scan_from = 0  # start of the first segment block that may still change
+
+    def feed(self, token: str) -> List[Tuple[int, Dict[str, str]]]:
+        self.text += token
+        return self._scan(final=False)
+
+    def flush(self) -> List[Tuple[int, Dict[str, str]]]:
+        """Emit whatever is left once the stream has ended (a last line without a newline)"""
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> List[Tuple[int, Dict[str, str]]]:
+        ready = []
+        text = self.text + "\n" if final else self.text
+        headers = list(SEGMENT_HEADER.finditer(text, self._scan_from))
+        for k, header in enumerate(headers):
+            closed = k + 1 < len(headers)
+            block_end = headers[k + 1].start() if closed else len(text)
+            number = int(header.group(1))
+            if number not in self._emitted:
+                line = DIALOGUE_LINE.search(text, header.end(), block_end)
+                if line:
+                    self._emitted.add(number)
+                    dialogue = clean_dialogue(line.group(2))
+                    if dialogue:
+                        ready.append((number, {"speaker": (line.group(1) or "").strip(), "dialogue": dialogue}))
+            if closed:
+                # The next header has arrived, so this block is complete: never scan it again
+                self._scan_from = block_end
+        return ready
+
+
+def stream_script_audio(text_service, tts_service, messages: List[Dict[str, str]],
+                        voice_for: Optional[Callable[[int, Dict[str, str]], str]] = None,
+                        tts_workers: int = 2, limits: Optional[StageLimits] = None,
+                        on_text: Optional[Callable[[str], None]] = None,
+                        **chat_kwargs) -> Iterator[Tuple[int, Dict[str, str], bytes]]:
+    """
+    Generate a script with text_service.chat_stream and synthesize each dialogue line as
+    soon as it is complete.
+
+    Yields (segment number, {"speaker", "dialogue"}, audio bytes) in script order.
+    voice_for picks the TTS voice per segment (default: the service's default voice);
+    on_text receives every token, e.g. to write the script to disk as it streams.
+    """
+    from services.base import abort_response
+
+    limits = limits or UNLIMITED
+    pending: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    opened: Dict[str, object] = {}
+    opened_lock = threading.Lock()
+
+    def synthesize(number: int, segment: Dict[str, str]) -> bytes:
+        kwargs = {"voice_name": voice_for(number, segment)} if voice_for else {}
+        with limits.network():
+            return tts_service.synthesize(segment["dialogue"], **kwargs)
+
+    def on_response(resp):
+        with opened_lock:
+            opened["response"] = resp
+            if stop.is_set():
+                abort_response(resp)
+
+    def read(pool: ThreadPoolExecutor):
+        try:
+            chunker = SegmentChunker()
+            for token in text_service.chat_stream(messages, on_response=on_response, **chat_kwargs):
+                if stop.is_set():
+                    return
+                if on_text:
+                    on_text(token)
+                for number, segment in chunker.feed(token):
+                    pending.put((number, segment, pool.submit(synthesize, number, segment)))
+            for number, segment in chunker.flush():
+                pending.put((number, segment, pool.submit(synthesize, number, segment)))
+        except BaseException as e:
+            pending.put(e)
+        finally:
+            pending.put(_DONE)
+
+    pool = ThreadPoolExecutor(max_workers=tts_workers)
+    reader = spawn_thread(read, (pool,))
+    reader.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            number, segment, future = item
+            yield number, segment, future.result()
+    finally:
+        # On early exit: abort the LLM stream instead of waiting for its next token, and
+        # drop queued TTS calls (ones already running finish in the background)
+        stop.set()
+        with opened_lock:
+            response = opened.get("response")
+        if response is not None:
+            abort_response(response)
+        pool.shutdown(wait=False, cancel_futures=True)
+        reader.join()
+
+
+def write_wav(path: str, pcm: bytes, sample_rate: int = TTS_SAMPLE_RATE):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+
+
+def main():
+    from dotenv import load_dotenv
+    from services.base import ServiceConfig
+    from services.text_service import TextService
+    from services.tts_service import TTSService
+
+    parser = argparse.ArgumentParser(description="Write a script with the LLM and synthesize it while it streams")
+    parser.add_argument("--prompt", default="raw_script.txt", help="File with the script-writing prompt")
+    parser.add_argument("--script-out", default="script.txt")
+    parser.add_argument("--audio-dir", default="outputs/tts_stream")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--voice", action="append", default=[], metavar="SPEAKER=VOICE",
+                        help="Voice for speakers whose name contains SPEAKER (repeatable)")
+    parser.add_argument("--tts-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = ServiceConfig()
+    voices = dict(v.split("=", 1) for v in args.voice)
+
+    def voice_for(number: int, segment: Dict[str, str]) -> str:
+        for speaker, voice in voices.items():
+            if speaker.lower() in segment["speaker"].lower():
+                return voice
+        return "Kore"
+
+    with open(args.prompt, "r", encoding="utf-8") as f:
+        messages = [{"role": "user", "content": f.read()}]
+    os.makedirs(args.audio_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    first_audio = None
+    with open(args.script_out, "w", encoding="utf-8") as script:
+        def on_text(token: str):
+            script.write(token)
+            script.flush()
+
+        for number, segment, audio in stream_script_audio(TextService(config), TTSService(config), messages,
+                                                          voice_for=voice_for, tts_workers=args.tts_workers,
+                                                          on_text=on_text, model=args.model):
+            path = os.path.join(args.audio_dir, f"segment_{number:03d}.wav")
+            write_wav(path, audio)
+            if first_audio is None:
+                first_audio = time.perf_counter() - started
+                print(f"First audio after {first_audio:.1f}s")
+            print(f"Segment {number}: {path}")
+    print(f"Done in {time.perf_counter() - started:.1f}s; script saved to {args.script_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,42 @@
-from .base import ServiceConfig
-from .text_service import TextService
-from .image_service import ImageService
-from .image_service_enhanced import EnhancedImageService
-from .video_service import VeoVideoService
-from .tts_service import TTSService
+"""
+Service clients, loaded on first attribute access.
+
+`from services import TTSService` only imports tts_service (and requests), so
+workers that need a single service do not pay for the others.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+_LAZY_ATTRS = {
+    "ServiceConfig": ".base",
+    "TextService": ".text_service",
+    "ImageService": ".image_service",
+    "EnhancedImageService": ".image_service_enhanced",
+    "VeoVideoService": ".video_service",
+    "TTSService": ".tts_service",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from .base import ServiceConfig
+    from .text_service import TextService
+    from .image_service import ImageService
+    from .image_service_enhanced import EnhancedImageService
+    from .video_service import VeoVideoService
+    from .tts_service import TTSService
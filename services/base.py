@@ -3,18 +3,115 @@ Base clients and utilities for AI Th ̣fc Chi ̣bn services
 """
 
 import os
-from typing import Dict, Any, Optional
+import json
+import base64
+import time
+import socket
+from typing import TYPE_CHECKING, Dict, Any, Optional, Tuple
+
+from .metrics import METRICS, Metrics
+
+if TYPE_CHECKING:
+    import requests
 
 class ServiceConfig:
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 deadline=None, metrics: Optional[Metrics] = None):
+        """
+        Args:
+            connect_timeout: Seconds to establish a connection (default $AI_CONNECT_TIMEOUT or 10)
+            read_timeout: Seconds to wait for each read of a response (default $AI_READ_TIMEOUT or 300)
+            deadline: Optional deadline.Deadline for the job; caps both timeouts at the
+                time remaining and makes calls fail once it has passed
+            metrics: Registry for request metrics (default: the process-wide METRICS)
+        """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("AI_API_KEY")
         self.base_url = (base_url or os.getenv("AI_API_BASE") or "https://api.thucchien.ai").rstrip("/")
+        self.connect_timeout = connect_timeout or float(os.getenv("AI_CONNECT_TIMEOUT", "10"))
+        self.read_timeout = read_timeout or float(os.getenv("AI_READ_TIMEOUT", "300"))
+        self.deadline = deadline
+        self.metrics = metrics or METRICS
         if not self.api_key:
             raise ValueError("API key not configured. Set GEMINI_API_KEY or pass api_key explicitly.")
 
+    def timeout(self) -> Tuple[float, float]:
+        """(connect, read) timeout for the next request; raises DeadlineExceeded past the deadline"""
+        if self.deadline is None:
+            return self.connect_timeout, self.read_timeout
+        return self.deadline.timeout(self.connect_timeout, self.read_timeout)
+
+    def check_deadline(self):
+        if self.deadline is not None:
+            self.deadline.check()
+
+def abort_response(resp):
+    """
+    Close a streamed response from another thread. Closing alone waits for a read that
+    is blocked on the socket, so shut the socket down first to wake it.
+    """
+    sock = getattr(getattr(resp.raw, "_connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+    resp.close()
+
 class BaseService:
+    # "service" label of this client's metrics
+    metrics_name = "service"
+
     def __init__(self, config: ServiceConfig):
         self.config = config
+        self.metrics = config.metrics
+
+    def request(self, method: str, url: str, endpoint: str, **kwargs) -> "requests.Response":
+        """
+        requests.request() with the deadline-capped timeout, recording latency, status
+        and payload bytes under endpoint. Does not raise for HTTP error statuses; raises
+        DeadlineExceeded as soon as the job's deadline passes, even mid-request.
+        """
+        # Imported on first use: requests (with urllib3) is most of a service module's import time
+        import requests
+
+        kwargs.setdefault("timeout", self.timeout)
+        if "json" in kwargs:
+            # Serialize once here (as requests would) so the body size is known for free
+            kwargs["data"] = json.dumps(kwargs.pop("json"), allow_nan=False).encode("utf-8")
+        data = kwargs.get("data")
+        sent = len(data) if isinstance(data, (bytes, str)) else 0
+        started = time.perf_counter()
+        try:
+            if self.config.deadline is not None:
+                # Abandon the request as soon as the job is cancelled, not at the read timeout
+                resp = self.config.deadline.call(requests.request, method, url, **kwargs)
+            else:
+                resp = requests.request(method, url, **kwargs)
+        except (requests.exceptions.RequestException, TimeoutError):
+            self.metrics.record_request(self.metrics_name, endpoint, "error", time.perf_counter() - started, sent)
+            raise
+        elapsed = time.perf_counter() - started
+        if kwargs.get("stream"):
+            received = int(resp.headers.get("Content-Length") or 0)
+        else:
+            received = len(resp.content)
+        self.metrics.record_request(self.metrics_name, endpoint, str(resp.status_code), elapsed, sent, received)
+        return resp
+
+    def record_retry(self, endpoint: str):
+        self.metrics.inc("retries_total", service=self.metrics_name, endpoint=endpoint)
+
+    def decode_b64(self, data: str, endpoint: str) -> bytes:
+        """base64.b64decode, counting the decoded bytes under endpoint"""
+        decoded = base64.b64decode(data)
+        self.metrics.inc("decoded_bytes_total", len(decoded), service=self.metrics_name, endpoint=endpoint)
+        return decoded
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """requests timeout for the next call, capped by the job deadline"""
+        return self.config.timeout()
 
     @property
     def bearer_headers(self) -> Dict[str, str]:
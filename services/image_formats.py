@@ -0,0 +1,160 @@
+"""
+Request-shape negotiation for /images/generations.
+
+Some backends accept the native body ({"prompt", "model", "n", "size"/"aspect_ratio"}),
+others only the OpenAI-style variant with the options under "extra_body". The shape
+that worked is remembered per (base_url, model), so after the first image every call
+is a single request with the known-good body instead of a guaranteed failure plus
+a retry.
+"""
+
+import json
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
+
+# A (connect, read) timeout, or a callable returning one for each attempt
+Timeout = Union[Tuple[float, float], Callable[[], Tuple[float, float]], None]
+
+NATIVE = "native"
+EXTRA_BODY = "extra_body"
+SHAPES = (NATIVE, EXTRA_BODY)
+
+# Status codes meaning "this backend does not take this body", as opposed to an outage
+REJECTED_STATUS = {400, 404, 405, 415, 422}
+
+
+def build_body(shape: str, prompt: str, model: str, n: int, size: Optional[str],
+               aspect_ratio: Optional[str]) -> Dict[str, Any]:
+    if shape == NATIVE:
+        body: Dict[str, Any] = {"prompt": prompt, "model": model, "n": n}
+        options = body
+    else:
+        body = {"model": model, "prompt": prompt, "n": str(n), "extra_body": {}}
+        options = body["extra_body"]
+    if aspect_ratio:
+        options["aspect_ratio"] = aspect_ratio
+    elif size:
+        options["size"] = size
+    return body
+
+
+class FormatCache:
+    """Known-good request shape per (base_url, model), optionally persisted to a JSON file"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._shapes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._shapes = json.load(f)
+
+    @staticmethod
+    def _key(base_url: str, model: str) -> str:
+        return f"{base_url}|{model}"
+
+    def get(self, base_url: str, model: str) -> Optional[str]:
+        with self._lock:
+            return self._shapes.get(self._key(base_url, model))
+
+    def remember(self, base_url: str, model: str, shape: str):
+        with self._lock:
+            if self._shapes.get(self._key(base_url, model)) == shape:
+                return
+            self._shapes[self._key(base_url, model)] = shape
+            self._save()
+
+    def forget(self, base_url: str, model: str):
+        with self._lock:
+            if self._shapes.pop(self._key(base_url, model), None) is not None:
+                self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._shapes, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# Shared by every service instance in the process; set IMAGE_FORMAT_CACHE to persist it
+FORMAT_CACHE = FormatCache(os.getenv("IMAGE_FORMAT_CACHE"))
+
+
+def _post(url: str, headers: Dict[str, str], body: Dict[str, Any],
+          timeout: Timeout = None, service=None) -> Tuple[Optional[requests.Response], str]:
+    """(response, error text); response is None when the request itself failed"""
+    if callable(timeout):
+        timeout = timeout()  # time left now, not when the first attempt started
+    try:
+        if service is not None:
+            resp = service.request("POST", url, "images/generations", headers=headers, json=body, timeout=timeout)
+        else:
+            resp = requests.post(url, headers=headers, json=body, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        return None, str(e)
+    return resp, f"{resp.status_code} {resp.text}"
+
+
+def _ok(resp: Optional[requests.Response]) -> bool:
+    return resp is not None and 200 <= resp.status_code < 300
+
+
+def negotiate_generate(base_url: str, headers: Dict[str, str], prompt: str, model: str, n: int,
+                       size: Optional[str], aspect_ratio: Optional[str],
+                       cache: Optional[FormatCache] = None, hedge: bool = False,
+                       timeout: Timeout = None, service=None) -> Dict[str, Any]:
+    """
+    POST /images/generations with the body shape known to work for (base_url, model).
+
+    Unknown backends are probed native-first, or with hedge=True by sending both shapes
+    at once and taking the first success (costs a second image when both shapes work,
+    but only on the first call). A known shape that starts getting rejected is forgotten
+    and the backend is probed again. timeout is the requests (connect, read) timeout,
+    or a callable (such as ServiceConfig.timeout) evaluated again for every attempt so
+    fallback and hedge probes only get the time left before the deadline; service
+    (a BaseService) records each attempt and retry in its metrics.
+    """
+    cache = cache or FORMAT_CACHE
+    url = f"{base_url}/images/generations"
+    bodies = {shape: build_body(shape, prompt, model, n, size, aspect_ratio) for shape in SHAPES}
+    errors: List[str] = []
+
+    known = cache.get(base_url, model)
+    if known:
+        resp, error = _post(url, headers, bodies[known], timeout, service)
+        if _ok(resp):
+            return resp.json()
+        if resp is None or resp.status_code not in REJECTED_STATUS:
+            raise requests.HTTPError(f"Image generation failed ({known}): {error}")
+        cache.forget(base_url, model)
+        errors.append(f"{known}: {error}")
+    candidates = [shape for shape in SHAPES if shape != known]
+
+    if hedge and len(candidates) > 1:
+        pool = ThreadPoolExecutor(max_workers=len(candidates))
+        try:
+            futures = {pool.submit(_post, url, headers, bodies[shape], timeout, service): shape
+                       for shape in candidates}
+            for future in as_completed(futures):
+                resp, error = future.result()
+                if _ok(resp):
+                    cache.remember(base_url, model, futures[future])
+                    return resp.json()
+                errors.append(f"{futures[future]}: {error}")
+        finally:
+            pool.shutdown(wait=False)  # do not wait for the slower duplicate
+    else:
+        for shape in candidates:
+            if errors and service is not None:
+                service.record_retry("images/generations")
+            resp, error = _post(url, headers, bodies[shape], timeout, service)
+            if _ok(resp):
+                cache.remember(base_url, model, shape)
+                return resp.json()
+            errors.append(f"{shape}: {error}")
+    raise requests.HTTPError(f"Image generation failed: {' | '.join(errors)}")
@@ -6,6 +6,7 @@ This module provides advanced image generation capabilities including:
 - Anti-caching mechanisms
 - URL response handling
 - Multiple generation methods
+- Reference sets generated as one batched operation
 
 Use this service when you need:
 - More creative/prompted image generation
@@ -14,13 +15,15 @@ Use this service when you need:
 - Multi-modal conversations with images
 """
 
-import json
 import base64
 import requests
 import random
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, Any, List, Optional, Tuple
 
 from .base import BaseService, ServiceConfig
+from .image_formats import FORMAT_CACHE, FormatCache, negotiate_generate
 
 class EnhancedImageService(BaseService):
     """
@@ -29,8 +32,11 @@ class EnhancedImageService(BaseService):
     Provides both standard and chat-based image generation methods.
     """
     
-    def __init__(self, config: ServiceConfig):
+    metrics_name = "image"
+
+    def __init__(self, config: ServiceConfig, format_cache: Optional[FormatCache] = None):
         super().__init__(config)
+        self.format_cache = format_cache or FORMAT_CACHE
 
     def generate_via_chat(self, prompt: str, model: str = "gemini-2.5-flash-image-preview") -> bytes:
         """
@@ -64,7 +70,7 @@ class EnhancedImageService(BaseService):
         }
         
         try:
-            response = requests.post(url, headers=self.bearer_headers, json=payload)
+            response = self.request("POST", url, "chat/completions", headers=self.bearer_headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -90,7 +96,7 @@ class EnhancedImageService(BaseService):
                 encoded = image_url
             
             # Decode base64 image data
-            image_bytes = base64.b64decode(encoded)
+            image_bytes = self.decode_b64(encoded, "chat/completions")
             return image_bytes
             
         except requests.exceptions.RequestException as e:
@@ -137,7 +143,8 @@ class EnhancedImageService(BaseService):
         return self.generate(enhanced_prompt, model=model, **kwargs)
 
     def generate(self, prompt: str, model: str = "imagen-4", n: int = 1, 
-                size: Optional[str] = None, aspect_ratio: Optional[str] = None) -> Dict[str, Any]:
+                size: Optional[str] = None, aspect_ratio: Optional[str] = None,
+                hedge: bool = False) -> Dict[str, Any]:
         """
         Standard image generation (inherited from base ImageService).
         
@@ -147,34 +154,13 @@ class EnhancedImageService(BaseService):
         - For standard image generation
         - When you need specific size/aspect ratio control
         - When working with dedicated image models
+
+        The request body shape (native or OpenAI-style extra_body) that the backend
+        accepts is remembered per (base_url, model); with hedge=True the first call
+        sends both shapes at once instead of one after the other.
         """
-        url = f"{self.config.base_url}/images/generations"
-        body: Dict[str, Any] = {"prompt": prompt, "model": model, "n": n}
-        if aspect_ratio:
-            body["aspect_ratio"] = aspect_ratio
-        elif size:
-            body["size"] = size
-            
-        try:
-            resp = requests.post(url, headers=self.bearer_headers, json=body)
-            resp.raise_for_status()
-            return resp.json()
-        except requests.exceptions.RequestException as e:
-            # Try fallback OpenAI-style extra_body
-            try_body = {
-                "model": model,
-                "prompt": prompt,
-                "n": str(n),
-                "extra_body": {}
-            }
-            if aspect_ratio:
-                try_body["extra_body"]["aspect_ratio"] = aspect_ratio
-            elif size:
-                try_body["extra_body"]["size"] = size
-                
-            resp2 = requests.post(url, headers=self.bearer_headers, json=try_body)
-            resp2.raise_for_status()
-            return resp2.json()
+        return negotiate_generate(self.config.base_url, self.bearer_headers, prompt, model, n,
+                                  size, aspect_ratio, self.format_cache, hedge, timeout=self.config.timeout, service=self)
 
     def generate_and_save_chat(self, prompt: str, output_path: str, 
                               model: str = "gemini-2.5-flash-image-preview") -> str:
@@ -223,7 +209,7 @@ class EnhancedImageService(BaseService):
         if response.get("data"):
             b64_data = response["data"][0].get("b64_json")
             if b64_data:
-                image_bytes = base64.b64decode(b64_data)
+                image_bytes = self.decode_b64(b64_data, "images/generations")
                 with open(output_path, "wb") as f:
                     f.write(image_bytes)
                 return output_path
@@ -232,6 +218,83 @@ class EnhancedImageService(BaseService):
         else:
             raise ValueError("No data in response")
 
+    def generate_reference_set(self, references: Dict[str, Tuple[str, str]], method: str = "chat",
+                               model: Optional[str] = None, max_workers: int = 4,
+                               limit: Optional[Callable[[], ContextManager]] = None,
+                               on_saved: Optional[Callable[[str, str], None]] = None,
+                               **kwargs) -> Dict[str, str]:
+        """
+        Generate and save a set of reference images (characters, background) at once.
+
+        Args:
+            references: name -> (prompt, output path)
+            method: "chat" sends every prompt to /chat/completions, "standard" to
+                /images/generations; either way one request per reference, concurrently
+            model: Model to use (defaults as in generate_and_save_chat / generate)
+            max_workers: Requests in flight at the same time
+            limit: Context manager factory entered around each request
+                (e.g. StageLimits.network)
+            on_saved: Called with (name, path) as soon as each file is written
+            **kwargs: Additional parameters for generate() ("standard" only)
+
+        Returns:
+            name -> saved path
+
+        Each worker decodes and writes its own file, so the writes run in parallel too.
+        If some references fail, the others are still saved (and reported to on_saved)
+        before a RuntimeError naming the failures is raised.
+
+        When to use:
+        - When several independent references are needed before anything else can start
+        - When the prompts only differ by description
+        """
+        if method not in ("chat", "standard"):
+            raise ValueError(f"Unknown reference method '{method}', expected 'chat' or 'standard'")
+        limit = limit or nullcontext
+
+        def chat(name: str) -> str:
+            prompt, output_path = references[name]
+            with limit():
+                image_bytes = self.generate_via_chat(prompt, model or "gemini-2.5-flash-image-preview")
+            with open(output_path, "wb") as f:
+                f.write(image_bytes)
+            return output_path
+
+        def standard(name: str) -> str:
+            prompt, output_path = references[name]
+            with limit():
+                response = self.generate(prompt, model=model or "imagen-4", **kwargs)
+            data = response.get("data") or []
+            b64_data = data[0].get("b64_json") if data else None
+            if not b64_data:
+                raise ValueError("No b64_json in response")
+            with open(output_path, "wb") as f:
+                f.write(self.decode_b64(b64_data, "images/generations"))
+            return output_path
+
+        saved: Dict[str, str] = {}
+        errors: List[str] = []
+        if not references:
+            return saved
+        worker = chat if method == "chat" else standard
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(references)))) as pool:
+            futures = {pool.submit(worker, name): name for name in references}
+            for future in as_completed(futures):
+                try:
+                    output_path = future.result()
+                except TimeoutError:
+                    raise  # deadline expired: the whole job is over, not one reference
+                except (requests.HTTPError, ValueError, OSError) as e:
+                    errors.append(f"{futures[future]}: {e}")
+                    continue
+                name = futures[future]
+                saved[name] = output_path
+                if on_saved:
+                    on_saved(name, output_path)
+        if errors:
+            raise RuntimeError(f"Reference generation failed: {' | '.join(errors)}")
+        return {name: saved[name] for name in references}
+
     @staticmethod
     def save_b64_to_file(b64_json: str, output_path: str) -> str:
         """Save base64 encoded image to file."""
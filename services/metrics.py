@@ -0,0 +1,222 @@
+"""
+Request metrics for the service clients.
+
+BaseService.request() records, per (service, endpoint): request count by status code
+(or "error" when no response arrived), latency histogram, request/response payload
+bytes and retries. Services add the bytes of base64 payloads they decode and the
+number of status polls per long-running operation.
+
+Everything lands in the process-wide METRICS registry: a dict update under one lock
+per request, so recording costs microseconds next to calls that take seconds. Export
+it in the Prometheus text format with serve() (HTTP /metrics) or write_textfile()
+(for node_exporter's textfile collector).
+"""
+
+import os
+import bisect
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; TTS/chat calls take seconds, image and Veo downloads up to minutes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+POLL_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 90)
+
+PREFIX = "trinova_service_"
+_HELP = {
+    "requests_total": "Requests by service, endpoint and HTTP status (\"error\" when no response arrived)",
+    "request_seconds": "Request latency including the response body (headers only for streamed responses)",
+    "request_bytes_total": "Request body bytes sent",
+    "response_bytes_total": "Response body bytes received",
+    "decoded_bytes_total": "Bytes decoded from base64 payloads",
+    "retries_total": "Requests repeated after a failed attempt",
+    "operation_polls": "Status polls until a long-running operation finished",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def record_request(self, service: str, endpoint: str, status: str, seconds: float,
+                       sent: int = 0, received: int = 0):
+        """One finished request; all series updated under a single lock acquisition"""
+        labels = (("endpoint", endpoint), ("service", service))  # sorted, as inc() would
+        updates = ((("requests_total", labels + (("status", status),)), 1),
+                   (("request_bytes_total", labels), sent),
+                   (("response_bytes_total", labels), received))
+        with self._lock:
+            for key, value in updates:
+                self._counters[key] = self._counters.get(key, 0) + value
+            histogram = self._histograms.get(("request_seconds", labels))
+            if histogram is None:
+                histogram = self._histograms[("request_seconds", labels)] = _Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+    def value(self, name: str, **labels: str) -> float:
+        """Current value of a counter (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Picklable copy of every series, e.g. to send a child process's metrics to its parent"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()},
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        """Add the series of a snapshot() to this registry"""
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in snapshot["histograms"].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram(buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                                for key, h in self._histograms.items())
+        lines: List[str] = []
+        seen = set()
+
+        def header(name: str, kind: str):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total:g}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> str:
+        """Atomically write render() to path (node_exporter textfile collector)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve GET /metrics on a daemon thread; returns the server (call shutdown() to stop)"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only for exporting processes
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every service instance in the process
+METRICS = Metrics()
+
+
+def export_metrics(port: Optional[int] = None, textfile: Optional[str] = None, interval_sec: float = 15.0,
+                   metrics: Optional[Metrics] = None) -> Callable[[], None]:
+    """
+    Start the requested exporters: an HTTP /metrics endpoint on port and/or a textfile
+    rewritten every interval_sec. Returns a function that stops them and writes the
+    textfile one last time.
+    """
+    metrics = metrics or METRICS
+    server = metrics.serve(port) if port else None
+    stop = threading.Event()
+    writer = None
+    if textfile:
+        def loop():
+            while not stop.wait(interval_sec):
+                metrics.write_textfile(textfile)
+
+        writer = threading.Thread(target=loop, daemon=True)
+        writer.start()
+
+    def shutdown():
+        stop.set()
+        if writer is not None:
+            writer.join()
+            metrics.write_textfile(textfile)
+        if server is not None:
+            server.shutdown()
+
+    return shutdown
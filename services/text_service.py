@@ -1,23 +1,155 @@
 import json
-import requests
-from typing import List, Dict, Any, Optional
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 
 from .base import BaseService, ServiceConfig
 
+
+class ResponseCache:
+    """Thread-safe LRU of chat completions with a time-to-live"""
+
+    def __init__(self, max_entries: int = 512, ttl_sec: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(body: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl_sec is not None and time.monotonic() - entry[0] > self.ttl_sec):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 class TextService(BaseService):
-    def __init__(self, config: ServiceConfig):
+    metrics_name = "text"
+
+    def __init__(self, config: ServiceConfig, cache: Optional[ResponseCache] = None, max_workers: int = 4):
+        """
+        Args:
+            cache: Reuse answers to identical deterministic requests (temperature 0 or unset)
+            max_workers: Concurrent requests in chat_batch
+        """
         super().__init__(config)
+        self.cache = cache
+        self.max_workers = max_workers
 
-    def chat(self, messages: List[Dict[str, str]], model: str = "gemini-2.5-flash", temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
-        url = f"{self.config.base_url}/chat/completions"
+    def _chat_body(self, messages: List[Dict[str, str]], model: str, temperature: Optional[float],
+                   max_tokens: Optional[int]) -> Dict[str, Any]:
         body: Dict[str, Any] = {"model": model, "messages": messages}
         if temperature is not None:
             body["temperature"] = temperature
         if max_tokens is not None:
             body["max_tokens"] = max_tokens
-        resp = requests.post(url, headers=self.bearer_headers, data=json.dumps(body))
+        return body
+
+    @staticmethod
+    def _is_deterministic(body: Dict[str, Any]) -> bool:
+        """Temperature 0 or unset; sampled answers are never reused"""
+        return body.get("temperature") in (None, 0)
+
+    def _cache_key(self, body: Dict[str, Any]) -> Optional[str]:
+        """Cache key for deterministic requests only"""
+        if self.cache is None or not self._is_deterministic(body):
+            return None
+        return self.cache.key(body)
+
+    def chat(self, messages: List[Dict[str, str]], model: str = "gemini-2.5-flash", temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
+        url = f"{self.config.base_url}/chat/completions"
+        body = self._chat_body(messages, model, temperature, max_tokens)
+        key = self._cache_key(body)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        resp = self.request("POST", url, "chat/completions", headers=self.bearer_headers, json=body)
         resp.raise_for_status()
         data = resp.json()
-        return data["choices"][0]["message"]["content"]
+        content = data["choices"][0]["message"]["content"]
+        if key is not None:
+            self.cache.put(key, content)
+        return content
+
+    def chat_batch(self, message_lists: List[List[Dict[str, str]]], model: str = "gemini-2.5-flash", temperature: Optional[float] = None, max_tokens: Optional[int] = None, max_workers: Optional[int] = None) -> List[str]:
+        """
+        Run several independent chat() calls concurrently; results are in input order.
 
+        At most max_workers (default self.max_workers) requests are in flight. Identical
+        deterministic requests in the batch are sent once, with or without a cache. The
+        first failure is raised after the other requests have finished.
+        """
+        unique: Dict[str, List[Dict[str, str]]] = {}
+        slots: List[str] = []
+        for n, messages in enumerate(message_lists):
+            body = self._chat_body(messages, model, temperature, max_tokens)
+            key = ResponseCache.key(body) if self._is_deterministic(body) else f"#{n}"
+            unique.setdefault(key, messages)
+            slots.append(key)
+        workers = max(1, min(max_workers or self.max_workers, len(unique) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(self.chat, messages, model, temperature, max_tokens)
+                       for key, messages in unique.items()}
+        return [futures[key].result() for key in slots]
 
+    def chat_stream(self, messages: List[Dict[str, str]], model: str = "gemini-2.5-flash", temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                    on_response: Optional[Callable[[Any], None]] = None) -> Iterator[str]:
+        """
+        Same request as chat() with "stream": true; yields content deltas as the
+        server-sent events arrive instead of waiting for the whole completion.
+
+        on_response receives the open response, so another thread can stop the stream
+        with services.base.abort_response without waiting for the next event.
+        """
+        url = f"{self.config.base_url}/chat/completions"
+        body = self._chat_body(messages, model, temperature, max_tokens)
+        body["stream"] = True
+        headers = {**self.bearer_headers, "Accept": "text/event-stream"}
+        with self.request("POST", url, "chat/completions:stream", headers=headers, json=body, stream=True) as resp:
+            if on_response:
+                on_response(resp)
+            resp.raise_for_status()
+            resp.encoding = "utf-8"  # SSE is always UTF-8; requests would assume latin-1 for text/*
+            for line in resp.iter_lines(decode_unicode=True):
+                # SSE: "data: {...}" per chunk, blank keep-alive lines, "data: [DONE]" at the end
+                self.config.check_deadline()
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    return
+                choices = json.loads(payload).get("choices") or []
+                if not choices:
+                    continue
+                delta = choices[0].get("delta") or {}
+                if delta.get("content"):
+                    yield delta["content"]
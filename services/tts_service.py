@@ -1,5 +1,3 @@
-import requests
-import base64
 from typing import Optional, List, Dict, Any
 
 from .base import BaseService, ServiceConfig
@@ -12,6 +10,8 @@ class TTSService(BaseService):
     with x-goog-api-key authentication as per documentation.
     """
     
+    metrics_name = "tts"
+
     def __init__(self, config: ServiceConfig):
         super().__init__(config)
         self.default_model = "gemini-2.5-flash-preview-tts"
@@ -28,6 +28,8 @@ class TTSService(BaseService):
         Returns:
             Audio data as bytes
         """
+        import requests  # deferred, see BaseService.request
+
         model = model or self.default_model
         url = f"{self.config.base_url}/gemini/v1beta/models/{model}:generateContent"
         
@@ -48,7 +50,7 @@ class TTSService(BaseService):
         }
         
         try:
-            response = requests.post(url, headers=self.google_headers, json=payload)
+            response = self.request("POST", url, "generateContent", headers=self.google_headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -72,7 +74,7 @@ class TTSService(BaseService):
                 raise ValueError("No base64 data in TTS response")
             
             # Decode base64 audio data
-            audio_bytes = base64.b64decode(base64_data)
+            audio_bytes = self.decode_b64(base64_data, "generateContent")
             return audio_bytes
             
         except requests.exceptions.RequestException as e:
@@ -92,6 +94,8 @@ class TTSService(BaseService):
         Returns:
             Audio data as bytes
         """
+        import requests  # deferred, see BaseService.request
+
         model = model or self.default_model
         url = f"{self.config.base_url}/gemini/v1beta/models/{model}:generateContent"
         
@@ -121,7 +125,7 @@ class TTSService(BaseService):
         }
         
         try:
-            response = requests.post(url, headers=self.google_headers, json=payload)
+            response = self.request("POST", url, "generateContent", headers=self.google_headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -145,7 +149,7 @@ class TTSService(BaseService):
                 raise ValueError("No base64 data in multi-speaker TTS response")
             
             # Decode base64 audio data
-            audio_bytes = base64.b64decode(base64_data)
+            audio_bytes = self.decode_b64(base64_data, "generateContent")
             return audio_bytes
             
         except requests.exceptions.RequestException as e:
@@ -1,10 +1,13 @@
+import os
 import time
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, MutableMapping, Optional
 
 from .base import BaseService, ServiceConfig
+from .metrics import POLL_BUCKETS
 
 class VeoVideoService(BaseService):
+    metrics_name = "video"
+
     def __init__(self, config: ServiceConfig):
         super().__init__(config)
 
@@ -19,24 +22,30 @@ class VeoVideoService(BaseService):
                 "personGeneration": person_generation,
             },
         }
-        resp = requests.post(url, headers=self.google_headers, json=body)
+        resp = self.request("POST", url, "predictLongRunning", headers=self.google_headers, json=body)
         resp.raise_for_status()
         data = resp.json()
         return data["name"]
 
     def status(self, operation_name: str) -> Dict[str, Any]:
         url = f"{self.config.base_url}/gemini/v1beta/{operation_name}"
-        resp = requests.get(url, headers=self.google_headers)
+        resp = self.request("GET", url, "operations", headers=self.google_headers)
         resp.raise_for_status()
         return resp.json()
 
     def wait_done(self, operation_name: str, timeout_sec: int = 900, interval_sec: int = 10) -> Dict[str, Any]:
         start = time.time()
+        polls = 0
         while time.time() - start < timeout_sec:
             s = self.status(operation_name)
+            polls += 1
             if s.get("done"):
+                self.metrics.observe("operation_polls", polls, buckets=POLL_BUCKETS, service=self.metrics_name)
                 return s
-            time.sleep(interval_sec)
+            if self.config.deadline is not None:
+                self.config.deadline.sleep(interval_sec)  # raises once the job deadline passes
+            else:
+                time.sleep(interval_sec)
         raise TimeoutError("Veo operation timed out")
 
     def download(self, status_response: Dict[str, Any], output_path: str) -> str:
@@ -50,9 +59,32 @@ class VeoVideoService(BaseService):
             raise ValueError("No video uri in status response")
         file_id = uri.split("/files/")[1].split(":download")[0]
         download_url = f"{self.config.base_url}/gemini/download/v1beta/files/{file_id}:download?alt=media"
-        resp = requests.get(download_url, headers=self.google_headers)
+        resp = self.request("GET", download_url, "download", headers=self.google_headers)
         resp.raise_for_status()
         with open(output_path, "wb") as f:
             f.write(resp.content)
         return output_path
 
+    def generate(self, prompt: str, output_path: str, checkpoint: Optional[MutableMapping[str, Any]] = None,
+                 key: str = "veo", timeout_sec: int = 900, **start_kwargs) -> str:
+        """
+        Start, wait for and download one clip, resuming from a checkpoint when possible.
+
+        The operation name is stored in checkpoint[f"{key}:operation"] as soon as the
+        operation starts, so a restarted worker resumes polling the same operation
+        instead of paying for a new one.
+        """
+        if checkpoint is not None:
+            done_path = checkpoint.get(f"{key}:file")
+            if done_path and os.path.exists(done_path):
+                return done_path
+        operation_name = checkpoint.get(f"{key}:operation") if checkpoint is not None else None
+        if not operation_name:
+            operation_name = self.start(prompt, **start_kwargs)
+            if checkpoint is not None:
+                checkpoint[f"{key}:operation"] = operation_name
+        status = self.wait_done(operation_name, timeout_sec=timeout_sec)
+        self.download(status, output_path)
+        if checkpoint is not None:
+            checkpoint[f"{key}:file"] = output_path
+        return output_path
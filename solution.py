@@ -1,22 +1,16 @@
 import os
 import math
 import re
-from dotenv import load_dotenv
-from moviepy.editor import (
-    VideoFileClip,
-    AudioFileClip,
-    ImageClip,
-    CompositeVideoClip,
-    concatenate_videoclips,
-)
-import moviepy.video.fx.all as vfx
-
-# Assuming the services and output_manager are in the same directory or in python path
-from services.base import ServiceConfig
-from services.image_service_enhanced import EnhancedImageService
-from services.tts_service import TTSService
-from services.video_service import VeoVideoService
+import hashlib
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, List, MutableMapping, Optional, Tuple
+
+# Assuming the services and output_manager are in the same directory or in python path.
+# moviepy, dotenv and the service clients are imported inside solve() so that importing
+# this module (e.g. for parse_segments, or from a podcast-only worker) stays fast.
 from output_manager import OutputManager
+from stage_limits import StageLimits, UNLIMITED
+from deadline import Deadline, check_deadline, current_deadline
 
 
 def parse_segments(script):
@@ -42,19 +36,241 @@ def parse_segments(script):
     return segments
 
 
-def solve(output_mgr: OutputManager) -> str:
+def _is_checkpointed(checkpoint: Optional[MutableMapping[str, Any]], key: str) -> bool:
+    """True if a previous attempt of this job already produced the file recorded under key."""
+    if checkpoint is None:
+        return False
+    path = checkpoint.get(key)
+    return bool(path) and os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def _tts_cache_path(cache_dir: str, model: str, voice_name: str, text: str) -> str:
+    key = hashlib.sha256(f"{model}|{voice_name}|{text}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, f"tts_{key}.bin")
+
+
+def render_still_segment(i: int, image_path: str, audio_path: Optional[str], video_path: str, profile,
+                         limits: Optional[StageLimits] = None) -> str:
+    """
+    Step 3 default path: segment i as a still image for the length of its audio (8 s of
+    silence without audio), encoded with moviepy using the RenderProfile profile.
+    """
+    from moviepy.editor import AudioFileClip, ImageClip
+    from ffmpeg_utils import register_moviepy
+
+    register_moviepy()
+    limits = limits or UNLIMITED
+    audio_clip = None
+    duration = 8  # Default duration for silent clips
+
+    if audio_path:
+        try:
+            audio_clip = AudioFileClip(audio_path)
+            duration = audio_clip.duration
+            print(f"Creating video for segment {i} with audio...")
+            image_clip = ImageClip(image_path).set_duration(duration)
+            video_with_audio = image_clip.set_audio(audio_clip)
+        except Exception as e:
+            print(f"Error processing audio for segment {i}: {e}")
+            # Fallback to silent clip
+            image_clip = ImageClip(image_path).set_duration(duration)
+            video_with_audio = image_clip.set_audio(None)
+    else:
+        # Create a silent video clip
+        print(f"Creating silent video for segment {i}...")
+        image_clip = ImageClip(image_path).set_duration(duration)
+        video_with_audio = image_clip.set_audio(None)
+
+    with limits.cpu():
+        try:
+            video_with_audio.write_videofile(video_path, **profile.moviepy_kwargs())
+        except Exception:
+            check_deadline()  # report a killed encode as DeadlineExceeded, not a broken pipe
+            raise
+    # Clean up clips
+    if audio_clip:
+        audio_clip.close()
+    image_clip.close()
+    return video_path
+
+
+def compose_final(video_paths: List[str], output_path: str, profile, overlay: str = "gif",
+                  gif_path: Optional[str] = None, limits: Optional[StageLimits] = None) -> str:
+    """
+    Step 4 default path: concatenate the segments with moviepy and composite the overlay
+    ("gif" from gif_path, a flat "stub" box, or "none") at the top left, 15% of the video
+    height, encoded with the RenderProfile profile.
+    """
+    from moviepy.editor import ColorClip, CompositeVideoClip, VideoFileClip, concatenate_videoclips
+    import moviepy.video.fx.all as vfx
+    from ffmpeg_utils import register_moviepy
+
+    register_moviepy()
+    limits = limits or UNLIMITED
+    clips = [VideoFileClip(p) for p in video_paths]
+    final_video = concatenate_videoclips(clips, method="compose")
+
+    gif_clip = None
+    # The concat keeps the reference image size, which need not match the profile
+    overlay_height = int(final_video.h * 0.15)
+    if overlay == "gif":
+        print("Overlaying GIF...")
+        gif_clip = (
+            VideoFileClip(gif_path, has_mask=True)
+            .fx(vfx.loop, duration=final_video.duration)
+            .resize(height=overlay_height)
+            .set_position(("left", "top"))
+        )
+    elif overlay == "stub":
+        gif_clip = (
+            ColorClip((overlay_height, overlay_height), color=(218, 37, 29), duration=final_video.duration)
+            .set_opacity(0.6)
+            .set_position(("left", "top"))
+        )
+
+    final_composite = CompositeVideoClip([final_video, gif_clip]) if gif_clip else final_video
+
+    print(f"Writing final video to {output_path}...")
+    with limits.cpu():
+        try:
+            final_composite.write_videofile(output_path, **profile.moviepy_kwargs())
+        except Exception:
+            check_deadline()
+            raise
+
+    # --- CLEANUP ---
+    for c in clips:
+        c.close()
+    final_video.close()
+    if gif_clip:
+        gif_clip.close()
+        final_composite.close()
+    return output_path
+
+
+def solve(output_mgr: OutputManager, script_path: str = "script.txt", total_duration: int = 240,
+          solution_number: int = 1, solution_name: str = "Vietnamese Video",
+          limits: Optional[StageLimits] = None,
+          checkpoint: Optional[MutableMapping[str, Any]] = None,
+          assembly: str = "compose", overlap: bool = False, render_workers: int = 1,
+          render_cache: bool = False, frame_fit: Optional[str] = None,
+          draft: bool = False, overlay: Optional[str] = None, reuse_audio: Optional[bool] = None,
+          splice: bool = False, deadline: Optional[Deadline] = None, profile_memory: bool = False,
+          farm_dir: Optional[str] = None, audio_post: Optional[str] = None) -> str:
     """
     Main function to generate the Vietnamese video podcast.
+
+    Args:
+        output_mgr: Output manager for folders, metadata and the run journal
+        script_path: Script file with [Segment N] blocks
+        total_duration: Target duration in seconds (8 seconds per segment)
+        solution_number: Solution folder number
+        solution_name: Solution folder name
+        limits: Shared network/CPU stage limits when running inside a worker pool
+        checkpoint: Durable per-job mapping (e.g. JobQueue.checkpoint) used to skip paid
+            calls that a previous attempt of the same job already completed
+        assembly: "compose" builds the final video with moviepy (all segments open at once);
+            "stream" uses the bounded-memory StreamingCompositor
+        overlap: Run TTS, segment rendering and assembly as an overlapped pipeline instead
+            of one barrier per step; with assembly="stream" the final encode starts on the
+            first finished segments
+        render_workers: Segments rendered concurrently when overlap is enabled
+        render_cache: Encode each distinct reference image once (StillRenderCache) and build
+            segments by looping that stream and muxing in their audio
+        frame_fit: "letterbox" or "crop" to pre-normalize reference images to 1920x1080
+            (cached by content hash) before rendering; None renders them as generated
+        draft: Preview render at 640x360, at most 12 fps with the ultrafast preset, written to
+            output_draft.mp4 and not saved as the solution's final file; existing reference
+            images are reused and frames default to letterbox so nothing is scaled per frame
+        overlay: "gif" (default), "stub" (flat box where the GIF sits; the draft default)
+            or "none"
+        reuse_audio: Reuse TTS audio cached under outputs/tts_cache for unchanged dialogue
+            lines, so drafts and the final render share the same audio; defaults to draft,
+            so final renders only use the cache when asked to
+        splice: Re-render only the segments whose dialogue changed since the last streamed
+            final (per segments.json) and splice them into output_final.mp4 on keyframe
+            boundaries; falls back to a full render when that is not possible
+        deadline: Job deadline; caps every service call's connect/read timeout, kills
+            running ffmpeg encodes when it passes and raises DeadlineExceeded
+        profile_memory: Sample RSS (including child ffmpeg processes) and the Python heap
+            per stage; peaks go into each stage step, metadata.json and the run journal
+        farm_dir: Work directory shared with render_farm.py workers on other hosts; the
+            Step 3 segment renders and, with assembly="stream", the overlay pass run there
+        audio_post: "clean" trims silence and normalizes loudness of every TTS line in memory
+            (audio_post.AudioPostProcessor); "fit" also time-stretches each line towards its
+            8 s slot. Lines are then written as WAV; None keeps the raw TTS bytes
     """
+    with ExitStack() as stack:
+        if deadline is not None and current_deadline() is not deadline:
+            # Make it current so every ffmpeg process started below is registered with it
+            stack.enter_context(deadline.activate())
+        if profile_memory and output_mgr.memory_profiler is None:
+            stack.enter_context(_memory_profile(output_mgr, solution_number))
+        return _solve(
+            output_mgr, script_path=script_path, total_duration=total_duration,
+            solution_number=solution_number, solution_name=solution_name, limits=limits,
+            checkpoint=checkpoint, assembly=assembly, overlap=overlap, render_workers=render_workers,
+            render_cache=render_cache, frame_fit=frame_fit, draft=draft, overlay=overlay,
+            reuse_audio=reuse_audio, splice=splice, deadline=deadline, farm_dir=farm_dir,
+            audio_post=audio_post,
+        )
+
+
+@contextmanager
+def _memory_profile(output_mgr: OutputManager, solution_number: int):
+    """Profile memory for one solve() call; the summary goes to the run journal"""
+    from memory_profile import MemoryProfiler, print_summary
+
+    profiler = output_mgr.memory_profiler = MemoryProfiler().start()
+    try:
+        yield profiler
+    finally:
+        output_mgr.memory_profiler = None
+        profiler.stop()
+        summary = profiler.summary()
+        output_mgr.journal.record("memory", solution_number=solution_number, **summary)
+        print_summary(summary)
+
+
+def _solve(output_mgr: OutputManager, script_path: str, total_duration: int, solution_number: int,
+           solution_name: str, limits: Optional[StageLimits], checkpoint: Optional[MutableMapping[str, Any]],
+           assembly: str, overlap: bool, render_workers: int, render_cache: bool, frame_fit: Optional[str],
+           draft: bool, overlay: Optional[str], reuse_audio: Optional[bool], splice: bool,
+           deadline: Optional[Deadline], farm_dir: Optional[str], audio_post: Optional[str]) -> str:
+    from dotenv import load_dotenv
+    from services.base import ServiceConfig
+    from services.image_service_enhanced import EnhancedImageService
+    from services.tts_service import TTSService
+    from compositor import BoxOverlay, GifOverlay, StreamingCompositor
+    from render_profile import load_profile
+    from pipeline import SegmentPipeline
+    from render_cache import StillRenderCache
+    from ffmpeg_utils import probe_duration
+    from frame_prep import prepare_frame
+    from splice import MANIFEST_NAME, changed_segments, load_manifest, segment_key, splice_final, write_manifest
+    from render_farm import FarmCompositor, RenderFarm
+    from audio_post import AudioPostProcessor, to_wav
+
+    limits = limits or UNLIMITED
+    overlay = overlay or ("stub" if draft else "gif")
+    if overlay not in ("gif", "stub", "none"):
+        raise ValueError(f"Unknown overlay mode '{overlay}', expected 'gif', 'stub' or 'none'")
+    if draft and frame_fit is None:
+        frame_fit = "letterbox"
+    if reuse_audio is None:
+        reuse_audio = draft
+    if farm_dir and overlap:
+        raise ValueError("farm_dir renders whole steps on the farm and cannot be combined with overlap")
+    farm = RenderFarm(farm_dir) if farm_dir else None
+    post = AudioPostProcessor.for_mode(audio_post, slot_sec=8.0) if audio_post else None
     load_dotenv()
-    config = ServiceConfig()
+    config = ServiceConfig(deadline=deadline)
     image_service = EnhancedImageService(config)
     tts_service = TTSService(config)
-    video_service = VeoVideoService(config)
 
     # --- USER INPUTS ---
-    TOTAL_DURATION = 240  # seconds
-    SCRIPT_FILE_PATH = "script.txt"
+    TOTAL_DURATION = total_duration  # seconds
+    SCRIPT_FILE_PATH = script_path
     CHARACTER_DESCRIPTIONS = {
         "nguoi_cao_tuoi": "Vietnamese old person, male, oldest, portrait",
         "chuyen_gia": "Vietnamese consultant, female, old portrait",
@@ -63,18 +279,17 @@ def solve(output_mgr: OutputManager) -> str:
         "nguoi_cao_tuoi": "Vietnamese-Male-Old",
         "chuyen_gia": "Vietnamese-FeMale-Young",
     }
-    BACKGROUND_DESCRIPTION = "Vietnamese studio podcast background"
     GIF_OVERLAY_PATH = "image_ref/diaThan.gif"
 
     # --- SETUP ---
     NUM_SEGMENTS = math.ceil(TOTAL_DURATION / 8)
-    folder = output_mgr.create_solution_folder(1, "Vietnamese Video")
+    folder = output_mgr.create_solution_folder(solution_number, solution_name)
     os.makedirs(f"{folder}/reference", exist_ok=True)
     os.makedirs(f"{folder}/intermediate", exist_ok=True)
 
     if not os.path.exists(SCRIPT_FILE_PATH):
         raise FileNotFoundError(f"Script file not found: {SCRIPT_FILE_PATH}")
-    if not os.path.exists(GIF_OVERLAY_PATH):
+    if overlay == "gif" and not os.path.exists(GIF_OVERLAY_PATH):
         raise FileNotFoundError(f"GIF overlay not found: {GIF_OVERLAY_PATH}")
 
     # --- STEP 0: Generate Character and Background References ---
@@ -82,120 +297,278 @@ def solve(output_mgr: OutputManager) -> str:
     almond eyes, straight black hair, Vietnamese styling, red #DA251D/gold #FFCD00,
     bình dị style, soft lighting, 1920x1080, portrait, NO TEXT"""
 
-    char_refs = {}
-    for name, desc in CHARACTER_DESCRIPTIONS.items():
-        ref_prompt = f"{VIETNAMESE_CHAR_STYLE}\n{desc}\nReference portrait"
-        ref_path = f"{folder}/reference/character_{name}.png"
-        image_service.generate_and_save_chat(ref_prompt, ref_path)
-        char_refs[name] = ref_path
-        print(f"Generated character reference: {ref_path}")
+    def reusable(key: str, path: str) -> bool:
+        if _is_checkpointed(checkpoint, key):
+            return True
+        # Drafts iterate on the script only, so keep whatever references already exist
+        return draft and os.path.exists(path) and os.path.getsize(path) > 0
+
+    with output_mgr.stage(solution_number, "references"):
+        char_refs = {name: f"{folder}/reference/character_{name}.png" for name in CHARACTER_DESCRIPTIONS}
+        background_prompt = f"Vietnamese studio podcast background, warm lighting, professional, 1920x1080, with 2 {CHARACTER_DESCRIPTIONS }= {char_refs}"
+        background_ref_path = f"{folder}/reference/background.png"
 
-    background_prompt = f"Vietnamese studio podcast background, warm lighting, professional, 1920x1080, with 2 {CHARACTER_DESCRIPTIONS }= {char_refs}"
-    background_ref_path = f"{folder}/reference/background.png"
-    image_service.generate_and_save_chat(background_prompt, background_ref_path)
-    print(f"Generated background reference: {background_ref_path}")
+        references = {name: (f"{VIETNAMESE_CHAR_STYLE}\n{desc}\nReference portrait", char_refs[name])
+                      for name, desc in CHARACTER_DESCRIPTIONS.items()}
+        references["background"] = (background_prompt, background_ref_path)
+        missing = {}
+        for name, (ref_prompt, ref_path) in references.items():
+            kind = "background" if name == "background" else "character"
+            if reusable(f"reference:{name}", ref_path):
+                print(f"Reusing {kind} reference: {ref_path}")
+            else:
+                missing[name] = (ref_prompt, ref_path)
+
+        def reference_saved(name: str, ref_path: str):
+            if checkpoint is not None:
+                checkpoint[f"reference:{name}"] = ref_path
+            print(f"Generated {'background' if name == 'background' else 'character'} reference: {ref_path}")
+
+        # The background prompt only embeds the descriptions and paths, so every reference
+        # is independent: one concurrent batch costs about one round trip
+        image_service.generate_reference_set(missing, limit=limits.network, on_saved=reference_saved)
 
     # --- STEP 1: Load Script ---
-    with open(SCRIPT_FILE_PATH, "r", encoding="utf-8") as f:
-        script_content = f.read()
-    segments = parse_segments(script_content)
+    with output_mgr.stage(solution_number, "load_script"):
+        with open(SCRIPT_FILE_PATH, "r", encoding="utf-8") as f:
+            script_content = f.read()
+        segments = parse_segments(script_content)
 
-    # --- STEP 2: Generate Audio ---
-    audio_paths = {}  # Use a dictionary to map segment index to audio path
-    for i in range(1, NUM_SEGMENTS + 1):
+    def tts_line(i: int) -> Tuple[str, str]:
+        """(dialogue, voice) of segment i; the dialogue is empty for segments without one"""
         segment = segments.get(i, {})
-        dialogue = segment.get("dialogue", "")
-        visual_desc = segment.get("visual", "")
-
         voice_name = VOICE_MAP.get("chuyen_gia")  # Default voice
-        if "nguoi_cao_tuoi" in visual_desc:
+        if "nguoi_cao_tuoi" in segment.get("visual", ""):
             voice_name = VOICE_MAP.get("nguoi_cao_tuoi")
+        return segment.get("dialogue", ""), voice_name
 
-        if dialogue:
-            print(f"Synthesizing audio for segment {i}...")
+    def audio_path_for(i: int) -> str:
+        return f"{folder}/intermediate/audio_{i}.{'wav' if post is not None else 'mp3'}"
+
+    def fetch_audio(i: int, dialogue: str, voice_name: str) -> bytes:
+        """Raw TTS output for one line, from the TTS cache or the service"""
+        cache_path = _tts_cache_path(tts_cache_dir, tts_service.default_model, voice_name, dialogue)
+        if reuse_audio and os.path.exists(cache_path):
+            print(f"Reusing cached audio for segment {i}")
+            os.utime(cache_path)  # keep hot entries at the back of the retention LRU
+            with open(cache_path, "rb") as f:
+                return f.read()
+        print(f"Synthesizing audio for segment {i}...")
+        with limits.network():
             audio_bytes = tts_service.synthesize(dialogue, voice_name=voice_name)
-            audio_path = f"{folder}/intermediate/audio_{i}.mp3"
-            with open(audio_path, "wb") as f:
+        if reuse_audio:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
                 f.write(audio_bytes)
-            audio_paths[i] = audio_path
+            os.replace(tmp_path, cache_path)
+        return audio_bytes
 
-    # --- STEP 3: Generate Video from Static Image + Add Audio ---
-    video_paths = []
-    for i in range(1, NUM_SEGMENTS + 1):
-        segment = segments.get(i, {})
-        visual_desc = segment.get("visual", "")
-        
-        image_path = background_ref_path
+    def save_audio(i: int, audio_bytes: bytes) -> str:
+        audio_path = audio_path_for(i)
+        with open(audio_path, "wb") as f:
+            f.write(to_wav(audio_bytes) if post is not None else audio_bytes)
+        if checkpoint is not None:
+            checkpoint[f"tts:{i}"] = audio_path
+        output_mgr.record_file(solution_number, audio_path, "audio")
+        return audio_path
+
+    def synthesize(i: int) -> Optional[str]:
+        """TTS for one segment; returns the audio path, or None for segments without dialogue."""
+        dialogue, voice_name = tts_line(i)
+        if not dialogue:
+            return None
+        if _is_checkpointed(checkpoint, f"tts:{i}"):
+            print(f"Reusing audio for segment {i}")
+            return checkpoint[f"tts:{i}"]
+        audio_bytes = fetch_audio(i, dialogue, voice_name)
+        if post is not None:
+            audio_bytes = post.process(audio_bytes)
+        return save_audio(i, audio_bytes)
+
+    def synthesize_all(numbers: List[int]) -> Dict[int, Optional[str]]:
+        """synthesize() for every segment, post-processing all fetched lines as one batch"""
+        if post is None:
+            return {i: synthesize(i) for i in numbers}
+        audio_paths: Dict[int, Optional[str]] = {}
+        fetched: Dict[int, bytes] = {}
+        for i in numbers:
+            dialogue, voice_name = tts_line(i)
+            if not dialogue:
+                audio_paths[i] = None
+            elif _is_checkpointed(checkpoint, f"tts:{i}"):
+                print(f"Reusing audio for segment {i}")
+                audio_paths[i] = checkpoint[f"tts:{i}"]
+            else:
+                fetched[i] = fetch_audio(i, dialogue, voice_name)
+        for i, audio_bytes in zip(fetched, post.process_batch(list(fetched.values()))):
+            audio_paths[i] = save_audio(i, audio_bytes)
+        return {i: audio_paths[i] for i in numbers}
+
+    def image_for(i: int) -> str:
+        """Reference image shown in segment i"""
+        visual_desc = segments.get(i, {}).get("visual", "")
         if "nguoi_cao_tuoi" in visual_desc:
-            image_path = char_refs["nguoi_cao_tuoi"]
-        elif "chuyen_gia" in visual_desc:
-            image_path = char_refs["chuyen_gia"]
-
-        video_with_audio = None
-        duration = 8  # Default duration for silent clips
-
-        audio_path = audio_paths.get(i)
-        if audio_path:
-            try:
-                audio_clip = AudioFileClip(audio_path)
-                duration = audio_clip.duration
-                print(f"Creating video for segment {i} with audio...")
-                image_clip = ImageClip(image_path).set_duration(duration)
-                video_with_audio = image_clip.set_audio(audio_clip)
-            except Exception as e:
-                print(f"Error processing audio for segment {i}: {e}")
-                # Fallback to silent clip
-                image_clip = ImageClip(image_path).set_duration(duration)
-                video_with_audio = image_clip.set_audio(None)
-        else:
-            # Create a silent video clip
-            print(f"Creating silent video for segment {i}...")
-            image_clip = ImageClip(image_path).set_duration(duration)
-            video_with_audio = image_clip.set_audio(None)
+            return char_refs["nguoi_cao_tuoi"]
+        if "chuyen_gia" in visual_desc:
+            return char_refs["chuyen_gia"]
+        return background_ref_path
 
-        if video_with_audio:
-            video_path = f"{folder}/intermediate/video_{i}.mp4"
-            video_with_audio.write_videofile(video_path, codec="libx264", fps=24)
-            video_paths.append(video_path)
-            # Clean up clips
-            if 'audio_clip' in locals() and audio_clip:
-                audio_clip.close()
-            if 'image_clip' in locals() and image_clip:
-                image_clip.close()
+    def render(i: int, audio_path: Optional[str]) -> str:
+        """Render one segment from its static image and audio; returns the video path."""
+        image_path = image_for(i)
+        video_path = f"{segment_dir}/video_{i}.mp4"
+        if still_cache is not None:
+            duration = None
+            if audio_path:
+                try:
+                    duration = probe_duration(audio_path)
+                except Exception as e:
+                    print(f"Error processing audio for segment {i}: {e}")
+                    audio_path = None  # Fallback to silent clip
+            print(f"Creating video for segment {i} from cached still...")
+            with limits.cpu():
+                still_cache.render_segment(image_path, audio_path, video_path, duration=duration,
+                                           frame=prepared.get(image_path))
+            output_mgr.record_file(solution_number, video_path, "video")
+            return video_path
 
+        if image_path in prepared:
+            image_path = prepared[image_path].png_path  # already at the output size
+        render_still_segment(i, image_path, audio_path, video_path, segment_profile, limits)
+        output_mgr.record_file(solution_number, video_path, "video")
+        return video_path
 
-    # --- STEP 4: Concatenate and Overlay GIF ---
-    print("Concatenating video clips...")
-    if not video_paths:
-        raise ValueError("No video clips were generated to concatenate.")
-        
-    clips = [VideoFileClip(p) for p in video_paths]
-    final_video = concatenate_videoclips(clips, method="compose")
+    # Encoder settings saved by tune_encoder.py, or the defaults
+    segment_profile = load_profile("segment", fps=24)
+    final_profile = load_profile("final", fps=30)
+    segment_dir = f"{folder}/intermediate"
+    tts_cache_dir = f"{output_mgr.base_dir}/tts_cache"
+    os.makedirs(tts_cache_dir, exist_ok=True)
+    if draft:
+        # Same steps as the final render; only the encode settings and file names differ
+        segment_profile = segment_profile.as_draft()
+        final_profile = final_profile.as_draft()
+        segment_dir = f"{folder}/intermediate/draft"
+        os.makedirs(segment_dir, exist_ok=True)
 
-    print("Overlaying GIF...")
-    gif_clip = (
-        VideoFileClip(GIF_OVERLAY_PATH, has_mask=True)
-        .fx(vfx.loop, duration=final_video.duration)
-        .resize(height=int(final_video.h * 0.15))  # 15% of video height
-        .set_position(("left", "top"))
-    )
+    # Convert each reference once to the exact output size and pixel format
+    prepared = {}
+    if frame_fit:
+        with output_mgr.stage(solution_number, "prepare_frames", fit=frame_fit):
+            for ref_path in [*char_refs.values(), background_ref_path]:
+                prepared[ref_path] = prepare_frame(ref_path, segment_profile, fit=frame_fit,
+                                                   cache_dir=f"{output_mgr.base_dir}/frame_cache")
 
-    final_composite = CompositeVideoClip([final_video, gif_clip])
+    # Encode each distinct image once and derive segments by stream copy
+    still_cache = StillRenderCache(f"{output_mgr.base_dir}/render_cache", segment_profile) if render_cache else None
+    segment_numbers = list(range(1, NUM_SEGMENTS + 1))
 
-    output_path = f"{folder}/output_final.mp4"
-    print(f"Writing final video to {output_path}...")
-    final_composite.write_videofile(output_path, codec="libx264", fps=30)
+    output_path = f"{folder}/output_draft.mp4" if draft else f"{folder}/output_final.mp4"
+    # 15% of video height; the streaming paths scale every frame to the profile size
+    overlay_height = int(final_profile.height * 0.15)
 
-    # --- CLEANUP ---
-    for c in clips:
-        c.close()
-    final_video.close()
-    gif_clip.close()
-    final_composite.close()
+    def make_overlay():
+        """Per-frame overlay for the StreamingCompositor"""
+        if overlay == "gif":
+            return GifOverlay(GIF_OVERLAY_PATH, height=overlay_height)
+        if overlay == "stub":
+            return BoxOverlay(overlay_height, overlay_height)
+        return None
+
+    # Segments whose script line changed since the last streamed final, or None for a full render
+    manifest_path = f"{folder}/{MANIFEST_NAME}"
+    keys = {i: segment_key(segments.get(i, {}).get("dialogue", ""), segments.get(i, {}).get("visual", ""),
+                           audio_post)
+            for i in segment_numbers}
+    changed = None
+    if splice and not draft:
+        if assembly == "stream" and os.path.exists(output_path):
+            changed = changed_segments(load_manifest(manifest_path), keys, final_profile, overlay)
+        if changed is None:
+            print("No spliceable previous render; rendering the full video")
+
+    if changed is not None:
+        # --- STEPS 2-4 FOR CHANGED SEGMENTS ONLY, spliced into the existing final ---
+        with output_mgr.stage(solution_number, "splice", segments=len(changed)):
+            if changed:
+                new_videos = {i: render(i, synthesize(i)) for i in changed}
+                print(f"Splicing segments {changed} into {output_path}...")
+                with limits.cpu():
+                    report = splice_final(output_path, load_manifest(manifest_path), new_videos, output_path,
+                                          overlay=make_overlay(), manifest_path=manifest_path)
+                print(f"Re-rendered {report['rerendered_frames']} of {report['total_frames']} frames")
+            else:
+                print("Script unchanged; keeping the existing final video")
+    elif overlap:
+        # --- STEPS 2-4 OVERLAPPED: segment k renders as soon as its audio is ready ---
+        pipeline = SegmentPipeline(segment_numbers, synthesize, render,
+                                   queue_size=4, render_workers=render_workers).start()
+        video_paths = pipeline.results_in_order()
+        if assembly != "stream":
+            # moviepy assembly needs every segment up front
+            with output_mgr.stage(solution_number, "audio_and_segment_render"):
+                video_paths = list(video_paths)
+    else:
+        # --- STEP 2: Generate Audio ---
+        with output_mgr.stage(solution_number, "audio"):
+            audio_paths = synthesize_all(segment_numbers)
+
+        # --- STEP 3: Generate Video from Static Image + Add Audio ---
+        with output_mgr.stage(solution_number, "segment_render", farm=bool(farm)):
+            if farm is not None:
+                # Workers build each segment from the shared still cache plus its audio
+                jobs = []
+                for i in segment_numbers:
+                    image_path = image_for(i)
+                    if image_path in prepared:
+                        image_path = prepared[image_path].png_path
+                    jobs.append((image_path, audio_paths[i], f"{segment_dir}/video_{i}.mp4"))
+                video_paths = farm.render_segments(jobs, segment_profile)
+                for path in video_paths:
+                    output_mgr.record_file(solution_number, path, "video")
+            else:
+                video_paths = [render(i, audio_paths[i]) for i in segment_numbers]
+
+    # --- STEP 4: Concatenate and Overlay GIF ---
+    if changed is None:
+        with output_mgr.stage(solution_number, "assembly", mode=assembly):
+            print("Concatenating video clips...")
+            if isinstance(video_paths, list) and not video_paths:
+                raise ValueError("No video clips were generated to concatenate.")
+
+            if assembly == "stream":
+                # One segment reader at a time; memory does not grow with video length
+                if farm is not None:
+                    compositor = FarmCompositor(farm, final_profile, {"mode": overlay, "gif": GIF_OVERLAY_PATH,
+                                                                      "height": overlay_height})
+                else:
+                    compositor = StreamingCompositor(final_profile, make_overlay())
+                print(f"Streaming final video to {output_path}...")
+                with limits.cpu():
+                    compositor.compose(video_paths, output_path)
+                if not draft:
+                    # Layout of this render, for later splice re-renders
+                    write_manifest(manifest_path, final_profile, overlay, [
+                        {"index": i, "key": keys[i], "video": path, "frames": frames}
+                        for i, (path, frames) in zip(segment_numbers, compositor.segment_frames)
+                    ])
+            else:
+                if not draft and os.path.exists(manifest_path):
+                    os.remove(manifest_path)  # describes the previous streamed render, not this one
+                compose_final(video_paths, output_path, final_profile, overlay, GIF_OVERLAY_PATH, limits)
+
+    if draft:
+        output_mgr.record_file(solution_number, output_path, "draft")
+        print(f"Draft video: {output_path}")
+        return output_path
 
     # --- SAVE METADATA ---
-    final_path = output_mgr.save_final_file(output_path, 1, "Video", "video")
-    output_mgr.save_metadata(final_path, 1, "Video", "video")
+    if output_mgr.memory_profiler is not None:
+        output_mgr.metadata["solutions"][f"solution_{solution_number:02d}"]["memory"] = output_mgr.memory_profiler.summary()
+    final_path = output_mgr.save_final_file(output_path, solution_number, "Video", "video")
+    output_mgr.save_metadata(final_path, solution_number, "Video", "video")
+    # Files this job checkpointed stay until the job is recorded as done
+    output_mgr.apply_retention(protected_paths=checkpoint.values() if checkpoint is not None else None)
     
     print(f"Successfully generated video: {final_path}")
     return final_path
@@ -0,0 +1,225 @@
+"""
+Segment Splice - Re-render only the changed segments of an existing final video
+
+solve() writes a segment manifest next to output_final.mp4 when it assembles with the
+StreamingCompositor: for every segment its script hash, rendered file and exact frame
+count, plus the encoder profile and overlay mode of the final pass. When the script
+changes, only segments whose hash differs are re-synthesized and re-rendered.
+
+The existing final is cut on its own keyframes around the changed segments. Everything
+between those keyframes (the changed segments plus the unchanged frames up to the
+nearest keyframes) is re-encoded with the final profile and the overlay clock set to
+the range's absolute start time, so the overlay stays in phase. Head and tail are
+copied without re-encoding and joined with the concat demuxer, and the audio track is
+rebuilt from the segment files (audio only, no video decoding) and muxed in.
+
+If a changed segment's length differs, the overlay phase of the tail would shift, so
+the re-render then extends to the end of the video unless the overlay is "none".
+
+Stream copy only joins cleanly when the re-encoded range has the same codec
+parameters (SPS/PPS, pixel format, time base) as the old final. These are compared
+with ffprobe first; if they differ (for example after an encoder upgrade), the whole
+video is re-encoded instead.
+"""
+
+import os
+import json
+import bisect
+import hashlib
+import shutil
+import tempfile
+from typing import Dict, Any, List, Optional
+
+from compositor import StreamingCompositor
+from ffmpeg_utils import keyframe_times, probe_duration, run_ffmpeg, video_stream_info, write_concat_list
+from render_profile import RenderProfile
+
+MANIFEST_NAME = "segments.json"
+
+# Video stream fields that must match for the old and new parts to be joined by stream copy
+STREAM_COPY_KEYS = ("codec_name", "profile", "level", "pix_fmt", "width", "height", "time_base",
+                    "r_frame_rate", "extradata_hash")
+
+
+def segment_key(dialogue: str, visual: str, audio_post: Optional[str] = None) -> str:
+    """Hash of everything in the script and audio settings that affects how a segment renders"""
+    text = f"{visual}\n{dialogue}"
+    if audio_post:
+        text += f"\naudio_post={audio_post}"  # keys without post-processing stay as before
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def write_manifest(path: str, profile: RenderProfile, overlay: str, segments: List[Dict[str, Any]]) -> str:
+    """
+    Store the layout of a final render.
+
+    segments: in playback order, each {"index", "key", "video", "frames"}
+    """
+    data = {"profile": profile.to_dict(), "overlay": overlay, "segments": segments}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def changed_segments(manifest: Optional[Dict[str, Any]], keys: Dict[int, str], profile: RenderProfile,
+                     overlay: str) -> Optional[List[int]]:
+    """
+    Segment indices whose key differs from the manifest, or None when the previous
+    render cannot be spliced (different segment list, profile or overlay, or missing
+    segment files).
+    """
+    if manifest is None or manifest.get("overlay") != overlay or manifest.get("profile") != profile.to_dict():
+        return None
+    previous = manifest["segments"]
+    if [s["index"] for s in previous] != list(keys):
+        return None
+    changed = [s["index"] for s in previous if s["key"] != keys[s["index"]]]
+    if any(not os.path.exists(s["video"]) for s in previous if s["index"] not in changed):
+        return None
+    return changed
+
+
+class SplicePlan:
+    """Frame range of the old final to re-render and the segment pieces that fill it"""
+
+    def __init__(self, start_frame: int, end_frame: int, keep_tail: bool, pieces: List[Any]):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.keep_tail = keep_tail
+        self.pieces = pieces
+
+
+def plan_splice(segments: List[Dict[str, Any]], new_videos: Dict[int, str], keyframes: List[int],
+                keep_tail: bool) -> SplicePlan:
+    """Widen the changed segments to the surrounding keyframes of the old final"""
+    starts, total = [], 0
+    for s in segments:
+        starts.append(total)
+        total += s["frames"]
+    positions = [p for p, s in enumerate(segments) if s["index"] in new_videos]
+    first, last = positions[0], positions[-1]
+    change_start = starts[first]
+    change_end = starts[last] + segments[last]["frames"]
+
+    start_frame = keyframes[max(0, bisect.bisect_right(keyframes, change_start) - 1)] if keyframes else 0
+    end_frame = total
+    if keep_tail:
+        k = bisect.bisect_left(keyframes, change_end)
+        end_frame = keyframes[k] if k < len(keyframes) else total
+    if end_frame >= total:
+        end_frame, keep_tail = total, False
+
+    pieces: List[Any] = []
+    for p, s in enumerate(segments):
+        seg_start, seg_end = starts[p], starts[p] + s["frames"]
+        if first <= p <= last:
+            pieces.append(new_videos.get(s["index"], s["video"]))
+        elif seg_end > start_frame and seg_start < end_frame:
+            lo, hi = max(seg_start, start_frame), min(seg_end, end_frame)
+            pieces.append((s["video"], lo - seg_start, hi - lo))
+    return SplicePlan(start_frame, end_frame, keep_tail, pieces)
+
+
+def stream_copy_compatible(old_path: str, new_path: str) -> bool:
+    """Whether new_path can be stream-copied between parts of old_path and still decode"""
+    old, new = video_stream_info(old_path), video_stream_info(new_path)
+    return all(old.get(key) == new.get(key) for key in STREAM_COPY_KEYS)
+
+
+def splice_final(final_path: str, manifest: Dict[str, Any], new_videos: Dict[int, str], output_path: str,
+                 overlay=None, manifest_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Replace the segments in new_videos ({index: rendered segment}) inside final_path.
+
+    overlay is the frame overlay object of the final pass (GifOverlay, BoxOverlay or None).
+    Writes output_path (which may be final_path) and, if given, the updated manifest.
+    Returns a report with the re-rendered and total frame counts.
+    """
+    profile = RenderProfile.from_dict(manifest["profile"])
+    fps = profile.fps
+    segments = [dict(s) for s in manifest["segments"]]
+    if not new_videos:
+        raise ValueError("No changed segments to splice")
+
+    # Keep the tail only if the overlay phase after the changed range stays the same
+    keep_tail = overlay is None or all(
+        round(probe_duration(path) * fps) == next(s["frames"] for s in segments if s["index"] == index)
+        for index, path in new_videos.items()
+    )
+    keyframes = sorted({round(t * fps) for t in keyframe_times(final_path)})
+    plan = plan_splice(segments, new_videos, keyframes, keep_tail)
+
+    work_dir = tempfile.mkdtemp(prefix="splice_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        compositor = StreamingCompositor(profile, overlay)
+        middle_path = os.path.join(work_dir, "middle.mp4")
+        compositor.compose(plan.pieces, middle_path, start_time=plan.start_frame / fps, audio=False)
+
+        # Frame counts actually produced for the changed segments
+        by_path = {path: index for index, path in new_videos.items()}
+        new_frames = {by_path[path]: count for path, count in compositor.segment_frames if path in by_path}
+        shifted = any(new_frames[s["index"]] != s["frames"] for s in segments if s["index"] in new_frames)
+        if plan.keep_tail and shifted and overlay is not None:
+            # The estimate was off by a frame; redo the range through to the end so the overlay stays continuous
+            plan = plan_splice(segments, new_videos, keyframes, keep_tail=False)
+            compositor.compose(plan.pieces, middle_path, start_time=plan.start_frame / fps, audio=False)
+        rerendered = sum(count for _, count in compositor.segment_frames)
+
+        for s in segments:
+            if s["index"] in new_videos:
+                s["video"] = new_videos[s["index"]]
+                s["frames"] = new_frames[s["index"]]
+
+        # Head and tail by stream copy, split exactly on the chosen keyframes
+        cut_times = []
+        if plan.start_frame > 0:
+            cut_times.append(plan.start_frame)
+        if plan.keep_tail:
+            cut_times.append(plan.end_frame)
+        if cut_times and not stream_copy_compatible(final_path, middle_path):
+            print("Re-encoded range does not match the existing final's encoding; re-encoding the whole video")
+            total = sum(s["frames"] for s in segments)
+            plan = SplicePlan(0, total, False, [s["video"] for s in segments])
+            compositor.compose(plan.pieces, middle_path, start_time=0.0, audio=False)
+            rerendered = sum(count for _, count in compositor.segment_frames)
+            cut_times = []
+        parts = [middle_path]
+        if cut_times:
+            pattern = os.path.join(work_dir, "part_%03d.mp4")
+            # A quarter frame early so each cut lands on the keyframe itself
+            times = ",".join(f"{(frame - 0.25) / fps:.6f}" for frame in cut_times)
+            run_ffmpeg(["-i", final_path, "-map", "0:v:0", "-an", "-c", "copy", "-f", "segment",
+                        "-segment_times", times, "-segment_format", "mp4", "-reset_timestamps", "1", pattern])
+            old_parts = sorted(os.path.join(work_dir, n) for n in os.listdir(work_dir) if n.startswith("part_"))
+            head = old_parts[:1] if plan.start_frame > 0 else []
+            tail = old_parts[-1:] if plan.keep_tail else []
+            parts = head + [middle_path] + tail
+
+        audio_path = compositor.write_audio([(s["video"], s["frames"]) for s in segments],
+                                            os.path.join(work_dir, "audio.wav"))
+        list_path = write_concat_list(parts, os.path.join(work_dir, "parts.txt"))
+        tmp_output = os.path.join(work_dir, "output.mp4")
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-i", audio_path, "-map", "0:v", "-map", "1:a",
+                    "-c:v", "copy", *profile.audio_args(), "-movflags", "+faststart", tmp_output])
+        os.replace(tmp_output, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if manifest_path:
+        write_manifest(manifest_path, profile, manifest["overlay"], segments)
+    return {
+        "changed": sorted(new_videos),
+        "rerendered_frames": rerendered,
+        "total_frames": sum(s["frames"] for s in segments),
+        "kept_tail": plan.keep_tail,
+        "full_reencode": plan.start_frame == 0 and not plan.keep_tail,
+    }
@@ -0,0 +1,142 @@
+"""
+Stage Limits - Shared concurrency limits for network-bound and CPU-bound pipeline stages
+"""
+
+import os
+import time
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+
+from deadline import DeadlineExceeded, current_deadline
+
+
+class _SharedSlots:
+    """
+    Process-shared slots that record the pid of each holder.
+
+    Unlike a process-shared semaphore, slots held by a process that was killed (and so
+    never left its `with` block) can be taken back by the parent with reclaim().
+    """
+
+    POLL_SEC = 0.05
+
+    def __init__(self, limit: int, context):
+        self.lock = context.Lock()
+        self.holders = context.Array("i", limit, lock=False)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        pid = os.getpid()
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self.lock:
+                for slot, holder in enumerate(self.holders):
+                    if holder == 0:
+                        self.holders[slot] = pid
+                        return True
+            if give_up is not None and time.monotonic() >= give_up:
+                return False
+            time.sleep(self.POLL_SEC)
+
+    def release(self):
+        pid = os.getpid()
+        with self.lock:
+            for slot, holder in enumerate(self.holders):
+                if holder == pid:
+                    self.holders[slot] = 0
+                    return
+        raise ValueError("released a slot this process does not hold")
+
+    def reclaim(self, pid: int) -> int:
+        """Free every slot held by pid (caller holds self.lock); returns how many"""
+        freed = 0
+        for slot, holder in enumerate(self.holders):
+            if holder == pid:
+                self.holders[slot] = 0
+                freed += 1
+        return freed
+
+    def in_use(self) -> int:
+        with self.lock:
+            return sum(1 for holder in self.holders if holder)
+
+
+class StageLimits:
+    """
+    Semaphores shared by every job in a worker pool.
+
+    Network stages (image, TTS and Veo calls) mostly wait on the platform, so many can run
+    at once; CPU stages (moviepy/ffmpeg encodes) should not exceed the number of cores.
+    A limit of None means unlimited. With a multiprocessing context the slots are
+    process-shared, so the limits also hold for jobs run in child processes of that
+    context, and the parent takes back the slots of a child it kills (see kill()).
+    """
+
+    def __init__(self, network: Optional[int] = None, cpu: Optional[int] = None, context=None):
+        self.network_limit = network
+        self.cpu_limit = cpu
+        if context is not None:
+            self._network = _SharedSlots(network, context) if network else None
+            self._cpu = _SharedSlots(cpu, context) if cpu else None
+        else:
+            self._network = threading.BoundedSemaphore(network) if network else None
+            self._cpu = threading.BoundedSemaphore(cpu) if cpu else None
+
+    @staticmethod
+    @contextmanager
+    def _hold(semaphore):
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check()
+        if semaphore is None:
+            yield
+            return
+        # Waiting for a slot counts against the job's deadline too
+        if not semaphore.acquire(timeout=deadline.remaining() if deadline is not None else None):
+            raise DeadlineExceeded("deadline exceeded while waiting for a free slot")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def network(self):
+        """Context manager held around each network-bound call"""
+        return self._hold(self._network)
+
+    def cpu(self):
+        """Context manager held around each CPU-bound encode"""
+        return self._hold(self._cpu)
+
+    def reclaim(self, pid: int) -> int:
+        """Free the process-shared slots still held by a dead process; returns how many"""
+        freed = 0
+        for slots in (self._network, self._cpu):
+            if isinstance(slots, _SharedSlots):
+                with slots.lock:
+                    freed += slots.reclaim(pid)
+        return freed
+
+    def kill(self, process, kill=None) -> int:
+        """
+        Kill a child process and free the slots it held; returns how many.
+
+        The slot locks are held across the kill, so the child cannot die half-way through
+        taking or returning a slot. kill (default process.kill) does the actual killing.
+        """
+        with ExitStack() as stack:
+            for slots in (self._network, self._cpu):
+                if isinstance(slots, _SharedSlots):
+                    stack.enter_context(slots.lock)
+            (kill or process.kill)()
+            process.join()
+            return sum(slots.reclaim(process.pid) for slots in (self._network, self._cpu)
+                       if isinstance(slots, _SharedSlots))
+
+    def in_use(self):
+        """(network, cpu) slots currently held in process-shared mode"""
+        return tuple(slots.in_use() if isinstance(slots, _SharedSlots) else None
+                     for slots in (self._network, self._cpu))
+
+
+# Default for single-job runs: no limits
+UNLIMITED = StageLimits()
@@ -0,0 +1,74 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from audio_post import TTS_SAMPLE_RATE, AudioPostProcessor, float_to_pcm, pcm_to_float, time_stretch, to_wav
+
+
+def tone(seconds, amplitude=0.3, freq=220.0):
+    t = np.arange(int(seconds * TTS_SAMPLE_RATE)) / TTS_SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def padded(signal, lead=0.5, tail=0.7):
+    return np.concatenate([np.zeros(int(lead * TTS_SAMPLE_RATE), np.float32), signal,
+                           np.zeros(int(tail * TTS_SAMPLE_RATE), np.float32)])
+
+
+def rms_db(samples):
+    return 10 * np.log10(np.mean(samples * samples))
+
+
+def test_pcm_round_trip_and_wav():
+    samples = tone(0.1)
+    pcm = float_to_pcm(samples)
+    assert np.allclose(pcm_to_float(pcm), samples, atol=1 / 32768)
+    wav = to_wav(pcm)
+    with wave.open(io.BytesIO(wav), "rb") as wf:
+        assert (wf.getnchannels(), wf.getsampwidth(), wf.getframerate()) == (1, 2, TTS_SAMPLE_RATE)
+    assert pcm_to_float(wav).size == samples.size
+
+
+def test_trims_silence_keeping_pad():
+    processor = AudioPostProcessor(normalize=False, pad_ms=80)
+    out = pcm_to_float(processor.process(float_to_pcm(padded(tone(1.0)))))
+    assert 1.0 <= out.size / TTS_SAMPLE_RATE <= 1.0 + 2 * 0.08 + 0.04
+
+
+def test_normalizes_batch_to_target():
+    processor = AudioPostProcessor(target_db=-20.0)
+    quiet, loud = processor.process_batch([float_to_pcm(padded(tone(1.0, 0.02))),
+                                           float_to_pcm(padded(tone(2.0, 0.5)))])
+    for pcm in (quiet, loud):
+        assert rms_db(pcm_to_float(pcm)) == pytest.approx(-20.0, abs=1.0)
+
+
+def test_fit_stretches_towards_slot_and_pads():
+    processor = AudioPostProcessor(slot_sec=8.0, normalize=False)
+    out = pcm_to_float(processor.process(float_to_pcm(tone(7.0))))
+    assert out.size == 8 * TTS_SAMPLE_RATE
+    # Speech longer than the stretch limit allows is never cut
+    out = pcm_to_float(processor.process(float_to_pcm(tone(12.0))))
+    assert out.size == pytest.approx(12.0 * 0.75 * TTS_SAMPLE_RATE, rel=0.01)
+
+
+def test_silent_line_becomes_one_slot_of_silence():
+    silent = float_to_pcm(np.zeros(TTS_SAMPLE_RATE, np.float32))
+    assert len(AudioPostProcessor().process(silent)) == 2 * 8 * TTS_SAMPLE_RATE
+    assert len(AudioPostProcessor(slot_sec=6.0).process(b"")) == 2 * 6 * TTS_SAMPLE_RATE
+
+
+def test_time_stretch_keeps_level():
+    signal = tone(1.0)
+    out = time_stretch(signal, 1.2)
+    assert out.size == int(round(signal.size * 1.2))
+    assert rms_db(out[2048:-2048]) == pytest.approx(rms_db(signal), abs=1.0)
+
+
+def test_for_mode():
+    assert AudioPostProcessor.for_mode("clean", slot_sec=8.0).slot_sec is None
+    assert AudioPostProcessor.for_mode("fit", slot_sec=8.0).slot_sec == 8.0
+    with pytest.raises(ValueError):
+        AudioPostProcessor.for_mode("loud", slot_sec=8.0)
@@ -0,0 +1,143 @@
+import json
+import os
+import subprocess
+import time
+
+import pytest
+
+import batch_runner
+from batch_runner import BatchRunner, load_finished, load_jobs
+from services.metrics import METRICS
+
+
+# Job process targets; spawned children import them from this module
+
+def report_done(spec, limits, output_dir, deadline_sec, conn):
+    with limits.cpu():
+        METRICS.inc("retries_total", service="test", endpoint=spec["job_id"])
+    conn.send({"output": f"{output_dir}/{spec['job_id']}.mp4", "metrics": METRICS.snapshot()})
+
+
+def crash(spec, limits, output_dir, deadline_sec, conn):
+    os._exit(3)
+
+
+def hang(spec, limits, output_dir, deadline_sec, conn):
+    time.sleep(60)
+
+
+def hang_holding_slots(spec, limits, output_dir, deadline_sec, conn):
+    with limits.network(), limits.cpu():
+        encoder = subprocess.Popen(["sleep", "60"])
+        with open(spec["pid_file"], "w") as f:
+            f.write(str(encoder.pid))
+        time.sleep(60)
+
+
+def process_gone(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] in ("Z", "X")  # reaped or a zombie
+    except FileNotFoundError:
+        return True
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def test_load_jobs(tmp_path):
+    path = write_lines(tmp_path / "jobs.jsonl", ['{"job_id": "ep01"}', "", '{"kind": "podcast"}'])
+    jobs = load_jobs(path)
+    assert [(j["job_id"], j["kind"]) for j in jobs] == [("ep01", "video"), ("job_00003", "podcast")]
+
+    write_lines(tmp_path / "bad.jsonl", ['{"kind": "radio"}'])
+    with pytest.raises(ValueError):
+        load_jobs(str(tmp_path / "bad.jsonl"))
+
+
+def test_load_finished_skips_foreign_lines(tmp_path):
+    path = write_lines(tmp_path / "status.jsonl", [
+        '{"job_id": "a", "status": "failed"}',
+        '{"status": "done"}',
+        '["not", "a", "status"]',
+        "truncated {",
+        '{"job_id": "a", "status": "done"}',
+    ])
+    assert load_finished(path) == {"a": {"job_id": "a", "status": "done"}}
+    assert load_finished(str(tmp_path / "missing.jsonl")) == {}
+
+
+def test_in_process_run_and_resume(tmp_path, monkeypatch):
+    calls = []
+
+    def run_job(spec, limits=None, output_dir="outputs", checkpoint=None, deadline_sec=None):
+        calls.append(spec["job_id"])
+        if spec.get("fail"):
+            raise ValueError("bad script")
+        return f"{output_dir}/{spec['job_id']}.mp4"
+
+    monkeypatch.setattr(batch_runner, "run_job", run_job)
+    status_path = str(tmp_path / "status.jsonl")
+    jobs = [{"job_id": "a", "kind": "video"}, {"job_id": "b", "kind": "video", "fail": True}]
+    runner = BatchRunner(status_path, network=2, cpu=1, isolate=False)
+
+    assert runner.run(jobs) == {"done": 1, "failed": 1}
+    statuses = load_finished(status_path)
+    assert statuses["b"]["error"] == "ValueError: bad script"
+
+    calls.clear()
+    assert runner.run(jobs, resume=True) == {"done": 0, "failed": 1}
+    assert calls == ["b"]
+
+
+def test_isolated_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, "_run_isolated", report_done)
+    METRICS.reset()
+    runner = BatchRunner(str(tmp_path / "status.jsonl"), network=2, cpu=1, output_dir="out")
+
+    status = runner._run_one({"job_id": "ok", "kind": "video"})
+    assert (status["status"], status["output"]) == ("done", "out/ok.mp4")
+    assert METRICS.value("retries_total", service="test", endpoint="ok") == 1  # merged from the child
+
+    monkeypatch.setattr(batch_runner, "_run_isolated", crash)
+    status = runner._run_one({"job_id": "crash", "kind": "video"})
+    assert status["status"] == "failed"
+    assert "exited with code 3" in status["error"]
+
+
+def test_isolated_job_killed_after_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, "_run_isolated", hang)
+    monkeypatch.setattr(batch_runner, "KILL_GRACE_SEC", 0.5)
+    runner = BatchRunner(str(tmp_path / "status.jsonl"), network=1, cpu=1)
+
+    started = time.monotonic()
+    status = runner._run_one({"job_id": "slow", "kind": "video", "deadline_sec": 0.5})
+    assert status["status"] == "failed" and status["error"].startswith("DeadlineExceeded")
+    assert time.monotonic() - started < 30
+    assert json.loads(open(runner.status_path).readline())["job_id"] == "slow"
+
+
+def test_killed_job_returns_its_slots_and_kills_its_encoders(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, "_run_isolated", hang_holding_slots)
+    monkeypatch.setattr(batch_runner, "KILL_GRACE_SEC", 1.0)
+    runner = BatchRunner(str(tmp_path / "status.jsonl"), network=1, cpu=1)
+    pid_file = tmp_path / "encoder.pid"
+
+    status = runner._run_one({"job_id": "stuck", "kind": "video", "deadline_sec": 0.5, "pid_file": str(pid_file)})
+    assert status["error"].startswith("DeadlineExceeded")
+    assert runner.limits.in_use() == (0, 0)
+    encoder_pid = int(pid_file.read_text())
+    for _ in range(50):
+        if process_gone(encoder_pid):
+            break
+        time.sleep(0.1)
+    assert process_gone(encoder_pid)
+
+    # The only cpu slot is free again for the next job
+    monkeypatch.setattr(batch_runner, "_run_isolated", report_done)
+    started = time.monotonic()
+    status = runner._run_one({"job_id": "next", "kind": "video", "deadline_sec": 5})
+    assert status["status"] == "done"
+    assert time.monotonic() - started < 5
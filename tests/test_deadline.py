@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import time
+import types
+
+import pytest
+
+import ffmpeg_utils
+from deadline import Deadline, DeadlineExceeded
+
+
+def test_call_returns_result_and_raises_errors():
+    deadline = Deadline(10)
+    try:
+        assert deadline.call(lambda a, b=0: a + b, 2, b=3) == 5
+        with pytest.raises(ZeroDivisionError):
+            deadline.call(lambda: 1 / 0)
+    finally:
+        deadline.close()
+
+
+def test_call_abandons_blocked_call_at_deadline():
+    deadline = Deadline(0.2)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        deadline.call(time.sleep, 5)
+    assert time.monotonic() - started < 2
+
+
+def test_call_after_cancel_raises_immediately():
+    deadline = Deadline()
+    deadline.cancel("lease lost")
+    with pytest.raises(DeadlineExceeded, match="lease lost"):
+        deadline.call(time.sleep, 5)
+
+
+def test_register_moviepy_kills_moviepy_processes(monkeypatch):
+    tools = types.ModuleType("moviepy.tools")
+    tools.sp = subprocess
+    monkeypatch.setitem(sys.modules, "moviepy", types.ModuleType("moviepy"))
+    monkeypatch.setitem(sys.modules, "moviepy.tools", tools)
+
+    ffmpeg_utils.register_moviepy()
+    ffmpeg_utils.register_moviepy()
+    assert tools.sp.PIPE == subprocess.PIPE
+
+    deadline = Deadline(0.2)
+    with deadline.activate():
+        process = tools.sp.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    assert process.wait(timeout=3) != 0
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from services import image_formats
+from services.image_formats import EXTRA_BODY, NATIVE, FormatCache, negotiate_generate
+
+BASE_URL = "https://images.test"
+
+
+class FakeResponse:
+    def __init__(self, status_code, shape=None):
+        self.status_code = status_code
+        self.text = "ok" if status_code == 200 else "rejected"
+        self._shape = shape
+
+    def json(self):
+        return {"data": [{"b64_json": self._shape}]}
+
+
+class FakeBackend:
+    """Stands in for _post: answers each request by the body shape it was sent"""
+
+    def __init__(self, status_by_shape, delay_by_shape=None):
+        self.status_by_shape = status_by_shape
+        self.delay_by_shape = delay_by_shape or {}
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url, headers, body, timeout=None, service=None):
+        shape = EXTRA_BODY if "extra_body" in body else NATIVE
+        with self._lock:
+            self.sent.append(shape)
+        time.sleep(self.delay_by_shape.get(shape, 0))
+        status = self.status_by_shape[shape]
+        return FakeResponse(status, shape), f"{status} {shape}"
+
+
+def generate(monkeypatch, backend, cache, **kwargs):
+    monkeypatch.setattr(image_formats, "_post", backend)
+    return negotiate_generate(BASE_URL, {}, "a cat", "imagen-4", 1, None, "16:9", cache=cache, **kwargs)
+
+
+def test_probes_native_first_and_reuses_the_shape_that_worked(monkeypatch, tmp_path):
+    cache = FormatCache(str(tmp_path / "formats.json"))
+    backend = FakeBackend({NATIVE: 400, EXTRA_BODY: 200})
+
+    assert generate(monkeypatch, backend, cache)["data"][0]["b64_json"] == EXTRA_BODY
+    assert backend.sent == [NATIVE, EXTRA_BODY]
+
+    backend.sent.clear()
+    generate(monkeypatch, backend, cache)
+    assert backend.sent == [EXTRA_BODY]  # known shape, a single request
+    assert FormatCache(cache.path).get(BASE_URL, "imagen-4") == EXTRA_BODY  # persisted
+
+
+def test_rejected_known_shape_is_forgotten_and_reprobed(monkeypatch):
+    cache = FormatCache()
+    cache.remember(BASE_URL, "imagen-4", EXTRA_BODY)
+    backend = FakeBackend({NATIVE: 200, EXTRA_BODY: 422})
+
+    generate(monkeypatch, backend, cache)
+    assert backend.sent == [EXTRA_BODY, NATIVE]
+    assert cache.get(BASE_URL, "imagen-4") == NATIVE
+
+
+def test_outage_on_known_shape_raises_without_reprobe(monkeypatch):
+    cache = FormatCache()
+    cache.remember(BASE_URL, "imagen-4", NATIVE)
+    backend = FakeBackend({NATIVE: 503, EXTRA_BODY: 200})
+
+    with pytest.raises(requests.HTTPError, match="503"):
+        generate(monkeypatch, backend, cache)
+    assert backend.sent == [NATIVE]
+    assert cache.get(BASE_URL, "imagen-4") == NATIVE
+
+
+def test_hedge_takes_the_first_success(monkeypatch):
+    cache = FormatCache()
+    backend = FakeBackend({NATIVE: 200, EXTRA_BODY: 200}, delay_by_shape={NATIVE: 0.5})
+
+    assert generate(monkeypatch, backend, cache, hedge=True)["data"][0]["b64_json"] == EXTRA_BODY
+    assert sorted(backend.sent) == [EXTRA_BODY, NATIVE]  # both sent at once
+    assert cache.get(BASE_URL, "imagen-4") == EXTRA_BODY
+
+
+def test_timeout_is_recomputed_for_every_attempt(monkeypatch):
+    remaining = iter([(10.0, 9.0), (10.0, 4.0)])
+    timeouts = []
+
+    def post(url, headers=None, json=None, timeout=None):
+        timeouts.append(timeout)
+        return FakeResponse(404 if "extra_body" not in json else 200, "any")
+
+    monkeypatch.setattr(requests, "post", post)
+    negotiate_generate(BASE_URL, {}, "a cat", "imagen-4", 1, None, None, cache=FormatCache(),
+                       timeout=lambda: next(remaining))
+    assert timeouts == [(10.0, 9.0), (10.0, 4.0)]
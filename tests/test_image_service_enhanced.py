@@ -0,0 +1,82 @@
+import base64
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from services.base import ServiceConfig
+from services.image_service_enhanced import EnhancedImageService
+
+REFERENCES = {
+    "minh": ("Minh, a Vietnamese host in a blue shirt", "minh.png"),
+    "lan": ("Lan, a Vietnamese host in a red ao dai", "lan.png"),
+    "background": ("Vietnamese studio podcast background", "background.png"),
+}
+
+
+def make_service(fail=()):
+    """EnhancedImageService whose transports return the prompt as the image bytes"""
+    service = EnhancedImageService(ServiceConfig(api_key="test-key"))
+    service.sent = []
+    lock = threading.Lock()
+
+    def record(prompt, n=1):
+        with lock:
+            service.sent.append((prompt, n))
+        if prompt in fail:
+            raise ValueError("no image in response")
+
+    def generate_via_chat(prompt, model="gemini-2.5-flash-image-preview"):
+        record(prompt)
+        return prompt.encode("utf-8")
+
+    def generate(prompt, model="imagen-4", n=1, **kwargs):
+        record(prompt, n)
+        return {"data": [{"b64_json": base64.b64encode(prompt.encode("utf-8")).decode("ascii")}]}
+
+    service.generate_via_chat = generate_via_chat
+    service.generate = generate
+    return service
+
+
+def references_in(tmp_path):
+    return {name: (prompt, str(tmp_path / path)) for name, (prompt, path) in REFERENCES.items()}
+
+
+@pytest.mark.parametrize("method", ["chat", "standard"])
+def test_reference_set_sends_one_request_per_reference(tmp_path, method):
+    service = make_service()
+    references = references_in(tmp_path)
+    saved = []
+    in_flight = []
+
+    @contextmanager
+    def limit():
+        in_flight.append(1)
+        yield
+
+    paths = service.generate_reference_set(references, method=method, limit=limit,
+                                           on_saved=lambda name, path: saved.append(name))
+    assert paths == {name: path for name, (_, path) in references.items()}
+    assert sorted(service.sent) == sorted((prompt, 1) for prompt, _ in references.values())
+    assert sorted(saved) == sorted(references) and len(in_flight) == 3
+    for prompt, path in references.values():
+        with open(path, "rb") as f:
+            assert f.read() == prompt.encode("utf-8")
+
+
+def test_reference_set_saves_the_rest_before_reporting_failures(tmp_path):
+    references = references_in(tmp_path)
+    service = make_service(fail={references["lan"][0]})
+    saved = []
+
+    with pytest.raises(RuntimeError, match="lan: no image in response"):
+        service.generate_reference_set(references, on_saved=lambda name, path: saved.append(name))
+    assert sorted(saved) == ["background", "minh"]
+
+
+def test_reference_set_rejects_unknown_method():
+    with pytest.raises(ValueError, match="Unknown reference method"):
+        make_service().generate_reference_set({}, method="batch")
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+import batch_runner
+from deadline import Deadline, DeadlineExceeded
+from job_queue import DEAD, DONE, LEASED, QUEUED, JobQueue, LeaseLost, QueueWorker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "queue.sqlite"), visibility_timeout=60)
+
+
+def state(queue, job_id):
+    return {job["job_id"]: job for job in queue.jobs()}[job_id]
+
+
+def expire_lease(queue, job_id):
+    queue._conn().execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ?", (time.time() - 1, job_id))
+
+
+def test_lease_heartbeat_complete(queue):
+    assert queue.enqueue({"job_id": "a", "kind": "video"})
+    assert not queue.enqueue({"job_id": "a", "kind": "video"})
+
+    job = queue.lease("w1")
+    assert (job["job_id"], job["_attempt"]) == ("a", 1)
+    assert queue.lease("w2") is None
+    assert queue.heartbeat("a", "w1")
+    assert not queue.heartbeat("a", "w2")
+    assert not queue.complete("a", "w2", {"output": "x"})
+    assert queue.complete("a", "w1", {"output": "x"})
+    assert state(queue, "a")["state"] == DONE
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.enqueue({"job_id": "a", "kind": "video"}, max_attempts=2)
+    queue.lease("w1")
+    expire_lease(queue, "a")
+
+    job = queue.lease("w2")
+    assert job["_attempt"] == 2
+    assert not queue.heartbeat("a", "w1")
+    assert queue.fail("a", "w1", "late") == LEASED  # the old owner cannot fail it
+    assert state(queue, "a")["lease_owner"] == "w2"
+
+    expire_lease(queue, "a")
+    assert queue.lease("w3") is None  # attempts used up
+    assert state(queue, "a")["state"] == DEAD
+
+
+def test_fail_requeues_until_attempts_used(queue):
+    queue.enqueue({"job_id": "a", "kind": "video"}, max_attempts=2)
+    queue.lease("w1")
+    assert queue.fail("a", "w1", "boom") == QUEUED
+    queue.lease("w1")
+    assert queue.fail("a", "w1", "boom") == DEAD
+    assert queue.requeue_dead() == 1
+
+
+def test_checkpoint_write_after_lost_lease(queue):
+    queue.enqueue({"job_id": "a", "kind": "video"})
+    queue.lease("w1")
+    deadline = Deadline()
+    checkpoint = queue.checkpoint("a", "w1", deadline)
+    checkpoint["tts:1"] = "audio_1.mp3"
+    assert dict(checkpoint) == {"tts:1": "audio_1.mp3"}
+
+    expire_lease(queue, "a")
+    queue.lease("w2")
+    with pytest.raises(LeaseLost):
+        checkpoint["tts:2"] = "audio_2.mp3"
+    assert deadline.cancelled
+    assert "tts:2" not in queue.checkpoint("a")
+    with pytest.raises(DeadlineExceeded):
+        checkpoint["tts:3"] = "audio_3.mp3"
+
+
+def test_worker_completes_job(queue, monkeypatch):
+    seen = {}
+
+    def run_job(spec, limits=None, output_dir="outputs", checkpoint=None, deadline_sec=None, deadline=None):
+        seen["deadline"] = deadline
+        checkpoint["tts:1"] = "audio_1.mp3"
+        return "final.mp4"
+
+    monkeypatch.setattr(batch_runner, "run_job", run_job)
+    queue.enqueue({"job_id": "a", "kind": "video", "deadline_sec": 30})
+    worker = QueueWorker(queue, worker_id="w1")
+
+    assert worker.run_once()
+    assert not worker.run_once()
+    assert state(queue, "a")["state"] == DONE
+    assert seen["deadline"].seconds == 30
+
+
+def test_worker_leaves_lost_job_to_new_owner(queue, monkeypatch):
+    def run_job(spec, limits=None, output_dir="outputs", checkpoint=None, deadline_sec=None, deadline=None):
+        # Another worker takes the job over while this one is still running it
+        expire_lease(queue, spec["job_id"])
+        queue.lease("w2")
+        checkpoint["tts:1"] = "audio_1.mp3"
+        return "final.mp4"
+
+    monkeypatch.setattr(batch_runner, "run_job", run_job)
+    queue.enqueue({"job_id": "a", "kind": "video"})
+
+    assert QueueWorker(queue, worker_id="w1").run_once()
+    job = state(queue, "a")
+    assert (job["state"], job["lease_owner"], job["error"]) == (LEASED, "w2", None)
+
+
+def test_heartbeat_loss_cancels_job(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"), visibility_timeout=3)  # heartbeat every second
+
+    def run_job(spec, limits=None, output_dir="outputs", checkpoint=None, deadline_sec=None, deadline=None):
+        expire_lease(queue, spec["job_id"])
+        queue.lease("w2")
+        deadline.sleep(10)  # stands in for a long encode; the heartbeat cancels it
+        return "final.mp4"
+
+    monkeypatch.setattr(batch_runner, "run_job", run_job)
+    queue.enqueue({"job_id": "a", "kind": "video"})
+    worker = QueueWorker(queue, worker_id="w1")
+    started = time.monotonic()
+    assert worker.run_once()
+    assert time.monotonic() - started < 5
+    assert state(queue, "a")["lease_owner"] == "w2"
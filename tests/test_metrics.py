@@ -0,0 +1,46 @@
+from services.metrics import PREFIX, Metrics, export_metrics
+
+
+def test_counters_and_record_request():
+    metrics = Metrics()
+    metrics.inc("retries_total", service="tts", endpoint="generate")
+    metrics.inc("retries_total", 2, endpoint="generate", service="tts")
+    metrics.record_request("tts", "generate", "200", 0.3, sent=10, received=100)
+    metrics.record_request("tts", "generate", "error", 12.0, sent=10)
+
+    assert metrics.value("retries_total", service="tts", endpoint="generate") == 3
+    assert metrics.value("requests_total", service="tts", endpoint="generate", status="200") == 1
+    assert metrics.value("request_bytes_total", service="tts", endpoint="generate") == 20
+    assert metrics.value("response_bytes_total", service="tts", endpoint="generate") == 100
+    assert metrics.value("requests_total", service="image", endpoint="generate", status="200") == 0
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.record_request("tts", "generate", "200", 0.3, sent=10, received=100)
+    metrics.record_request("tts", "generate", "200", 400.0)
+    metrics.inc("decoded_bytes_total", 5, service="image", endpoint='say "hi"\n')
+    lines = metrics.render().splitlines()
+
+    labels = 'endpoint="generate",service="tts"'
+    assert f"# TYPE {PREFIX}requests_total counter" in lines
+    assert f'{PREFIX}requests_total{{{labels},status="200"}} 2' in lines
+    assert f"# TYPE {PREFIX}request_seconds histogram" in lines
+    assert f'{PREFIX}request_seconds_bucket{{{labels},le="0.25"}} 0' in lines
+    assert f'{PREFIX}request_seconds_bucket{{{labels},le="0.5"}} 1' in lines
+    assert f'{PREFIX}request_seconds_bucket{{{labels},le="300"}} 1' in lines
+    assert f'{PREFIX}request_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"{PREFIX}request_seconds_sum{{{labels}}} 400.3" in lines
+    assert f"{PREFIX}request_seconds_count{{{labels}}} 2" in lines
+    assert f'{PREFIX}decoded_bytes_total{{endpoint="say \\"hi\\"\\n",service="image"}} 5' in lines
+    # One HELP/TYPE header per metric, not per series
+    assert sum(line.startswith(f"# TYPE {PREFIX}requests_total ") for line in lines) == 1
+
+
+def test_export_textfile(tmp_path):
+    metrics = Metrics()
+    path = str(tmp_path / "metrics.prom")
+    stop = export_metrics(textfile=path, interval_sec=60, metrics=metrics)
+    metrics.inc("retries_total", service="video", endpoint="poll")
+    stop()
+    assert open(path, encoding="utf-8").read() == metrics.render()
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+from job_queue import JobQueue
+from output_manager import RetentionPolicy, sweep
+
+NOW = time.time()
+HOUR = 3600
+
+
+def make_file(root, rel, size=100, used_ago=0, modified_ago=None):
+    """File of size bytes last accessed used_ago seconds ago (and modified modified_ago ago)"""
+    path = os.path.join(str(root), rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    modified_ago = used_ago if modified_ago is None else modified_ago
+    os.utime(path, (NOW - used_ago, NOW - modified_ago))
+    return path
+
+
+def test_lru_eviction_uses_later_of_atime_and_mtime(tmp_path):
+    # Modified long ago but read recently: counts as recently used
+    read = make_file(tmp_path, "s/intermediate/read.mp3", used_ago=10, modified_ago=1000)
+    edited = make_file(tmp_path, "s/intermediate/edited.mp3", used_ago=1000, modified_ago=300)
+    oldest = make_file(tmp_path, "s/intermediate/oldest.mp3", used_ago=500)
+
+    report = sweep(str(tmp_path), RetentionPolicy(max_bytes=150))
+    assert (os.path.exists(read), os.path.exists(edited), os.path.exists(oldest)) == (True, False, False)
+    assert (report["removed_files"], report["freed_bytes"], report["remaining_bytes"]) == (2, 200, 100)
+
+
+def test_age_limit_and_byte_budget(tmp_path):
+    stale = make_file(tmp_path, "s/intermediate/stale.png", used_ago=3 * 24 * HOUR)
+    recent = make_file(tmp_path, "s/intermediate/recent.png", used_ago=HOUR)
+    sweep(str(tmp_path), RetentionPolicy(max_age_days=2))
+    assert not os.path.exists(stale) and os.path.exists(recent)
+
+    # Within budget: nothing is evicted
+    assert sweep(str(tmp_path), RetentionPolicy(max_bytes=100))["removed_files"] == 0
+    assert sweep(str(tmp_path), RetentionPolicy(max_bytes=99))["removed_files"] == 1
+
+
+def test_kept_pinned_and_backups(tmp_path):
+    final = make_file(tmp_path, "solution_01_video/final/solution_01_final.mp4", used_ago=9 * 24 * HOUR)
+    backups = [make_file(tmp_path, f"solution_01_video/final/solution_01_final_2026010{d}_120000.mp4",
+                         used_ago=(10 - d) * HOUR) for d in (1, 2, 3)]
+    pinned = make_file(tmp_path, "solution_02_keep/intermediate/a.mp4", used_ago=9 * 24 * HOUR)
+    make_file(tmp_path, "solution_02_keep/.keep", size=0)
+
+    report = sweep(str(tmp_path), RetentionPolicy(max_bytes=0, keep_backups=1, dry_run=True))
+    assert report["removed_files"] == 2 and os.path.exists(backups[0])  # dry run deletes nothing
+
+    sweep(str(tmp_path), RetentionPolicy(max_bytes=0, keep_backups=1))
+    assert os.path.exists(final) and os.path.exists(pinned)
+    assert [os.path.exists(b) for b in backups] == [False, False, True]  # newest backup kept
+
+
+def test_referenced_files_are_protected(tmp_path):
+    base = tmp_path / "outputs"
+    segment = make_file(base, "s/intermediate/segment_1.mp4", used_ago=9 * 24 * HOUR)
+    unreferenced = make_file(base, "s/intermediate/segment_old.mp4", used_ago=9 * 24 * HOUR)
+    with open(base / "s" / "segments.json", "w", encoding="utf-8") as f:
+        json.dump({"segments": [{"index": 1, "video": segment, "frames": 10}]}, f)
+
+    queue = JobQueue(str(base / "queue.sqlite"))
+    for job_id in ("running", "finished"):
+        queue.enqueue({"job_id": job_id})
+    running_tts = make_file(base, "s/intermediate/tts_running.wav", used_ago=9 * 24 * HOUR)
+    finished_tts = make_file(base, "s/intermediate/tts_finished.wav", used_ago=9 * 24 * HOUR)
+    queue.checkpoint("running")["tts:0"] = running_tts
+    queue.checkpoint("finished")["tts:0"] = finished_tts
+    queue.lease("w1")  # "running"
+    queue.lease("w1")  # "finished"
+    queue.complete("finished", "w1", "done.mp4")
+
+    own = make_file(base, "s/intermediate/own.wav", used_ago=9 * 24 * HOUR)
+    scratch = tmp_path / "temp_audio_chunks"
+    chunk = make_file(scratch, "chunk_0.wav")
+    os.utime(scratch, (NOW - 24 * HOUR, NOW - 24 * HOUR))
+
+    report = sweep(str(base), RetentionPolicy(max_age_days=1, stale_dirs=[str(scratch)]),
+                   protected_paths=[own, chunk, {"not": "a path"}])
+    assert os.path.exists(segment) and os.path.exists(running_tts) and os.path.exists(own)
+    assert not os.path.exists(unreferenced) and not os.path.exists(finished_tts)
+    assert os.path.exists(chunk)  # the scratch folder is still in use
+    assert report["protected_files"] == 3
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+import pytest
+
+from render_farm import CLAIMED, DONE, FAILED, OUTPUTS, TASKS, WITHDRAWN, RenderFarm, RenderWorker
+
+
+@pytest.fixture
+def farm(tmp_path):
+    return RenderFarm(str(tmp_path / "farm"), stale_sec=0.0, poll_sec=0.01)
+
+
+def pending(farm, sub):
+    return sorted(name for name in os.listdir(farm.path(sub)) if name.endswith(".json"))
+
+
+def test_claim_is_atomic_and_ordered(farm):
+    first = farm.submit("segment", output="outputs/a.mp4")
+    second = farm.submit("segment", output="outputs/b.mp4")
+    worker = RenderWorker(farm.work_dir, "w1")
+
+    claimed_path, task = worker.claim()
+    assert task["task_id"] == first
+    assert pending(farm, TASKS) == [f"{second}.json"]
+    assert pending(farm, CLAIMED) == [f"{first}.json"]
+    assert worker.owns(claimed_path)
+
+
+def test_stale_claim_is_requeued_and_not_removed_by_old_owner(farm):
+    task_id = farm.submit("segment", output="outputs/a.mp4")
+    slow, other = RenderWorker(farm.work_dir, "slow"), RenderWorker(farm.work_dir, "other")
+    slow_path, _ = slow.claim()
+
+    farm._requeue_stale()  # the slow worker missed its heartbeats
+    assert pending(farm, TASKS) == [f"{task_id}.json"]
+    other_path, task = other.claim()
+    assert task["task_id"] == task_id and other_path == slow_path
+
+    assert not slow.owns(slow_path)
+    slow.release(slow_path)
+    assert pending(farm, CLAIMED) == [f"{task_id}.json"]  # the live claim survives
+    other.release(other_path)
+    assert pending(farm, CLAIMED) == []
+
+
+def test_run_once_writes_result_and_releases_claim(farm, monkeypatch):
+    task_id = farm.submit("segment", output="outputs/a.mp4")
+    worker = RenderWorker(farm.work_dir, "w1")
+    monkeypatch.setattr(worker, "run_task", lambda task: {"outputs": [task["output"]]})
+
+    assert worker.run_once()
+    assert not worker.run_once()
+    assert farm.wait([task_id]) == {task_id: {"outputs": ["outputs/a.mp4"], "task_id": task_id,
+                                              "worker": "w1", "duration_sec": pytest.approx(0, abs=5)}}
+    assert pending(farm, CLAIMED) == []
+
+
+def test_failed_task_raises(farm, monkeypatch):
+    task_id = farm.submit("segment", output="outputs/a.mp4")
+    worker = RenderWorker(farm.work_dir, "w1")
+
+    def fail(task):
+        raise ValueError("no such image")
+
+    monkeypatch.setattr(worker, "run_task", fail)
+    worker.run_once()
+    with pytest.raises(RuntimeError, match="no such image"):
+        farm.wait([task_id])
+
+
+def test_wait_requeues_task_of_dead_worker(farm, monkeypatch):
+    task_id = farm.submit("segment", output="outputs/a.mp4")
+    RenderWorker(farm.work_dir, "dead").claim()  # never finishes or heartbeats
+    worker = RenderWorker(farm.work_dir, "w2", poll_sec=0.01)
+    monkeypatch.setattr(worker, "run_task", lambda task: {"outputs": [task["output"]]})
+    finished = threading.Event()
+
+    def run():
+        while not finished.is_set():
+            worker.run_once() or time.sleep(0.01)
+
+    runner = threading.Thread(target=run)
+    runner.start()
+    try:
+        assert farm.wait([task_id], timeout=10)[task_id]["worker"] == "w2"
+    finally:
+        finished.set()
+        runner.join()
+    assert pending(farm, DONE) == [f"{task_id}.json"]
+
+
+def test_staged_inputs_are_released(farm, tmp_path):
+    source = tmp_path / "image.png"
+    source.write_bytes(b"png")
+    rel_path = farm.stage_input(str(source))
+    assert farm.stage_input(str(source)) == rel_path
+    assert os.path.exists(farm.path(rel_path))
+
+    other = RenderFarm(farm.work_dir)
+    other_path = other.stage_input(str(source))
+    farm.release_inputs([rel_path])
+    assert not os.path.exists(farm.path(farm.inputs_dir))
+    assert os.path.exists(other.path(other_path))  # another coordinator's inputs are untouched
+    assert source.exists()
+
+
+def render_to_output(farm):
+    def run_task(task):
+        with open(farm.path(task["output"]), "wb") as f:
+            f.write(b"mp4")
+        return {"outputs": [task["output"]]}
+    return run_task
+
+
+def test_failure_withdraws_sibling_tasks(farm, monkeypatch):
+    # "running" is mid-render on a slow worker when the coordinator gives up
+    running = farm.submit("segment", output=f"{OUTPUTS}/running.mp4")
+    slow = RenderWorker(farm.work_dir, "slow")
+    release = threading.Event()
+    render = render_to_output(farm)
+    monkeypatch.setattr(slow, "run_task", lambda task: release.wait(10) and render(task))
+    slow_thread = threading.Thread(target=slow.run_once)
+    slow_thread.start()
+    while pending(farm, CLAIMED) != [f"{running}.json"]:
+        time.sleep(0.01)
+
+    fast = RenderWorker(farm.work_dir, "fast")
+    finished = farm.submit("segment", output=f"{OUTPUTS}/finished.mp4")
+    monkeypatch.setattr(fast, "run_task", render)
+    fast.run_once()
+    failing = farm.submit("segment", output=f"{OUTPUTS}/failing.mp4")
+    monkeypatch.setattr(fast, "run_task", lambda task: 1 / 0)
+    fast.run_once()
+    waiting = farm.submit("segment", output=f"{OUTPUTS}/waiting.mp4")
+
+    try:
+        with pytest.raises(RuntimeError, match="ZeroDivisionError"):
+            farm.wait([running, finished, failing, waiting])
+        assert pending(farm, TASKS) == []
+        assert os.listdir(farm.path(OUTPUTS)) == []
+        assert pending(farm, DONE) == [] and pending(farm, FAILED) == []
+        assert os.listdir(farm.path(WITHDRAWN)) == [running]
+    finally:
+        release.set()
+        slow_thread.join()
+
+    # The slow worker finished after the coordinator gave up and threw its result away
+    assert os.listdir(farm.path(OUTPUTS)) == []
+    assert pending(farm, DONE) == [] and pending(farm, CLAIMED) == []
+    assert os.listdir(farm.path(WITHDRAWN)) == []
+
+
+def test_timeout_withdraws_pending_tasks(farm):
+    task_id = farm.submit("segment", output=f"{OUTPUTS}/a.mp4")
+    with pytest.raises(TimeoutError):
+        farm.wait([task_id], timeout=0)
+    assert pending(farm, TASKS) == []
+    assert not RenderWorker(farm.work_dir, "late").run_once()
@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from output_manager import OutputManager
+from run_journal import JOURNAL_FILE, JournalIndex, RunJournal
+
+
+def events(journal_dir):
+    with open(os.path.join(journal_dir, JOURNAL_FILE), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_record_appends_one_line_per_event(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    first, second = RunJournal(journal_dir), RunJournal(journal_dir)
+    first.record("stage", solution_number=1, name="audio", duration_sec=2.0)
+    second.record("file", solution_number=1, name="video_1.mp4", bytes=100)
+    first.record("stage", solution_number=1, name="assembly", duration_sec=5.0)
+    first.close()
+    second.close()
+
+    recorded = events(journal_dir)
+    assert [e["event"] for e in recorded] == ["stage", "file", "stage"]
+    assert {e["run_id"] for e in recorded} == {first.run_id, second.run_id}
+
+
+def test_index_ingests_incrementally_and_skips_partial_lines(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    journal = RunJournal(journal_dir, run_id="run1")
+    journal.record("stage", solution_number=1, name="audio", duration_sec=2.0, status="ok")
+    index = JournalIndex(journal_dir)
+    assert index.refresh() == 1
+    assert index.refresh() == 0
+
+    with open(journal.path, "ab") as f:
+        f.write(b'{"run_id": "run1", "event": "st')  # writer crashed mid-line
+    assert index.refresh() == 0
+    with open(journal.path, "ab") as f:
+        f.write(b'age", "ts": 1.0, "solution_number": 1, "name": "assembly", "duration_sec": 9.0}\n')
+    assert index.refresh() == 1
+    assert [s["name"] for s in index.slowest_stages()] == ["assembly", "audio"]
+    index.close()
+
+
+def test_index_rebuilds_after_truncation(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    journal = RunJournal(journal_dir)
+    for n in range(3):
+        journal.record("file", solution_number=1, name=f"f{n}", bytes=10)
+    index = JournalIndex(journal_dir)
+    assert index.total_bytes() == 30
+
+    journal.close()
+    open(os.path.join(journal_dir, JOURNAL_FILE), "w").close()
+    RunJournal(journal_dir).record("file", solution_number=1, name="g", bytes=7)
+    assert index.total_bytes() == 7
+
+
+def test_output_manager_writes_runs_to_journal(tmp_path):
+    base_dir = str(tmp_path / "outputs")
+    for run in range(2):
+        output_mgr = OutputManager(base_dir)
+        output_mgr.create_solution_folder(1, "Video")
+        with pytest.raises(ValueError):
+            with output_mgr.stage(1, "audio"):
+                raise ValueError("tts down")
+        with output_mgr.stage(1, "assembly"):
+            pass
+        output_mgr.record_file(1, __file__, "video")
+
+    index = JournalIndex(f"{base_dir}/journal")
+    runs = index.runs_for_solution(1)
+    assert len(runs) == 2
+    assert all(r["failed_stages"] == 1 for r in runs)
+    assert index.total_bytes(solution_number=1) == 2 * os.path.getsize(__file__)
+    assert index.total_bytes(solution_number=2) == 0
+    assert {s["name"] for s in index.slowest_stages(limit=10)} == {"audio", "assembly"}
+    index.close()
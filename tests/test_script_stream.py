@@ -0,0 +1,124 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("requests")
+
+from script_stream import SegmentChunker, iter_sentences, stream_script_audio
+
+SCRIPT = (
+    "[Segment 1 - Mở đầu]\n"
+    "Hình ảnh: bầu trời\n"
+    "Lời thoại (Minh): **Xin chào** các bạn\n"
+    "[Segment 2]\n"
+    "Lời thoại (Lan): (cười) Hôm nay trời đẹp\n"
+    "[Segment 3]\n"
+    "Lời thoại (Minh):\n"
+    "[Segment 4]\n"
+    "Lời thoại: Tạm biệt"
+)
+
+
+def feed_all(chunker, tokens):
+    ready = []
+    for token in tokens:
+        ready.extend(chunker.feed(token))
+    return ready
+
+
+def test_chunker_emits_lines_split_across_tokens():
+    chunker = SegmentChunker()
+    ready = feed_all(chunker, [SCRIPT[i:i + 3] for i in range(0, len(SCRIPT), 3)])
+    # Segment 3 has an empty dialogue line; segment 4's line has no newline until flush()
+    assert ready == [
+        (1, {"speaker": "Minh", "dialogue": "Xin chào các bạn"}),
+        (2, {"speaker": "Lan", "dialogue": "Hôm nay trời đẹp"}),
+    ]
+    assert chunker.flush() == [(4, {"speaker": "", "dialogue": "Tạm biệt"})]
+    assert chunker.flush() == []
+    assert chunker.text == SCRIPT
+
+
+def test_chunker_waits_for_the_whole_header():
+    chunker = SegmentChunker()
+    assert chunker.feed("[Segm") == []
+    assert chunker.feed("ent 1") == []
+    assert chunker.feed("2]\nLời tho") == []
+    assert chunker.feed("ại (A): câu một\n") == [(12, {"speaker": "A", "dialogue": "câu một"})]
+
+
+def test_chunker_does_not_rescan_finished_blocks():
+    chunker = SegmentChunker()
+    feed_all(chunker, [f"[Segment {n}]\nLời thoại: câu {n}\n" for n in range(1, 50)])
+    # Only the last, still open block is scanned on the next feed
+    assert chunker._scan_from == chunker.text.rindex("[Segment 49]")
+
+
+def test_iter_sentences():
+    tokens = ["Câu thứ nhất khá dài. Ng", "ắn. Câu thứ ba cũng dài!", " Phần còn lại"]
+    assert list(iter_sentences(tokens, min_chars=10)) == [
+        "Câu thứ nhất khá dài.", "Ngắn. Câu thứ ba cũng dài!", "Phần còn lại"]
+
+
+class BlockingTextService:
+    """chat_stream that writes three segments, then stalls until its response is aborted"""
+
+    def __init__(self):
+        self.all_sent = threading.Event()
+        self.aborted = threading.Event()
+        self.closed = threading.Event()
+
+    def chat_stream(self, messages, on_response=None, **kwargs):
+        sock = SimpleNamespace(shutdown=lambda how: self.aborted.set())
+        on_response(SimpleNamespace(raw=SimpleNamespace(_connection=SimpleNamespace(sock=sock)),
+                                    close=self.closed.set))
+        for n in (1, 2, 3):
+            yield f"[Segment {n}]\nLời thoại: câu {n}\n"
+        yield "[Segment 4]\n"
+        self.all_sent.set()
+        if not self.aborted.wait(30):
+            raise AssertionError("stream was never aborted")
+        raise ConnectionError("Response ended prematurely")
+
+
+class SlowTTS:
+    def __init__(self):
+        self.calls = []
+        self.slow_started = threading.Event()
+
+    def synthesize(self, text, **kwargs):
+        self.calls.append(text)
+        if text == "câu 2":
+            self.slow_started.set()
+            time.sleep(2)
+        return text.encode("utf-8")
+
+
+def test_stream_script_audio_yields_in_order():
+    class Text:
+        def chat_stream(self, messages, on_response=None, **kwargs):
+            yield from [SCRIPT[i:i + 7] for i in range(0, len(SCRIPT), 7)]
+
+    tts = SlowTTS()
+    tts.synthesize = lambda text, **kwargs: text.encode("utf-8")
+    got = [(n, audio.decode("utf-8")) for n, _, audio in stream_script_audio(Text(), tts, [], tts_workers=3)]
+    assert got == [(1, "Xin chào các bạn"), (2, "Hôm nay trời đẹp"), (4, "Tạm biệt")]
+
+
+def test_stream_script_audio_stops_promptly_on_early_exit():
+    text, tts = BlockingTextService(), SlowTTS()
+    stream = stream_script_audio(text, tts, [], tts_workers=1)
+
+    number, _, audio = next(stream)
+    assert (number, audio) == (1, "câu 1".encode("utf-8"))
+    assert text.all_sent.wait(5) and tts.slow_started.wait(5)
+    started = time.monotonic()
+    stream.close()
+    # Neither the stalled LLM stream nor the running TTS call holds up the consumer
+    assert time.monotonic() - started < 1
+    assert text.aborted.is_set() and text.closed.is_set()
+
+    time.sleep(2.5)
+    assert tts.calls == ["câu 1", "câu 2"]  # the queued call for segment 3 was cancelled
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import solution
+from deadline import Deadline, current_deadline
+from output_manager import OutputManager
+
+SEGMENTS = {
+    1: {"dialogue": "Xin kính chào quý vị thính giả.", "visual": "chuyen_gia"},
+    2: {"dialogue": "Hôm nay chúng ta nói về sức khỏe.", "visual": "nguoi_cao_tuoi"},
+}
+
+
+class FakeImageService:
+    def __init__(self, config):
+        pass
+
+    def generate_reference_set(self, references, limit=None, on_saved=None):
+        for name, (_, path) in references.items():
+            Image.new("RGB", (64, 36), (218, 37, 29)).save(path)
+            if on_saved:
+                on_saved(name, path)
+
+
+class FakeTTSService:
+    default_model = "fake-tts"
+    calls = []
+
+    def __init__(self, config):
+        self.config = config
+
+    def synthesize(self, text, voice_name=None):
+        FakeTTSService.calls.append(text)
+        return b"\x00\x10" * 2400
+
+
+@pytest.fixture
+def stub_run(tmp_path, monkeypatch):
+    """solve() with fake services and renderers, run in an empty working directory"""
+    import services.image_service_enhanced
+    import services.tts_service
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(services.image_service_enhanced, "EnhancedImageService", FakeImageService)
+    monkeypatch.setattr(services.tts_service, "TTSService", FakeTTSService)
+    FakeTTSService.calls = []
+    rendered = {"segments": [], "deadline": []}
+
+    def render_still_segment(i, image_path, audio_path, video_path, profile, limits=None):
+        rendered["segments"].append((i, audio_path))
+        rendered["deadline"].append(current_deadline())
+        with open(video_path, "wb") as f:
+            f.write(b"segment")
+        return video_path
+
+    def compose_final(video_paths, output_path, profile, overlay="gif", gif_path=None, limits=None):
+        rendered["overlay"] = overlay
+        with open(output_path, "wb") as f:
+            f.write(b"final")
+        return output_path
+
+    monkeypatch.setattr(solution, "render_still_segment", render_still_segment)
+    monkeypatch.setattr(solution, "compose_final", compose_final)
+    monkeypatch.setattr(solution, "parse_segments", lambda script: SEGMENTS)
+    (tmp_path / "script.txt").write_text("", encoding="utf-8")
+    return tmp_path, rendered
+
+
+def test_solve_profile_memory(stub_run):
+    tmp_path, rendered = stub_run
+    output_mgr = OutputManager(str(tmp_path / "outputs"))
+
+    final_path = solution.solve(output_mgr, total_duration=16, overlay="none", profile_memory=True)
+
+    assert open(final_path, "rb").read() == b"final"
+    assert [i for i, _ in rendered["segments"]] == [1, 2]
+    assert output_mgr.memory_profiler is None
+    events = [json.loads(line) for line in open(output_mgr.journal.path, encoding="utf-8")]
+    assert [e for e in events if e["event"] == "memory"]
+    metadata = json.load(open(tmp_path / "outputs" / "solution_01_vietnamese_video" / "final" / "metadata.json"))
+    assert "memory" in metadata
+
+
+def test_solve_activates_deadline(stub_run):
+    tmp_path, rendered = stub_run
+    deadline = Deadline(60)
+    try:
+        solution.solve(OutputManager(str(tmp_path / "outputs")), total_duration=16, overlay="none",
+                       deadline=deadline, profile_memory=True)
+    finally:
+        deadline.close()
+
+    assert rendered["deadline"] == [deadline, deadline]
+    assert current_deadline() is None
+
+
+def test_solve_flags(stub_run):
+    tmp_path, rendered = stub_run
+    output_mgr = OutputManager(str(tmp_path / "outputs"))
+
+    draft_path = solution.solve(output_mgr, total_duration=16, draft=True, audio_post="clean")
+
+    assert draft_path.endswith("output_draft.mp4")
+    assert rendered["overlay"] == "stub"  # the draft default
+    assert all(path.endswith(".wav") for _, path in rendered["segments"])
+    assert len(FakeTTSService.calls) == 2
+
+    # reuse_audio defaults to draft: a second draft takes both lines from the TTS cache
+    solution.solve(output_mgr, total_duration=16, draft=True, audio_post="clean")
+    assert len(FakeTTSService.calls) == 2
+    # a final render does not, unless asked to
+    solution.solve(output_mgr, total_duration=16, overlay="none")
+    assert len(FakeTTSService.calls) == 4
+
+    with pytest.raises(ValueError):
+        solution.solve(output_mgr, total_duration=16, overlay="sparkles")
+
+
+def test_solve_reuses_checkpointed_audio(stub_run):
+    tmp_path, rendered = stub_run
+    stored = tmp_path / "previous_attempt.mp3"
+    stored.write_bytes(b"audio")
+    for audio_post in (None, "fit"):
+        checkpoint = {"tts:1": str(stored)}
+        rendered["segments"].clear()
+        FakeTTSService.calls = []
+        solution.solve(OutputManager(str(tmp_path / "outputs")), total_duration=16, overlay="none",
+                       checkpoint=checkpoint, audio_post=audio_post)
+        assert rendered["segments"][0] == (1, str(stored))
+        assert FakeTTSService.calls == [SEGMENTS[2]["dialogue"]]
@@ -0,0 +1,159 @@
+import shutil
+import subprocess
+
+import pytest
+
+import splice
+from compositor import StreamingCompositor
+from ffmpeg_utils import ffmpeg_command, ffprobe_binary, probe_duration, run_ffmpeg
+from render_profile import RenderProfile
+from splice import (MANIFEST_NAME, changed_segments, load_manifest, plan_splice, segment_key, splice_final,
+                    write_manifest)
+
+
+def make_manifest(tmp_path, keys, profile, overlay="gif"):
+    segments = []
+    for i, key in keys.items():
+        video = tmp_path / f"video_{i}.mp4"
+        video.write_bytes(b"segment")
+        segments.append({"index": i, "key": key, "video": str(video), "frames": 192})
+    path = str(tmp_path / "segments.json")
+    write_manifest(path, profile, overlay, segments)
+    return load_manifest(path)
+
+
+def test_segment_key():
+    assert segment_key("Xin chào", "chuyen_gia") == segment_key("Xin chào", "chuyen_gia", None)
+    assert segment_key("Xin chào", "chuyen_gia") != segment_key("Xin chào!", "chuyen_gia")
+    assert segment_key("Xin chào", "chuyen_gia") != segment_key("Xin chào", "nguoi_cao_tuoi")
+    # Post-processing changes the audio, so the segment must be re-rendered
+    assert segment_key("Xin chào", "chuyen_gia") != segment_key("Xin chào", "chuyen_gia", "clean")
+    assert segment_key("Xin chào", "chuyen_gia", "clean") != segment_key("Xin chào", "chuyen_gia", "fit")
+
+
+def test_changed_segments(tmp_path):
+    profile = RenderProfile(fps=30, width=1920, height=1080)
+    keys = {1: segment_key("a", "v"), 2: segment_key("b", "v"), 3: segment_key("c", "v")}
+    manifest = make_manifest(tmp_path, keys, profile)
+
+    assert changed_segments(manifest, keys, profile, "gif") == []
+    assert changed_segments(manifest, {**keys, 2: segment_key("b2", "v")}, profile, "gif") == [2]
+
+
+def test_changed_segments_not_spliceable(tmp_path):
+    profile = RenderProfile(fps=30, width=1920, height=1080)
+    keys = {1: segment_key("a", "v"), 2: segment_key("b", "v")}
+    manifest = make_manifest(tmp_path, keys, profile)
+
+    assert changed_segments(None, keys, profile, "gif") is None
+    assert changed_segments(manifest, keys, profile, "none") is None
+    assert changed_segments(manifest, keys, profile.as_draft(), "gif") is None
+    assert changed_segments(manifest, {**keys, 3: segment_key("c", "v")}, profile, "gif") is None
+    # An unchanged segment whose file is gone cannot be reused
+    (tmp_path / "video_1.mp4").unlink()
+    assert changed_segments(manifest, {**keys, 2: segment_key("b2", "v")}, profile, "gif") is None
+
+
+def four_segments():
+    return [{"index": i, "key": str(i), "video": f"old_{i}.mp4", "frames": 100} for i in (1, 2, 3, 4)]
+
+
+KEYFRAMES = list(range(0, 400, 48))  # 0, 48, ..., 384
+
+
+def test_plan_splice_widens_to_neighbouring_keyframes():
+    plan = plan_splice(four_segments(), {2: "new_2.mp4"}, KEYFRAMES, keep_tail=True)
+    # Segment 2 covers frames 100-200; the nearest keyframes around it are 96 and 240
+    assert (plan.start_frame, plan.end_frame, plan.keep_tail) == (96, 240, True)
+    assert plan.pieces == [("old_1.mp4", 96, 4), "new_2.mp4", ("old_3.mp4", 0, 40)]
+
+
+def test_plan_splice_without_tail_runs_to_the_end():
+    plan = plan_splice(four_segments(), {2: "new_2.mp4"}, KEYFRAMES, keep_tail=False)
+    assert (plan.start_frame, plan.end_frame, plan.keep_tail) == (96, 400, False)
+    assert plan.pieces == [("old_1.mp4", 96, 4), "new_2.mp4", ("old_3.mp4", 0, 100), ("old_4.mp4", 0, 100)]
+
+
+def test_plan_splice_first_and_last_segment():
+    plan = plan_splice(four_segments(), {1: "new_1.mp4"}, KEYFRAMES, keep_tail=True)
+    assert (plan.start_frame, plan.end_frame, plan.keep_tail) == (0, 144, True)
+    assert plan.pieces == ["new_1.mp4", ("old_2.mp4", 0, 44)]
+
+    # Nothing after the last segment to keep
+    plan = plan_splice(four_segments(), {4: "new_4.mp4"}, KEYFRAMES, keep_tail=True)
+    assert (plan.start_frame, plan.end_frame, plan.keep_tail) == (288, 400, False)
+    assert plan.pieces == [("old_3.mp4", 88, 12), "new_4.mp4"]
+
+
+def test_plan_splice_spans_unchanged_segments_between_changes():
+    plan = plan_splice(four_segments(), {1: "new_1.mp4", 3: "new_3.mp4"}, KEYFRAMES, keep_tail=True)
+    assert (plan.start_frame, plan.end_frame) == (0, 336)
+    assert plan.pieces == ["new_1.mp4", "old_2.mp4", "new_3.mp4", ("old_4.mp4", 0, 36)]
+
+    # A final without keyframe information is re-rendered from the start
+    plan = plan_splice(four_segments(), {3: "new_3.mp4"}, [], keep_tail=False)
+    assert plan.start_frame == 0 and plan.pieces[0] == ("old_1.mp4", 0, 100)
+
+
+needs_ffmpeg = pytest.mark.skipif(not shutil.which(ffprobe_binary()), reason="ffprobe not available")
+
+PROFILE = RenderProfile(width=64, height=48, fps=10, preset="ultrafast", keyint=10)
+
+
+def color_segment(path, color, seconds=2):
+    run_ffmpeg(["-f", "lavfi", "-i", f"color=c={color}:size=64x48:rate=10:duration={seconds}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                "-shortest", *PROFILE.video_args(), *PROFILE.audio_args(), str(path)])
+    return str(path)
+
+
+def decoded_colors(path):
+    """Centre pixel of every decoded frame; fails if the stream does not decode cleanly"""
+    result = subprocess.run(ffmpeg_command(["-xerror", "-i", str(path), "-vf", "crop=2:2", "-f", "rawvideo",
+                                            "-pix_fmt", "rgb24", "-"]), capture_output=True)
+    assert result.returncode == 0, result.stderr.decode(errors="replace")
+    frames = result.stdout
+    return [tuple(frames[i:i + 3]) for i in range(0, len(frames), 12)]
+
+
+def make_final(tmp_path, colors):
+    videos = [color_segment(tmp_path / f"seg_{i}.mp4", color) for i, color in enumerate(colors, 1)]
+    compositor = StreamingCompositor(PROFILE)
+    final = str(tmp_path / "output_final.mp4")
+    compositor.compose(videos, final)
+    segments = [{"index": i, "key": str(i), "video": path, "frames": frames}
+                for i, (path, frames) in enumerate(compositor.segment_frames, 1)]
+    manifest_path = str(tmp_path / MANIFEST_NAME)
+    write_manifest(manifest_path, PROFILE, "none", segments)
+    return final, manifest_path
+
+
+def is_color(pixel, rgb):
+    return all(abs(a - b) < 40 for a, b in zip(pixel, rgb))
+
+
+@needs_ffmpeg
+def test_splice_final_replaces_one_segment(tmp_path):
+    final, manifest_path = make_final(tmp_path, ["red", "green", "blue"])
+    new_video = color_segment(tmp_path / "seg_2_new.mp4", "yellow")
+
+    report = splice_final(final, load_manifest(manifest_path), {2: new_video}, final, manifest_path=manifest_path)
+    assert report["kept_tail"] and not report["full_reencode"]
+    assert report["rerendered_frames"] < report["total_frames"] == 60
+    colors = decoded_colors(final)
+    assert len(colors) == 60
+    assert is_color(colors[5], (255, 0, 0)) and is_color(colors[30], (255, 255, 0)) and is_color(colors[55], (0, 0, 255))
+    assert load_manifest(manifest_path)["segments"][1]["video"] == new_video
+    assert probe_duration(final) == pytest.approx(6.0, abs=0.1)
+
+
+@needs_ffmpeg
+def test_splice_final_reencodes_everything_when_parameters_differ(tmp_path, monkeypatch):
+    final, manifest_path = make_final(tmp_path, ["red", "green", "blue"])
+    new_video = color_segment(tmp_path / "seg_2_new.mp4", "yellow")
+    monkeypatch.setattr(splice, "video_stream_info", lambda path: {"extradata_hash": path})  # never equal
+
+    report = splice_final(final, load_manifest(manifest_path), {2: new_video}, final)
+    assert report["full_reencode"] and report["rerendered_frames"] == 60
+    colors = decoded_colors(final)
+    assert len(colors) == 60 and is_color(colors[30], (255, 255, 0))
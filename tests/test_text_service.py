@@ -0,0 +1,129 @@
+import io
+import threading
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from services.base import ServiceConfig
+from services.text_service import ResponseCache, TextService
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self._content = content
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"choices": [{"message": {"content": self._content}}]}
+
+
+def make_service(cache=None):
+    """TextService whose HTTP transport echoes the last user message and records what was sent"""
+    service = TextService(ServiceConfig(api_key="test-key"), cache=cache)
+    service.sent = []
+    lock = threading.Lock()
+
+    def request(method, url, endpoint, **kwargs):
+        content = kwargs["json"]["messages"][-1]["content"]
+        with lock:
+            service.sent.append(content)
+        return FakeResponse(f"re: {content}")
+
+    service.request = request
+    return service
+
+
+def ask(text):
+    return [{"role": "user", "content": text}]
+
+
+@pytest.mark.parametrize("cache", [None, ResponseCache()])
+def test_chat_batch_dedups_identical_requests(cache):
+    service = make_service(cache)
+    answers = service.chat_batch([ask("a"), ask("b"), ask("a"), ask("a")])
+    assert answers == ["re: a", "re: b", "re: a", "re: a"]
+    assert sorted(service.sent) == ["a", "b"]
+
+
+def test_chat_batch_keeps_sampled_requests():
+    service = make_service()
+    service.chat_batch([ask("a"), ask("a")], temperature=0.7)
+    assert service.sent == ["a", "a"]
+
+
+def test_chat_reuses_cached_deterministic_answers():
+    cache = ResponseCache()
+    service = make_service(cache)
+    assert service.chat(ask("a")) == "re: a"
+    assert service.chat(ask("a"), temperature=0) == "re: a"  # temperature 0 is its own body, sent once more
+    assert service.chat(ask("a")) == "re: a"
+    assert service.sent == ["a", "a"]
+    assert cache.hits == 1
+
+    service.chat(ask("a"), temperature=0.7)
+    service.chat(ask("a"), temperature=0.7)
+    assert service.sent == ["a", "a", "a", "a"]  # sampled answers are never cached
+    assert len(cache) == 2
+
+    # chat_batch goes through the same cache
+    assert service.chat_batch([ask("a"), ask("b")]) == ["re: a", "re: b"]
+    assert service.sent[4:] == ["b"]
+
+
+def test_response_cache_lru_and_ttl():
+    cache = ResponseCache(max_entries=2, ttl_sec=None)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")  # evicts b, the least recently used
+    assert cache.get("b") is None and cache.get("c") == "3"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    expired = ResponseCache(ttl_sec=0)
+    expired.put("a", "1")
+    assert expired.get("a") is None
+    assert ResponseCache.key({"b": 1, "a": 2}) == ResponseCache.key({"a": 2, "b": 1})
+
+
+class TrickleBytes(io.BytesIO):
+    """Response body that arrives one byte per read, splitting UTF-8 characters across reads"""
+
+    def read(self, size=-1):
+        return super().read(1)
+
+
+def sse_response(lines):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = "text/event-stream"
+    resp.raw = TrickleBytes("".join(line + "\n" for line in lines).encode("utf-8"))
+    return resp
+
+
+def test_chat_stream_parses_server_sent_events():
+    service = TextService(ServiceConfig(api_key="test-key"))
+    sent = []
+    opened = []
+
+    def request(method, url, endpoint, **kwargs):
+        sent.append(kwargs["json"])
+        return sse_response([
+            ": keep-alive",
+            "",
+            'data: {"choices": []}',
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            'data: {"choices": [{"delta": {"content": "Xin chào, "}}]}',
+            "",
+            'data: {"choices": [{"delta": {"content": "thế giới “ổn” ✓"}}]}',
+            "data: [DONE]",
+            'data: {"choices": [{"delta": {"content": "after done"}}]}',
+        ])
+
+    service.request = request
+    tokens = list(service.chat_stream(ask("hi"), on_response=opened.append))
+    assert tokens == ["Xin chào, ", "thế giới “ổn” ✓"]
+    assert sent[0]["stream"] is True
+    assert len(opened) == 1
@@ -0,0 +1,178 @@
+"""
+Encoder Autotuner - Picks the fastest encoder settings that meet a quality floor
+
+Builds a representative sample (a reference portrait looped for a few seconds, with
+the GIF overlay for the final pass), encodes it losslessly as the quality reference,
+then encodes it under every candidate preset/CRF. Each candidate is measured for wall
+time, output size, SSIM and PSNR against the reference. The fastest candidate that meets
+the floors is saved to render_profile.json, where solve() picks it up automatically.
+
+Usage:
+    python tune_encoder.py --image outputs/solution_01_vietnamese_video/reference/character_chuyen_gia.png
+    python tune_encoder.py --image portrait.png --role final --min-ssim 0.985 --dry-run
+"""
+
+import os
+import re
+import glob
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, Any, List, Optional
+
+from ffmpeg_utils import ffmpeg_binary, run_ffmpeg
+from render_profile import RenderProfile, save_profile
+
+ROLE_FPS = {"segment": 24, "final": 30}
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+CRFS = [18, 21, 23, 26, 28]
+GIF_OVERLAY_PATH = "image_ref/diaThan.gif"
+
+SSIM_RE = re.compile(r"SSIM .*All:([\d.]+)")
+PSNR_RE = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+
+def build_reference(image_path: str, role: str, seconds: float, work_dir: str,
+                    width: int, height: int, gif_path: Optional[str]) -> str:
+    """Lossless encode of the sample that candidates are compared against"""
+    fps = ROLE_FPS[role]
+    reference = os.path.join(work_dir, "reference.mkv")
+    scale = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+             f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p")
+    args = ["-loop", "1", "-framerate", str(fps), "-i", image_path]
+    if role == "final" and gif_path and os.path.exists(gif_path):
+        overlay_height = int(height * 0.15)
+        args += ["-ignore_loop", "0", "-i", gif_path,
+                 "-filter_complex", f"[0]{scale}[bg];[1]scale=-2:{overlay_height}[ov];"
+                                    f"[bg][ov]overlay=0:0:shortest=0,format=yuv420p"]
+    else:
+        args += ["-vf", scale]
+    args += ["-t", str(seconds), "-r", str(fps), "-c:v", "libx264", "-qp", "0", "-preset", "ultrafast", reference]
+    run_ffmpeg(args)
+    return reference
+
+
+def measure_quality(candidate: str, reference: str) -> Dict[str, float]:
+    """SSIM (All) and PSNR (average) of candidate against reference"""
+    command = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", candidate, "-i", reference,
+               "-lavfi", "[0:v][1:v]ssim;[0:v][1:v]psnr", "-f", "null", "-"]
+    result = subprocess.run(command, capture_output=True, text=True)
+    ssim = SSIM_RE.search(result.stderr)
+    psnr = PSNR_RE.search(result.stderr)
+    if result.returncode != 0 or not ssim or not psnr:
+        raise RuntimeError(f"Quality measurement failed: {result.stderr[-500:]}")
+    return {"ssim": float(ssim.group(1)), "psnr": float(psnr.group(1))}
+
+
+def evaluate(profile: RenderProfile, reference: str, work_dir: str) -> Dict[str, Any]:
+    """Encode the reference under profile and measure speed, size and quality"""
+    output = os.path.join(work_dir, f"candidate_{profile.preset}_{profile.crf}.mp4")
+    cpu_before = os.times()
+    started = time.perf_counter()
+    run_ffmpeg(["-i", reference, "-an", *profile.video_args(), output])
+    wall = time.perf_counter() - started
+    cpu_after = os.times()
+    result = {
+        "preset": profile.preset,
+        "crf": profile.crf,
+        "wall_sec": wall,
+        "cpu_sec": (cpu_after.children_user - cpu_before.children_user)
+                   + (cpu_after.children_system - cpu_before.children_system),
+        "size_bytes": os.path.getsize(output),
+    }
+    result.update(measure_quality(output, reference))
+    os.remove(output)
+    return result
+
+
+def choose(results: List[Dict[str, Any]], min_ssim: float, min_psnr: Optional[float]) -> Optional[Dict[str, Any]]:
+    """Fastest result meeting the floors; smaller output breaks near-ties (within 5%)"""
+    passing = [r for r in results if r["ssim"] >= min_ssim and (min_psnr is None or r["psnr"] >= min_psnr)]
+    if not passing:
+        return None
+    fastest = min(r["wall_sec"] for r in passing)
+    near = [r for r in passing if r["wall_sec"] <= fastest * 1.05]
+    return min(near, key=lambda r: (r["size_bytes"], r["wall_sec"]))
+
+
+def tune(image_path: str, role: str, seconds: float = 8.0, presets: Optional[List[str]] = None,
+         crfs: Optional[List[int]] = None, min_ssim: float = 0.98, min_psnr: Optional[float] = None,
+         width: int = 1920, height: int = 1080, gif_path: Optional[str] = GIF_OVERLAY_PATH,
+         threads: Optional[int] = None) -> Dict[str, Any]:
+    """Run the sweep for one role and return all measurements plus the chosen profile"""
+    work_dir = tempfile.mkdtemp(prefix=f"tune_{role}_")
+    try:
+        reference = build_reference(image_path, role, seconds, work_dir, width, height, gif_path)
+        results = []
+        for preset in presets or PRESETS:
+            for crf in crfs or CRFS:
+                profile = RenderProfile(width=width, height=height, fps=ROLE_FPS[role],
+                                        preset=preset, crf=crf, threads=threads)
+                result = evaluate(profile, reference, work_dir)
+                results.append(result)
+                print(f"{role:<8} {preset:<10} crf={crf:<3} {result['wall_sec']:6.2f}s "
+                      f"{result['size_bytes'] / 1024:8.0f} KB  SSIM {result['ssim']:.4f}  PSNR {result['psnr']:.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    best = choose(results, min_ssim, min_psnr)
+    chosen = None
+    if best:
+        chosen = RenderProfile(width=width, height=height, fps=ROLE_FPS[role],
+                               preset=best["preset"], crf=best["crf"], threads=threads)
+    return {"role": role, "results": results, "best": best, "profile": chosen}
+
+
+def default_sample_image() -> Optional[str]:
+    """A generated character portrait from a previous run, if one exists"""
+    candidates = sorted(glob.glob("outputs/solution_*/reference/character_*.png"))
+    return candidates[0] if candidates else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick the fastest encoder settings meeting a quality floor")
+    parser.add_argument("--image", help="Representative still image (default: a generated character reference)")
+    parser.add_argument("--role", choices=["segment", "final", "both"], default="both")
+    parser.add_argument("--seconds", type=float, default=8.0, help="Sample duration")
+    parser.add_argument("--presets", nargs="+", default=PRESETS)
+    parser.add_argument("--crfs", nargs="+", type=int, default=CRFS)
+    parser.add_argument("--min-ssim", type=float, default=0.98)
+    parser.add_argument("--min-psnr", type=float)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--gif", default=GIF_OVERLAY_PATH)
+    parser.add_argument("--profile-path", help="Where to save the chosen profiles (default: render_profile.json)")
+    parser.add_argument("--report", help="Write all measurements to this JSON file")
+    parser.add_argument("--dry-run", action="store_true", help="Measure only; do not save a profile")
+    args = parser.parse_args()
+
+    image = args.image or default_sample_image()
+    if not image or not os.path.exists(image):
+        raise FileNotFoundError("No sample image found; pass --image")
+
+    roles = ["segment", "final"] if args.role == "both" else [args.role]
+    report = {}
+    for role in roles:
+        outcome = tune(image, role, args.seconds, args.presets, args.crfs, args.min_ssim, args.min_psnr,
+                       gif_path=args.gif, threads=args.threads)
+        report[role] = {"results": outcome["results"], "best": outcome["best"]}
+        if outcome["profile"] is None:
+            print(f"No {role} candidate met SSIM >= {args.min_ssim}; keeping the current profile")
+            continue
+        best = outcome["best"]
+        print(f"Chose {role}: preset={best['preset']} crf={best['crf']} "
+              f"({best['wall_sec']:.2f}s, SSIM {best['ssim']:.4f})")
+        if not args.dry_run:
+            path = save_profile(role, outcome["profile"], args.profile_path,
+                                sample=image, min_ssim=args.min_ssim, measured=best)
+            print(f"Saved {role} profile to {path}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()